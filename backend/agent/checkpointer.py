@@ -0,0 +1,313 @@
+"""
+Redis-backed LangGraph checkpointer with an optional MongoDB mirror.
+
+Checkpoints are stored as deltas: the checkpoint record itself carries no channel
+values, and each step only writes the channels it changed (``new_versions``) as
+versioned blobs. Restoring a checkpoint reads the blob of every channel at the version
+the checkpoint points to. Pending writes of finished tasks are kept per checkpoint, so
+a run interrupted mid-step resumes on any worker without re-running completed nodes.
+
+Redis layout (``{p}`` = ``lg:{thread_id}:{checkpoint_ns}``), every key with a TTL:
+- ``{p}:checkpoints``            sorted set of checkpoint ids (lexicographic = time order)
+- ``{p}:cp:{checkpoint_id}``     hash: checkpoint, metadata, parent_id
+- ``{p}:blob:{channel}:{ver}``   one channel value
+- ``{p}:writes:{checkpoint_id}`` hash of pending writes keyed by ``task_id:idx``
+
+With ``GRAPH_CHECKPOINT_MONGO`` every record is also upserted into the
+``graph_checkpoints`` collection and read from there when Redis no longer has it.
+"""
+
+from typing import Dict, Any, List, Optional, AsyncIterator, Sequence, Tuple
+from datetime import datetime
+import base64
+import json
+import logging
+import random
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_serializable_checkpoint_metadata,
+)
+from pymongo import IndexModel, ASCENDING, UpdateOne
+
+from ..config import settings
+from ..db import get_db, get_redis
+
+logger = logging.getLogger(__name__)
+
+_EMPTY = json.dumps({"t": "empty"})
+
+
+class RedisCheckpointSaver(BaseCheckpointSaver[str]):
+    """Async-only checkpointer (the graph is always run with ``ainvoke``)"""
+
+    def __init__(self, ttl_seconds: Optional[int] = None, mirror_to_mongo: Optional[bool] = None, serde=None):
+        super().__init__(serde=serde)
+        self.ttl = ttl_seconds or settings.GRAPH_CHECKPOINT_TTL_SECONDS
+        self.mirror = settings.GRAPH_CHECKPOINT_MONGO if mirror_to_mongo is None else mirror_to_mongo
+        self.collection = get_db().graph_checkpoints if self.mirror else None
+
+    async def ensure_indexes(self):
+        """Create necessary indexes for the Mongo mirror (idempotent)"""
+        if self.collection is None:
+            return
+        await self.collection.create_indexes([
+            IndexModel([("thread_id", ASCENDING), ("checkpoint_ns", ASCENDING), ("kind", ASCENDING),
+                        ("checkpoint_id", ASCENDING)], name="thread_kind_idx"),
+            IndexModel([("created_at", ASCENDING)], name="created_ttl",
+                       expireAfterSeconds=settings.GRAPH_CHECKPOINT_MONGO_TTL_SECONDS),
+        ])
+
+    @staticmethod
+    def _prefix(thread_id: str, checkpoint_ns: str) -> str:
+        return f"lg:{thread_id}:{checkpoint_ns}"
+
+    def _encode(self, value: Any) -> str:
+        type_, data = self.serde.dumps_typed(value)
+        return json.dumps({"t": type_, "b": base64.b64encode(data).decode("ascii")})
+
+    def _decode(self, raw: str) -> Any:
+        record = json.loads(raw)
+        return self.serde.loads_typed((record["t"], base64.b64decode(record["b"])))
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Store the checkpoint record and only the channels changed in this step"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        prefix = self._prefix(thread_id, checkpoint_ns)
+
+        record = checkpoint.copy()
+        values: Dict[str, Any] = record.pop("channel_values")  # type: ignore[misc]
+        fields = {
+            "checkpoint": self._encode(record),
+            "metadata": self._encode(get_serializable_checkpoint_metadata(config, metadata)),
+            "parent_id": config["configurable"].get("checkpoint_id") or "",
+        }
+        blobs = {
+            (channel, version): self._encode(values[channel]) if channel in values else _EMPTY
+            for channel, version in new_versions.items()
+        }
+
+        redis = await get_redis()
+        async with redis.pipeline(transaction=True) as pipe:
+            cp_key = f"{prefix}:cp:{checkpoint['id']}"
+            pipe.hset(cp_key, mapping=fields)
+            pipe.expire(cp_key, self.ttl)
+            for (channel, version), value in blobs.items():
+                pipe.set(f"{prefix}:blob:{channel}:{version}", value, ex=self.ttl)
+            pipe.zadd(f"{prefix}:checkpoints", {checkpoint["id"]: 0})
+            pipe.expire(f"{prefix}:checkpoints", self.ttl)
+            await pipe.execute()
+
+        if self.collection is not None:
+            now = datetime.utcnow()
+            base = {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "created_at": now}
+            ops = [UpdateOne(
+                {"_id": f"{prefix}:cp:{checkpoint['id']}"},
+                {"$set": {**base, "kind": "checkpoint", "checkpoint_id": checkpoint["id"], **fields}},
+                upsert=True,
+            )]
+            ops += [UpdateOne(
+                {"_id": f"{prefix}:blob:{channel}:{version}"},
+                {"$set": {**base, "kind": "blob", "value": value}},
+                upsert=True,
+            ) for (channel, version), value in blobs.items()]
+            await self._mirror(ops)
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Record a task's writes against the checkpoint it ran from"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        key = f"{self._prefix(thread_id, checkpoint_ns)}:writes:{checkpoint_id}"
+
+        redis = await get_redis()
+        entries = []
+        async with redis.pipeline(transaction=True) as pipe:
+            for index, (channel, value) in enumerate(writes):
+                idx = WRITES_IDX_MAP.get(channel, index)
+                entry = json.dumps({
+                    "task_id": task_id, "idx": idx, "channel": channel,
+                    "value": self._encode(value), "task_path": task_path,
+                })
+                # Regular writes are immutable once recorded; special ones (errors, interrupts) are replaced
+                if idx >= 0:
+                    pipe.hsetnx(key, f"{task_id}:{idx}", entry)
+                else:
+                    pipe.hset(key, f"{task_id}:{idx}", entry)
+                entries.append((f"{task_id}:{idx}", entry))
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+        if self.collection is not None:
+            now = datetime.utcnow()
+            await self._mirror([UpdateOne(
+                {"_id": f"{key}:{field}"},
+                {"$set": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "kind": "write",
+                          "checkpoint_id": checkpoint_id, "entry": entry, "created_at": now}},
+                upsert=True,
+            ) for field, entry in entries])
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        if not checkpoint_id:
+            ids = await self._checkpoint_ids(thread_id, checkpoint_ns, limit=1)
+            if not ids:
+                return None
+            checkpoint_id = ids[0]
+        return await self._load_tuple(thread_id, checkpoint_ns, checkpoint_id)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        """Checkpoints of one thread, newest first (listing across threads isn't supported)"""
+        if not config:
+            return
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        wanted_id = get_checkpoint_id(config)
+        before_id = get_checkpoint_id(before) if before else None
+
+        for checkpoint_id in await self._checkpoint_ids(thread_id, checkpoint_ns, before=before_id):
+            if wanted_id and checkpoint_id != wanted_id:
+                continue
+            if limit is not None and limit <= 0:
+                break
+            found = await self._load_tuple(thread_id, checkpoint_ns, checkpoint_id)
+            if found is None:
+                continue
+            if filter and not all(found.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield found
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        redis = await get_redis()
+        keys = [key async for key in redis.scan_iter(match=f"lg:{thread_id}:*", count=500)]
+        if keys:
+            await redis.delete(*keys)
+        if self.collection is not None:
+            await self.collection.delete_many({"thread_id": thread_id})
+
+    def get_next_version(self, current: Optional[str], channel: None = None) -> str:
+        # Same scheme as the in-memory saver: zero-padded counter, so versions sort as strings
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    async def _checkpoint_ids(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        before: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[str]:
+        """Checkpoint ids newest first"""
+        redis = await get_redis()
+        ids = await redis.zrevrangebylex(
+            f"{self._prefix(thread_id, checkpoint_ns)}:checkpoints",
+            f"({before}" if before else "+",
+            "-",
+            start=0 if limit else None,
+            num=limit,
+        )
+        if ids or self.collection is None:
+            return ids
+        query: Dict[str, Any] = {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "kind": "checkpoint"}
+        if before:
+            query["checkpoint_id"] = {"$lt": before}
+        cursor = self.collection.find(query, {"checkpoint_id": 1}).sort("checkpoint_id", -1)
+        if limit:
+            cursor = cursor.limit(limit)
+        return [doc["checkpoint_id"] async for doc in cursor]
+
+    async def _load_tuple(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> Optional[CheckpointTuple]:
+        prefix = self._prefix(thread_id, checkpoint_ns)
+        redis = await get_redis()
+        fields = await redis.hgetall(f"{prefix}:cp:{checkpoint_id}")
+        if not fields and self.collection is not None:
+            fields = await self.collection.find_one({"_id": f"{prefix}:cp:{checkpoint_id}"}) or {}
+        if not fields:
+            return None
+
+        checkpoint: Checkpoint = self._decode(fields["checkpoint"])
+        versions = checkpoint["channel_versions"]
+        blob_keys = [f"{prefix}:blob:{channel}:{version}" for channel, version in versions.items()]
+        raw_blobs = dict(zip(blob_keys, await redis.mget(blob_keys) if blob_keys else []))
+        missing = [key for key, value in raw_blobs.items() if value is None]
+        if missing and self.collection is not None:
+            async for doc in self.collection.find({"_id": {"$in": missing}}):
+                raw_blobs[doc["_id"]] = doc["value"]
+        channel_values = {}
+        for (channel, _), key in zip(versions.items(), blob_keys):
+            raw = raw_blobs.get(key)
+            if raw is not None and raw != _EMPTY:
+                channel_values[channel] = self._decode(raw)
+
+        entries = list((await redis.hgetall(f"{prefix}:writes:{checkpoint_id}")).values())
+        if not entries and self.collection is not None:
+            entries = [doc["entry"] async for doc in self.collection.find(
+                {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "kind": "write", "checkpoint_id": checkpoint_id}
+            )]
+        writes = sorted((json.loads(entry) for entry in entries), key=lambda w: (w["task_path"], w["task_id"], w["idx"]))
+
+        parent_id = fields.get("parent_id")
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint={**checkpoint, "channel_values": channel_values},
+            metadata=self._decode(fields["metadata"]),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+            pending_writes=[(w["task_id"], w["channel"], self._decode(w["value"])) for w in writes],
+        )
+
+    async def _mirror(self, ops: List[UpdateOne]) -> None:
+        # Redis is the source of truth while the keys live; a failed mirror write only loses durability
+        try:
+            await self.collection.bulk_write(ops, ordered=False)
+        except Exception as e:
+            logger.warning(f"Failed to mirror graph checkpoint to MongoDB: {e}")
+
+
+__all__ = ['RedisCheckpointSaver']
@@ -3,16 +3,20 @@ LangGraph workflow for AI-powered Travel Planning Agent.
 Implements conversation flow with checkpoints and context persistence.
 """
 
-from typing import Dict, Any, List, Optional, TypedDict, Annotated
+from typing import Dict, Any, List, Optional, TypedDict, Annotated, Awaitable, AsyncIterator, Tuple, Callable
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
 from langchain_core.tools import Tool
 from langchain.agents import create_tool_calling_agent, AgentExecutor
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableConfig
 import json
 import asyncio
-from datetime import datetime, date
+import re
+import time
+import uuid
+from datetime import datetime, date, timedelta
 import logging
 
 # Set up logger first
@@ -36,11 +40,62 @@ from ..services.api_tools import (
 )
 from ..services.blacklist_service import BlacklistService
 from ..services.context_service import ContextService
-from ..models import TravelAssistantResponse, UIActions, TripPlan
+from ..services.trip_extractor import trip_detail_extractor
+from ..services.day_planner import ParallelDayPlanner, PlanState
+from ..services.llm_json import extract_json, coerce_day
+from ..services.circuit_breaker import gemini_breaker, CircuitOpenError
+from ..services.route_matrix import route_matrix
+from ..models import TravelAssistantResponse, UIActions, TripPlan, CityVisit, DayPlan, Hotel
+from ..repositories import repository_registry
+from .checkpointer import RedisCheckpointSaver
+from ..repositories.itinerary_store_repository import itinerary_store, itinerary_key, rebase_plan_dates
 from ..config import settings
 
 logger = logging.getLogger(__name__)
 
+# Used when trip details can't be extracted from the message
+DEFAULT_TRIP_DETAILS: Dict[str, Any] = {
+    "origin": None,
+    "destination": "Tokyo",
+    "budget_type": "moderate",
+    "duration_days": 3,
+    "travelers": 1,
+    "interests": ["cultural", "food"],
+    "transport_preference": "train",
+    "accommodation_type": "mid-range"
+}
+
+# Requests that want a new plan rather than the stored one for the same inputs
+SURPRISE_ME_PATTERN = re.compile(
+    r"\b(surprise me|something (different|new|unusual)|off the beaten (path|track)|fresh ideas?)\b",
+    re.IGNORECASE,
+)
+
+# Appended to the reply whenever a trip plan is attached
+ITINERARY_READY_BANNER = "\n\n🎉 **Perfect!** I've created a smart itinerary based on your request! The interactive planner shows:\n\n✨ **Optimized routes** based on your preferences\n💰 **Budget breakdown** with real-time updates\n🌤️ **Weather-aware recommendations**\n🏨 **Best value accommodations**\n📱 **Drag & drop to customize** - prices update automatically!\n\nStart planning your adventure! 🚀"
+
+# Graph nodes that run concurrently between destination selection and budget estimation
+PARALLEL_BRANCHES = ("weather_check", "hotel_search", "route_planning")
+
+# transport_preference -> RouteSearchTool mode
+ROUTE_MODES = {"flight": "flying", "train": "train", "bus": "bus", "car": "driving"}
+
+# Per-node wall-clock totals across graph runs, exposed on /api/metrics
+graph_node_stats: Dict[str, Dict[str, float]] = {}
+
+
+def record_node_timing(name: str, seconds: float) -> None:
+    stats = graph_node_stats.setdefault(name, {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+    stats["calls"] += 1
+    stats["total_seconds"] = round(stats["total_seconds"] + seconds, 4)
+    stats["max_seconds"] = round(max(stats["max_seconds"], seconds), 4)
+
+
+def merge_timings(left: Dict[str, float], right: Dict[str, float]) -> Dict[str, float]:
+    """Reducer so parallel branches can all report their timings in one step"""
+    return {**(left or {}), **(right or {})}
+
+
 class AgentState(TypedDict):
     """State for the travel planning agent workflow"""
     messages: Annotated[List[BaseMessage], "The conversation messages"]
@@ -56,6 +111,11 @@ class AgentState(TypedDict):
     trip_plan: Optional[TripPlan]
     blacklist_items: List[str]
     context: Dict[str, Any]
+    # Graph engine
+    previous_state: Dict[str, Any]
+    trip_details: Dict[str, Any]
+    itinerary_state: Dict[str, Any]
+    node_timings: Annotated[Dict[str, float], merge_timings]
 
 class TravelPlanningWorkflow:
     """Main workflow class for travel planning agent"""
@@ -63,24 +123,54 @@ class TravelPlanningWorkflow:
     def __init__(self):
         # Initialize Gemini service directly
         try:
-            from ..services.gemini_service import GeminiChat
+            from ..services.gemini_service import GeminiChat, GeminiChatPool
+            # Stateless client for one-shot prompts (extraction, itinerary)
             self.gemini_chat = GeminiChat()
+            # Per-conversation chats for the conversational reply
+            self.chat_pool = GeminiChatPool(history_loader=self._load_session_history)
             logger.info("Gemini chat service initialized successfully")
             self.llm_available = True
         except Exception as e:
             logger.warning(f"Failed to initialize Gemini service: {e}")
             self.gemini_chat = None
+            self.chat_pool = None
             self.llm_available = False
         
         # Initialize basic services for simplified backend
         self.blacklist_service = BlacklistService()
         self.context_service = ContextService()
         
-        # We don't need the complex LangChain workflow for the simplified version
+        # Tools used by the graph engine's nodes
+        self.search_tool = GoogleSearchTool()
+        self.weather_tool = WeatherTool()
+        self.hotel_tool = HotelSearchTool()
+        self.route_tool = RouteSearchTool()
+        self.budget_tool = BudgetEstimatorTool()
+        
+        # The graph is compiled on first use (AGENT_ENGINE=graph)
         self.agent = None
         self.workflow = None
-        self.memory = None
+        self.memory = self._create_checkpointer()
         self.app = None
+        self.ephemeral_app = None  # Same graph without a checkpointer, for runs that can't resume
+
+    @staticmethod
+    def _create_checkpointer():
+        """Checkpointer for graph runs; Redis lets any worker resume an interrupted run"""
+        if settings.GRAPH_CHECKPOINTER == "redis":
+            return RedisCheckpointSaver()
+        if settings.GRAPH_CHECKPOINTER == "memory":
+            return MemorySaver()
+        return None
+    
+    async def ensure_indexes(self):
+        """Create indexes for the graph checkpoint mirror, if enabled"""
+        if isinstance(self.memory, RedisCheckpointSaver):
+            await self.memory.ensure_indexes()
+
+    async def _load_session_history(self, session_id: str) -> List[Dict[str, Any]]:
+        """Load persisted messages used to rehydrate an evicted chat session"""
+        return await repository_registry.conversations.get_messages(session_id, limit=self.chat_pool.history_window)
     
     def _create_agent(self) -> AgentExecutor:
         """Create the LangChain agent with tools"""
@@ -110,276 +200,388 @@ class TravelPlanningWorkflow:
         return AgentExecutor(agent=agent, tools=self.tools, verbose=True)
     
     def _create_workflow(self) -> StateGraph:
-        """Create the LangGraph workflow with checkpoints"""
+        """Create the LangGraph workflow.
+        
+        Weather, hotel and route lookups only need the selected destinations, so they run
+        as parallel branches that join before budget estimation. Every node returns only
+        the keys it changes plus its wall-clock time in ``node_timings``.
+        """
         workflow = StateGraph(AgentState)
         
         # Add nodes for each step
-        workflow.add_node("start", self.start_conversation)
-        workflow.add_node("destination_selection", self.destination_selection)
-        workflow.add_node("weather_check", self.weather_check)
-        workflow.add_node("hotel_search", self.hotel_search)
-        workflow.add_node("route_planning", self.route_planning)
-        workflow.add_node("budget_estimation", self.budget_estimation)
-        workflow.add_node("itinerary_generation", self.itinerary_generation)
-        workflow.add_node("finalize", self.finalize_response)
-        
-        # Define the flow
+        workflow.add_node("start", self._timed("start", self.start_conversation))
+        workflow.add_node("destination_selection", self._timed("destination_selection", self.destination_selection))
+        workflow.add_node("weather_check", self._timed("weather_check", self.weather_check))
+        workflow.add_node("hotel_search", self._timed("hotel_search", self.hotel_search))
+        workflow.add_node("route_planning", self._timed("route_planning", self.route_planning))
+        workflow.add_node("budget_estimation", self._timed("budget_estimation", self.budget_estimation))
+        workflow.add_node("itinerary_generation", self._timed("itinerary_generation", self.itinerary_generation))
+        workflow.add_node("finalize", self._timed("finalize", self.finalize_response))
+        
+        # Define the flow: fan out after destination selection, join before budgeting
         workflow.set_entry_point("start")
         workflow.add_edge("start", "destination_selection")
-        workflow.add_edge("destination_selection", "weather_check")
-        workflow.add_edge("weather_check", "hotel_search")
-        workflow.add_edge("hotel_search", "route_planning")
-        workflow.add_edge("route_planning", "budget_estimation")
+        for branch in PARALLEL_BRANCHES:
+            workflow.add_edge("destination_selection", branch)
+        workflow.add_edge(list(PARALLEL_BRANCHES), "budget_estimation")
         workflow.add_edge("budget_estimation", "itinerary_generation")
         workflow.add_edge("itinerary_generation", "finalize")
         workflow.add_edge("finalize", END)
         
         return workflow
     
-    async def start_conversation(self, state: AgentState) -> AgentState:
+    @staticmethod
+    def _timed(name: str, node: Callable[[AgentState, RunnableConfig], Awaitable[Dict[str, Any]]]):
+        """Wrap a node so its update carries its wall-clock time"""
+        async def timed(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+            started = time.perf_counter()
+            update = await node(state, config)
+            elapsed = time.perf_counter() - started
+            record_node_timing(name, elapsed)
+            # Parallel branches run in the same step, so only the others set current_step
+            if name not in PARALLEL_BRANCHES:
+                update = {**update, "current_step": name}
+            return {**update, "node_timings": {name: round(elapsed, 4)}}
+        
+        return timed
+    
+    async def _plan_trip_graph(
+        self,
+        message: str,
+        preferences: Dict[str, Any],
+        on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        previous_state: Optional[Dict[str, Any]] = None,
+        user_id: Optional[str] = None,
+        thread_id: Optional[str] = None
+    ) -> Tuple[TripPlan, Dict[str, Any]]:
+        """``_plan_trip`` on the compiled graph (``AGENT_ENGINE=graph``).
+        
+        With a checkpointer and a stable ``thread_id`` (e.g. the background job id), a
+        run interrupted part-way resumes from its last checkpoint and a finished one
+        returns its stored result, so completed nodes and tool calls aren't redone.
+        Without a ``thread_id`` nothing could ever resume the run, so it isn't checkpointed.
+        """
+        if self.workflow is None:
+            self.workflow = self._create_workflow()
+        if thread_id and self.memory is not None:
+            if self.app is None:
+                self.app = self.workflow.compile(checkpointer=self.memory)
+            app = self.app
+        else:
+            if self.ephemeral_app is None:
+                self.ephemeral_app = self.workflow.compile()
+            app = self.ephemeral_app
+        
+        config = {"configurable": {"thread_id": thread_id or uuid.uuid4().hex, "on_progress": on_progress}}
+        snapshot = await app.aget_state(config) if app is self.app else None
+        if snapshot is not None and snapshot.next:
+            logger.info(f"Resuming graph run {thread_id} at {', '.join(snapshot.next)}")
+            result = await app.ainvoke(None, config)
+        elif snapshot is not None and snapshot.values.get("trip_plan") is not None:
+            logger.info(f"Graph run {thread_id} already finished, reusing its result")
+            result = snapshot.values
+        else:
+            result = await app.ainvoke(
+                {
+                    "messages": [HumanMessage(content=message)],
+                    "user_id": user_id or "anonymous",
+                    "session_id": "",
+                    "user_preferences": preferences,
+                    "previous_state": previous_state or {},
+                    "node_timings": {},
+                },
+                config=config,
+            )
+        timings = result.get("node_timings") or {}
+        logger.info("Graph node timings: " + ", ".join(f"{name}={seconds:.2f}s" for name, seconds in timings.items()))
+        return result["trip_plan"], result["itinerary_state"]
+    
+    async def start_conversation(self, state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
         """Initialize conversation and load context"""
         logger.info(f"Starting conversation for user {state['user_id']}")
         
         # Load user context and preferences
-        context = await self.context_service.get_user_context(state['user_id'])
-        blacklist = await self.blacklist_service.get_user_blacklist(state['user_id'])
-        
-        state['context'] = context
-        state['blacklist_items'] = blacklist
-        state['current_step'] = 'destination_selection'
+        context, blacklist = await asyncio.gather(
+            self.context_service.get_user_context(state['user_id']),
+            self.blacklist_service.get_user_blacklist(state['user_id']),
+        )
         
-        return state
+        return {"context": context or {}, "blacklist_items": blacklist or []}
     
-    async def destination_selection(self, state: AgentState) -> AgentState:
-        """Handle destination search and selection"""
+    async def destination_selection(self, state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+        """Extract trip details and look up the selected destination"""
         logger.info("Processing destination selection")
         
         last_message = state['messages'][-1].content if state['messages'] else ""
+        previous_state = state.get('previous_state') or {}
+        trip_details = await self._extract_stage(last_message, state['user_preferences'], previous_state)
+        on_progress = config.get("configurable", {}).get("on_progress")
+        if on_progress is not None:
+            await on_progress({"trip_details": trip_details})
         
-        # Use agent to search for destinations
-        result = await self.agent.ainvoke({
-            "input": f"Search for travel destinations based on: {last_message}",
-            "context": state['context'],
-            "user_preferences": state['user_preferences'],
-            "blacklist_items": state['blacklist_items']
-        })
-        
-        state['search_results'] = {"destinations": result['output']}
-        state['current_step'] = 'weather_check'
-        
-        return state
+        destinations = [trip_details.get("destination") or DEFAULT_TRIP_DETAILS["destination"]]
+        summaries = await asyncio.gather(*(
+            self._run_tool(self.search_tool, destination) for destination in destinations
+        ))
+        return {
+            "trip_details": trip_details,
+            "search_results": {"destinations": destinations, "summaries": dict(zip(destinations, summaries))},
+        }
     
-    async def weather_check(self, state: AgentState) -> AgentState:
+    async def weather_check(self, state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
         """Check weather for selected destinations"""
         logger.info("Checking weather conditions")
         
         destinations = state['search_results'].get('destinations', [])
-        
-        # Get weather data for destinations
-        result = await self.agent.ainvoke({
-            "input": f"Get weather forecast for these destinations: {destinations}",
-            "context": state['context'],
-            "user_preferences": state['user_preferences'],
-            "blacklist_items": state['blacklist_items']
-        })
-        
-        state['weather_data'] = {"forecast": result['output']}
-        state['current_step'] = 'hotel_search'
-        
-        return state
+        days = int(state['trip_details'].get("duration_days") or 3)
+        forecasts = await asyncio.gather(*(
+            self._run_tool(self.weather_tool, destination, days) for destination in destinations
+        ))
+        return {"weather_data": {destination: self._tool_json(forecast) for destination, forecast in zip(destinations, forecasts)}}
     
-    async def hotel_search(self, state: AgentState) -> AgentState:
+    async def hotel_search(self, state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
         """Search for hotels excluding blacklisted ones"""
         logger.info("Searching for hotels")
         
         destinations = state['search_results'].get('destinations', [])
-        preferences = state['user_preferences']
-        
-        # Search hotels and filter blacklisted ones
-        result = await self.agent.ainvoke({
-            "input": f"Find hotels in {destinations} with preferences: {preferences}. Exclude blacklisted items: {state['blacklist_items']}",
-            "context": state['context'],
-            "user_preferences": state['user_preferences'],
-            "blacklist_items": state['blacklist_items']
-        })
+        results = await asyncio.gather(*(
+            self._run_tool(self.hotel_tool, destination) for destination in destinations
+        ))
+        hotels = [
+            {**hotel, "city": destination}
+            for destination, result in zip(destinations, results)
+            for hotel in (self._tool_json(result) or {}).get("hotels", [])
+        ]
         
         # Filter out blacklisted hotels
-        hotels = await self.blacklist_service.filter_hotels(result['output'], state['user_id'])
-        
-        state['hotel_results'] = hotels
-        state['current_step'] = 'route_planning'
-        
-        return state
+        hotels = await self.blacklist_service.filter_hotels(hotels, state['user_id'])
+        return {"hotel_results": hotels}
     
-    async def route_planning(self, state: AgentState) -> AgentState:
+    async def route_planning(self, state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
         """Plan routes and transportation"""
         logger.info("Planning routes and transportation")
         
-        destinations = state['search_results'].get('destinations', [])
-        
-        result = await self.agent.ainvoke({
-            "input": f"Plan transportation routes for destinations: {destinations}",
-            "context": state['context'],
-            "user_preferences": state['user_preferences'],
-            "blacklist_items": state['blacklist_items']
-        })
-        
-        state['route_data'] = {"routes": result['output']}
-        state['current_step'] = 'budget_estimation'
+        trip_details = state['trip_details']
+        stops = [trip_details.get("origin")] + state['search_results'].get('destinations', [])
+        legs = [(a, b) for a, b in zip(stops, stops[1:]) if a and b]
+        mode = ROUTE_MODES.get(str(trip_details.get("transport_preference") or "").lower(), "driving")
         
-        return state
+        # One matrix for all stops; legs it can't price fall back to the route tool
+        stops = [stop for stop in stops if stop]
+        matrix = await route_matrix.get_matrix(stops, [mode]) if len(stops) > 1 else {"cities": stops, "modes": {}}
+        table = matrix["modes"].get(mode)
+        index = {stop: i for i, stop in enumerate(stops)}
+        routes: List[Any] = [None] * len(legs)
+        for k, (origin, destination) in enumerate(legs):
+            i, j = index[origin], index[destination]
+            if table and table["distance_km"][i][j] is not None:
+                routes[k] = self._matrix_route(origin, destination, mode, table, i, j)
+        fallback = [k for k, route in enumerate(routes) if route is None]
+        outputs = await asyncio.gather(*(self._run_tool(self.route_tool, *legs[k], mode) for k in fallback))
+        for k, output in zip(fallback, outputs):
+            routes[k] = self._tool_json(output)
+        return {"route_data": {"routes": [route for route in routes if route], "matrix": matrix}}
+    
+    @staticmethod
+    def _matrix_route(origin: str, destination: str, mode: str, table: Dict[str, Any], i: int, j: int) -> Dict[str, Any]:
+        """A leg from the route matrix, shaped like RouteSearchTool output"""
+        duration, distance, cost = table["duration_minutes"][i][j], table["distance_km"][i][j], table["cost"][i][j]
+        return {
+            "origin": origin,
+            "destination": destination,
+            "mode": mode,
+            "duration_minutes": duration,
+            "distance_km": distance,
+            "estimated_cost": cost,
+            "currency": "USD",
+            "source": table["source"][i][j],
+            "routes": [{
+                "route_id": f"route_1_{mode}",
+                "duration_minutes": duration,
+                "distance_km": distance,
+                "cost": cost,
+                "steps": [f"Start from {origin}", f"Travel via {mode}", f"Arrive at {destination}"]
+            }]
+        }
     
-    async def budget_estimation(self, state: AgentState) -> AgentState:
+    async def budget_estimation(self, state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
         """Estimate total trip budget"""
         logger.info("Estimating trip budget")
         
         trip_data = {
-            "destinations": state['search_results'],
-            "hotels": state['hotel_results'],
-            "routes": state['route_data'],
-            "preferences": state['user_preferences']
+            "destinations": state['search_results'].get('destinations', []),
+            "hotels": state.get('hotel_results') or [],
+            "routes": (state.get('route_data') or {}).get('routes', []),
+            "duration_days": int(state['trip_details'].get("duration_days") or 3),
         }
-        
-        result = await self.agent.ainvoke({
-            "input": f"Estimate budget for trip with data: {trip_data}",
-            "context": state['context'],
-            "user_preferences": state['user_preferences'],
-            "blacklist_items": state['blacklist_items']
-        })
-        
-        state['budget_estimate'] = {"budget": result['output']}
-        state['current_step'] = 'itinerary_generation'
-        
-        return state
+        estimate = await self._run_tool(self.budget_tool, json.dumps(trip_data))
+        return {"budget_estimate": self._tool_json(estimate) or {}}
     
-    async def itinerary_generation(self, state: AgentState) -> AgentState:
+    async def itinerary_generation(self, state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
         """Generate detailed itinerary"""
         logger.info("Generating detailed itinerary")
         
-        all_data = {
-            "destinations": state['search_results'],
-            "weather": state['weather_data'],
-            "hotels": state['hotel_results'],
-            "routes": state['route_data'],
-            "budget": state['budget_estimate'],
-            "preferences": state['user_preferences']
-        }
-        
-        result = await self.agent.ainvoke({
-            "input": f"Create detailed itinerary with all trip data: {all_data}",
-            "context": state['context'],
-            "user_preferences": state['user_preferences'],
-            "blacklist_items": state['blacklist_items']
-        })
-        
-        # Convert to TripPlan model
-        try:
-            trip_plan = self._parse_trip_plan(result['output'])
-            state['trip_plan'] = trip_plan
-        except Exception as e:
-            logger.error(f"Error parsing trip plan: {e}")
-            state['trip_plan'] = None
+        last_message = state['messages'][-1].content if state['messages'] else ""
+        trip_plan, itinerary_state = await self._build_itinerary(
+            last_message, state['user_preferences'], state['trip_details'], state.get('previous_state') or {}
+        )
         
-        state['current_step'] = 'finalize'
+        # Offer the hotels found for each city that has none yet
+        cities = []
+        for city in trip_plan.cities:
+            if not city.hotels:
+                hotels = []
+                for hotel in state.get('hotel_results') or []:
+                    if hotel.get("city", "").lower() == city.city_name.lower() and len(hotels) < 3:
+                        try:
+                            hotels.append(Hotel.model_validate(hotel))
+                        except ValueError:
+                            continue
+                city = city.model_copy(update={"hotels": hotels})
+            cities.append(city)
         
-        return state
+        return {"trip_plan": trip_plan.model_copy(update={"cities": cities}), "itinerary_state": itinerary_state}
     
-    async def finalize_response(self, state: AgentState) -> AgentState:
+    async def finalize_response(self, state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
         """Finalize and format the response"""
         logger.info("Finalizing response")
         
         # Save context for future conversations
         await self.context_service.save_user_context(
             state['user_id'],
-            state['context'],
+            state.get('context') or {},
             state['user_preferences']
         )
         
-        state['current_step'] = 'completed'
-        
-        return state
+        return {}
+    
+    @staticmethod
+    async def _run_tool(tool: Any, *args: Any) -> str:
+        # Tool I/O goes through the shared pooled client, so branches overlap on the loop
+        return await tool._arun(*args)
     
-    def _parse_trip_plan(self, agent_output: str) -> Optional[TripPlan]:
-        """Parse agent output into TripPlan model"""
+    @staticmethod
+    def _tool_json(output: str) -> Any:
         try:
-            # This would need more sophisticated parsing based on agent output format
-            # For now, return a basic structure
-            return TripPlan(
-                trip_title="AI Generated Trip",
-                total_days=7,
-                start_date=date.today(),
-                end_date=date.today(),
-                total_budget=1000.0,
-                currency="USD",
-                cities=[]
-            )
-        except Exception as e:
+            return json.loads(output)
+        except (TypeError, ValueError):
+            return None
+    
+    def _parse_trip_plan(self, agent_output: str, destination: Optional[str] = None) -> Optional[TripPlan]:
+        """Parse agent output into TripPlan model.
+        
+        Accepts a ``{"cities": [{"city_name", "days": [...]}]}`` or ``{"days": [...]}``
+        document (repairing malformed JSON); days that don't validate are skipped and
+        None is returned when no day survives.
+        """
+        try:
+            document = extract_json(agent_output)
+        except ValueError as e:
             logger.error(f"Error parsing trip plan: {e}")
             return None
+        if isinstance(document, list):
+            document = {"days": document}
+        
+        cities_raw = document.get("cities") or [{
+            "city_name": document.get("destination") or destination or "Unknown",
+            "country": document.get("country") or "Unknown",
+            "days": document.get("days") or [],
+        }]
+        start = date.today()
+        cities: List[CityVisit] = []
+        day_number = 1
+        for city in cities_raw:
+            if not isinstance(city, dict):
+                continue
+            days: List[DayPlan] = []
+            for raw_day in city.get("days") or []:
+                try:
+                    days.append(coerce_day(raw_day, day_number, start + timedelta(days=day_number - 1)))
+                    day_number += 1
+                except ValueError as e:
+                    logger.debug(f"Skipping malformed day in agent output: {e}")
+            if days:
+                transport = str(city.get("transport") or "flight")
+                cities.append(CityVisit(
+                    city_name=str(city.get("city_name") or city.get("name") or destination or "Unknown"),
+                    country=str(city.get("country") or "Unknown"),
+                    arrival={"date": days[0].date.isoformat(), "time": "09:00", "by": transport},
+                    departure={"date": (days[-1].date + timedelta(days=1)).isoformat(), "time": "18:00", "by": transport},
+                    days=days,
+                ))
+        if not cities:
+            return None
+        
+        all_days = [day for city in cities for day in city.days]
+        try:
+            total_budget = float(document.get("total_budget") or document.get("total_estimated_cost") or 0)
+        except (TypeError, ValueError):
+            total_budget = 0.0
+        return TripPlan(
+            trip_title=str(document.get("trip_title") or f"Trip to {cities[0].city_name}"),
+            total_days=len(all_days),
+            start_date=min(day.date for day in all_days),
+            end_date=max(day.date for day in all_days),
+            total_budget=total_budget or sum(day.daily_budget_total for day in all_days),
+            currency=str(document.get("currency") or "USD"),
+            cities=cities,
+        )
     
     async def process_message(
         self,
         message: str,
         user_id: str,
         session_id: str,
-        user_preferences: Dict[str, Any] = None
+        user_preferences: Dict[str, Any] = None,
+        plan_trip: bool = True,
+        previous_state: Optional[Dict[str, Any]] = None
     ) -> TravelAssistantResponse:
+        """Reply to one chat turn, building a trip plan alongside when the message calls for it.
+        
+        With ``plan_trip=False`` only the conversational reply is produced; callers use
+        this when the trip plan is generated elsewhere (e.g. as a background job).
+        ``previous_state`` is the stored conversation state; its trip plan is patched
+        rather than rebuilt when the user only tweaks some trip details.
+        """
         try:
             # Use our initialized Gemini service
-            if not self.llm_available or not self.gemini_chat:
+            if not self.llm_available or not self.gemini_chat or self.chat_pool is None:
                 return await self._get_mock_response(message, user_preferences or {})
             
-            # Create a travel planning prompt
-            travel_prompt = f"""
-            You are GlobeTrotter AI, an expert travel planning assistant. 
+            # Don't queue behind a degraded Gemini backend; serve the fallback right away
+            if gemini_breaker.is_open:
+                return await self._get_mock_response(message, user_preferences or {})
             
-            User message: {message}
-            User preferences: {user_preferences or {}}
+            # Create a travel planning prompt
+            travel_prompt = self._build_travel_prompt(message, user_preferences or {})
             
-            Analyze the user's request and:
-            1. If they're asking for a trip plan, extract destination, dates, budget, travelers
-            2. Provide helpful travel advice and information
-            3. If you have enough information for a complete trip, indicate that you can create an itinerary
+            should_trigger_hybrid = plan_trip and self._should_trigger_itinerary(message)
             
-            Respond naturally and helpfully. If the user provides trip details like destination, dates, and budget, 
-            let them know you can create a detailed itinerary for them.
-            """
-            
-            # Get response from Gemini
-            response_text = self.gemini_chat.send_message(travel_prompt)
-            
-            # Extract trip details from user message using LLM
-            trip_details = await self._extract_trip_details(message, user_preferences or {})
-            
-            # Check if we should trigger itinerary mode
-            message_lower = message.lower()
-            has_destination = any(city in message_lower for city in ['tokyo', 'kyoto', 'paris', 'london', 'rome', 'new york', 'singapore', 'bali', 'goa', 'lisbon', 'ahmedabad', 'surat', 'mumbai', 'delhi'])
-            has_duration = any(word in message_lower for word in ['day', 'week', 'month', 'trip'])
-            has_budget = any(char in message for char in ['$', '€', '₹', '£']) or 'budget' in message_lower or 'economical' in message_lower or 'cheap' in message_lower
-            
-            # More flexible trigger conditions for hybrid mode - trigger more easily for demo
-            should_trigger_hybrid = (
-                has_destination or 
-                has_duration or 
-                has_budget or
-                any(word in message_lower for word in ['plan', 'itinerary', 'travel', 'visit', 'vacation', 'holiday', 'trip', 'ready', 'go', 'explore']) or
-                len(message.split()) > 3 or  # Even shorter messages can trigger
-                'demo' in message_lower or
-                len(message_lower) > 10  # Any message longer than 10 characters
+            # The conversational reply and the trip pipeline (extraction -> itinerary) don't
+            # depend on each other, so run them concurrently: ~2 LLM latencies instead of 3
+            reply_stage = self._run_stage(
+                "reply",
+                self.chat_pool.send_message(session_id, travel_prompt),
+                settings.LLM_REPLY_TIMEOUT_SECONDS,
+                fallback=None,
             )
+            if should_trigger_hybrid:
+                response_text, (trip_plan, itinerary_state) = await asyncio.gather(
+                    reply_stage,
+                    self._plan_trip(message, user_preferences or {}, previous_state=previous_state, user_id=user_id),
+                )
+            else:
+                response_text, trip_plan, itinerary_state = await reply_stage, None, None
             
-            # For demo purposes, let's trigger hybrid mode more easily
-            if not should_trigger_hybrid and len(message_lower) > 4:
-                should_trigger_hybrid = True
+            if response_text is None:
+                response_text = (await self._get_mock_response(message, user_preferences or {})).message
             
-            # If we have enough info, create an intelligent trip plan and trigger hybrid mode
+            # If we have enough info, return the intelligent trip plan and trigger hybrid mode
             if should_trigger_hybrid:
-                # Create an intelligent, context-aware trip plan based on user request
-                trip_plan = await self._generate_intelligent_itinerary(trip_details, message)
-                
                 return TravelAssistantResponse(
-                    message=f"{response_text}\n\n🎉 **Perfect!** I've created a smart itinerary based on your request! The interactive planner shows:\n\n✨ **Optimized routes** based on your preferences\n💰 **Budget breakdown** with real-time updates\n🌤️ **Weather-aware recommendations**\n🏨 **Best value accommodations**\n📱 **Drag & drop to customize** - prices update automatically!\n\nStart planning your adventure! 🚀",
+                    message=f"{response_text}{ITINERARY_READY_BANNER}",
                     trip_plan=trip_plan,
+                    itinerary_state=itinerary_state,
                     ui_actions=UIActions(
                         open_panel="itinerary",
                         animate_itinerary="drip",
@@ -398,8 +600,286 @@ class TravelPlanningWorkflow:
             logger.error(f"Error processing message: {e}")
             return await self._get_mock_response(message, user_preferences or {})
     
-    async def _extract_trip_details(self, message: str, preferences: Dict[str, Any]) -> Dict[str, Any]:
-        """Extract trip details from user message using LLM"""
+    def _build_travel_prompt(self, message: str, user_preferences: Dict[str, Any]) -> str:
+        """Prompt for the conversational reply"""
+        return f"""
+            You are GlobeTrotter AI, an expert travel planning assistant. 
+            
+            User message: {message}
+            User preferences: {user_preferences}
+            
+            Analyze the user's request and:
+            1. If they're asking for a trip plan, extract destination, dates, budget, travelers
+            2. Provide helpful travel advice and information
+            3. If you have enough information for a complete trip, indicate that you can create an itinerary
+            
+            Respond naturally and helpfully. If the user provides trip details like destination, dates, and budget, 
+            let them know you can create a detailed itinerary for them.
+            """
+    
+    async def stream_message(
+        self,
+        message: str,
+        user_id: str,
+        session_id: str,
+        user_preferences: Dict[str, Any] = None,
+        plan_trip: bool = True,
+        previous_state: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Streaming variant of ``process_message``.
+        
+        Yields ``("token", text)`` chunks of the reply as they arrive, then
+        ``("ui_actions", UIActions)`` and ``("trip_plan", TripPlan)`` once the trip
+        pipeline has finished, and finally ``("done", TravelAssistantResponse)``.
+        """
+        preferences = user_preferences or {}
+        if not self.llm_available or not self.gemini_chat or self.chat_pool is None or gemini_breaker.is_open:
+            response = await self._get_mock_response(message, preferences)
+            yield "token", response.message
+            yield "done", response
+            return
+        
+        # The trip pipeline runs in the background while the reply streams
+        plan_task = None
+        if plan_trip and self._should_trigger_itinerary(message):
+            plan_task = asyncio.create_task(
+                self._plan_trip(message, preferences, previous_state=previous_state, user_id=user_id)
+            )
+        
+        chunks: List[str] = []
+        try:
+            stream = self.chat_pool.stream_message(session_id, self._build_travel_prompt(message, preferences))
+            try:
+                while True:
+                    # The reply timeout applies to the gap between chunks
+                    text = await asyncio.wait_for(anext(stream), timeout=settings.LLM_REPLY_TIMEOUT_SECONDS)
+                    chunks.append(text)
+                    yield "token", text
+            except StopAsyncIteration:
+                pass
+            except asyncio.TimeoutError:
+                logger.warning(f"Reply stream stalled for {settings.LLM_REPLY_TIMEOUT_SECONDS}s")
+            except CircuitOpenError as e:
+                logger.warning(f"Reply stream skipped: {e}")
+            finally:
+                await stream.aclose()
+            
+            if not chunks:
+                fallback = (await self._get_mock_response(message, preferences)).message
+                chunks.append(fallback)
+                yield "token", fallback
+            
+            if plan_task is None:
+                yield "done", TravelAssistantResponse(
+                    message="".join(chunks),
+                    conversation_id=session_id,
+                    ui_actions=None
+                )
+                return
+            
+            trip_plan, itinerary_state = await plan_task
+            chunks.append(ITINERARY_READY_BANNER)
+            yield "token", ITINERARY_READY_BANNER
+            ui_actions = UIActions(
+                open_panel="itinerary",
+                animate_itinerary="drip",
+                collapse_chat=True
+            )
+            yield "ui_actions", ui_actions
+            yield "trip_plan", trip_plan
+            yield "done", TravelAssistantResponse(
+                message="".join(chunks),
+                trip_plan=trip_plan,
+                itinerary_state=itinerary_state,
+                ui_actions=ui_actions,
+                conversation_id=session_id
+            )
+        finally:
+            if plan_task is not None and not plan_task.done():
+                plan_task.cancel()
+    
+    def _should_trigger_itinerary(self, message: str) -> bool:
+        """Decide from the message alone whether this turn should produce a trip plan"""
+        message_lower = message.lower()
+        has_destination = any(city in message_lower for city in ['tokyo', 'kyoto', 'paris', 'london', 'rome', 'new york', 'singapore', 'bali', 'goa', 'lisbon', 'ahmedabad', 'surat', 'mumbai', 'delhi'])
+        has_duration = any(word in message_lower for word in ['day', 'week', 'month', 'trip'])
+        has_budget = any(char in message for char in ['$', '€', '₹', '£']) or 'budget' in message_lower or 'economical' in message_lower or 'cheap' in message_lower
+        
+        # More flexible trigger conditions for hybrid mode - trigger more easily for demo
+        should_trigger_hybrid = (
+            has_destination or 
+            has_duration or 
+            has_budget or
+            any(word in message_lower for word in ['plan', 'itinerary', 'travel', 'visit', 'vacation', 'holiday', 'trip', 'ready', 'go', 'explore']) or
+            len(message.split()) > 3 or  # Even shorter messages can trigger
+            'demo' in message_lower or
+            len(message_lower) > 10  # Any message longer than 10 characters
+        )
+        
+        # For demo purposes, let's trigger hybrid mode more easily
+        if not should_trigger_hybrid and len(message_lower) > 4:
+            should_trigger_hybrid = True
+        
+        return should_trigger_hybrid
+    
+    async def _run_stage(self, name: str, coro: Awaitable[Any], timeout: float, fallback: Any = None) -> Any:
+        """Await one pipeline stage, returning ``fallback`` if it fails or overruns ``timeout``"""
+        try:
+            return await asyncio.wait_for(coro, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Stage '{name}' timed out after {timeout}s")
+        except Exception as e:
+            logger.error(f"Stage '{name}' failed: {e}")
+        return fallback
+    
+    async def _plan_trip(
+        self,
+        message: str,
+        preferences: Dict[str, Any],
+        on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        previous_state: Optional[Dict[str, Any]] = None,
+        user_id: Optional[str] = None,
+        thread_id: Optional[str] = None
+    ) -> Tuple[TripPlan, Dict[str, Any]]:
+        """Dependent pipeline stages: extract trip details, then build the itinerary.
+        
+        Returns the plan and the itinerary state to store with it (trip details and, in
+        per-day mode, the outline and per-day content hashes used to patch it later).
+        ``on_progress`` receives partial results (the extracted trip details) as soon
+        as they are available, e.g. to report background job progress.
+        With ``AGENT_ENGINE=graph`` the compiled LangGraph workflow runs instead;
+        ``thread_id`` identifies its checkpoints.
+        """
+        if settings.AGENT_ENGINE == "graph":
+            return await self._plan_trip_graph(message, preferences, on_progress, previous_state, user_id, thread_id)
+        
+        previous_state = previous_state or {}
+        trip_details = await self._extract_stage(message, preferences, previous_state)
+        if on_progress is not None:
+            await on_progress({"trip_details": trip_details})
+        return await self._build_itinerary(message, preferences, trip_details, previous_state)
+    
+    async def _extract_stage(self, message: str, preferences: Dict[str, Any], previous_state: Dict[str, Any]) -> Dict[str, Any]:
+        """Trip details for this message, on top of those already known in the conversation"""
+        known = (previous_state.get("itinerary_state") or {}).get("trip_details") or {}
+        return await self._run_stage(
+            "extraction",
+            self._extract_trip_details(message, preferences, known=known),
+            settings.LLM_EXTRACTION_TIMEOUT_SECONDS,
+            fallback={**DEFAULT_TRIP_DETAILS, **known},
+        )
+    
+    async def _build_itinerary(
+        self,
+        message: str,
+        preferences: Dict[str, Any],
+        trip_details: Dict[str, Any],
+        previous_state: Dict[str, Any]
+    ) -> Tuple[TripPlan, Dict[str, Any]]:
+        """Stored, patched or newly generated itinerary for the extracted trip details"""
+        known = (previous_state.get("itinerary_state") or {}).get("trip_details") or {}
+        
+        # Identical inputs share one stored plan, unless the user asked to be surprised or
+        # this conversation already has a plan for the destination to patch
+        use_store = (
+            settings.ITINERARY_STORE_ENABLED
+            and not self._wants_fresh_plan(message, preferences)
+            and not self._same_destination(known, trip_details)
+        )
+        if use_store:
+            stored = await self._load_stored_itinerary(trip_details)
+            if stored is not None:
+                return stored
+        
+        trip_plan, itinerary_state = None, None
+        if settings.ITINERARY_GENERATION_MODE == "per_day":
+            try:
+                trip_plan, plan_state = await self._generate_per_day_itinerary(trip_details, previous_state)
+                itinerary_state = plan_state.model_dump(mode="json")
+            except Exception as e:
+                logger.error(f"Per-day itinerary generation failed: {e}")
+        if trip_plan is None:
+            trip_plan = await self._generate_intelligent_itinerary(trip_details, message)
+            itinerary_state = {"trip_details": trip_details}
+        if use_store:
+            await self._store_itinerary(trip_details, trip_plan, itinerary_state)
+        return trip_plan, itinerary_state
+    
+    @staticmethod
+    def _wants_fresh_plan(message: str, preferences: Dict[str, Any]) -> bool:
+        """"Surprise me" requests opt out of the itinerary store"""
+        return bool(preferences.get("surprise_me")) or bool(SURPRISE_ME_PATTERN.search(message or ""))
+    
+    @staticmethod
+    def _same_destination(known: Dict[str, Any], trip_details: Dict[str, Any]) -> bool:
+        previous = str(known.get("destination") or "").strip().lower()
+        return bool(previous) and previous == str(trip_details.get("destination") or "").strip().lower()
+    
+    async def _load_stored_itinerary(self, trip_details: Dict[str, Any]) -> Optional[Tuple[TripPlan, Dict[str, Any]]]:
+        """Stored plan for the same normalized inputs, adapted to this request; None on a miss"""
+        try:
+            key, _ = itinerary_key(trip_details)
+            entry = await itinerary_store.get(key)
+            if entry is None:
+                return None
+            trip_plan = TripPlan.model_validate(entry["trip_plan"])
+        except Exception as e:
+            logger.warning(f"Itinerary store lookup failed: {e}")
+            return None
+        
+        # Inputs outside the key (origin, exact party size, dates) come from this request
+        origin = trip_details.get("origin")
+        destination = trip_details.get("destination", "Tokyo")
+        budget_type = trip_details.get("budget_type", "moderate")
+        trip_plan = rebase_plan_dates(trip_plan, date.today()).model_copy(update={
+            "trip_title": f"{budget_type.title()} {destination} Adventure" + (f" from {origin}" if origin else ""),
+            "total_budget": self._estimate_total_budget(trip_details),
+        })
+        itinerary_state = {**(entry.get("plan_state") or {}), "trip_details": trip_details}
+        logger.info(f"Served itinerary for {destination} from the itinerary store")
+        return trip_plan, itinerary_state
+    
+    async def _store_itinerary(
+        self,
+        trip_details: Dict[str, Any],
+        trip_plan: TripPlan,
+        itinerary_state: Dict[str, Any]
+    ) -> None:
+        """Best-effort write of a generated plan; plans with placeholder days aren't stored"""
+        if any(not digest for digest in (itinerary_state.get("day_hashes") or {}).values()):
+            return
+        try:
+            key, inputs = itinerary_key(trip_details)
+            await itinerary_store.put(
+                key,
+                inputs,
+                trip_plan.model_dump(mode="json"),
+                plan_state={k: v for k, v in itinerary_state.items() if k != "trip_details"},
+            )
+        except Exception as e:
+            logger.warning(f"Failed to store itinerary: {e}")
+    
+    async def _extract_trip_details(
+        self,
+        message: str,
+        preferences: Dict[str, Any],
+        known: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Extract trip details from user message, using the LLM only when the rules aren't confident.
+        
+        ``known`` are the details of the trip already planned in this conversation;
+        whatever the message doesn't mention keeps its known value.
+        """
+        known = known or {}
+        fast = trip_detail_extractor.extract(message)
+        # A follow-up that only tweaks details of a known trip ("make it 5 days") needs no LLM;
+        # one naming a place the gazetteer doesn't know ("4 days in Lyon") still goes to it
+        is_tweak = bool(
+            known.get("destination") and fast.details and "destination" not in fast.details
+            and not trip_detail_extractor.mentions_other_place(message, known["destination"])
+        )
+        if fast.confident or is_tweak:
+            return {**known, **fast.details}
         try:
             extraction_prompt = f"""
             Analyze this travel request and extract key details in JSON format:
@@ -424,27 +904,20 @@ class TravelPlanningWorkflow:
             - "5 day luxury vacation to Paris for 2 people" → {{"destination": "Paris", "duration_days": 5, "travelers": 2, "budget_type": "luxury"}}
             """
             
-            response = self.gemini_chat.send_message(extraction_prompt)
+            response = await self.gemini_chat.generate_async(extraction_prompt)
             
             # Try to parse JSON response
             import json
             try:
-                return json.loads(response.strip())
+                extracted = json.loads(response.strip())
+                # Keep whatever the rules found for fields the LLM left out
+                return {**known, **fast.details, **{k: v for k, v in extracted.items() if v is not None}}
             except:
                 # Fallback parsing
-                return {
-                    "origin": None,
-                    "destination": "Tokyo",  # Default
-                    "budget_type": "moderate",
-                    "duration_days": 3,
-                    "travelers": 1,
-                    "interests": ["cultural", "food"],
-                    "transport_preference": "train",
-                    "accommodation_type": "mid-range"
-                }
+                return {**DEFAULT_TRIP_DETAILS, **known, **fast.details}
         except Exception as e:
             logger.error(f"Error extracting trip details: {e}")
-            return {"destination": "Tokyo", "budget_type": "moderate", "duration_days": 3}
+            return {"destination": "Tokyo", "budget_type": "moderate", "duration_days": 3, **known, **fast.details}
     
     def _generate_city_plan(self, destination: str, trip_details: Dict[str, Any], duration: int, total_budget: float) -> Dict[str, Any]:
         """Create a simple city plan structure compatible with CityVisit/DayPlan models.
@@ -501,6 +974,45 @@ class TravelPlanningWorkflow:
                 "transport_options": {}
             }
     
+    def _estimate_total_budget(self, trip_details: Dict[str, Any]) -> float:
+        """Calculate budget based on type, trip length and party size"""
+        budget_type = trip_details.get("budget_type", "moderate")
+        base_budget = 200 if budget_type == "economical" else 400 if budget_type == "moderate" else 800
+        return base_budget * trip_details.get("duration_days", 3) * trip_details.get("travelers", 1)
+    
+    async def _generate_per_day_itinerary(
+        self,
+        trip_details: Dict[str, Any],
+        previous_state: Dict[str, Any]
+    ) -> Tuple[TripPlan, PlanState]:
+        """Skeleton first, then every day generated concurrently and merged into the plan.
+        
+        When the conversation already has a per-day plan, only the days whose content
+        hash changed are regenerated.
+        """
+        origin = trip_details.get("origin", "Your Location")
+        destination = trip_details.get("destination", "Tokyo")
+        budget_type = trip_details.get("budget_type", "moderate")
+        
+        previous_plan, previous_plan_state = None, None
+        if previous_state.get("trip_plan") and (previous_state.get("itinerary_state") or {}).get("skeleton"):
+            try:
+                previous_plan = TripPlan.model_validate(previous_state["trip_plan"])
+                previous_plan_state = PlanState.model_validate(previous_state["itinerary_state"])
+            except Exception as e:
+                logger.warning(f"Stored itinerary can't be patched, regenerating: {e}")
+                previous_plan, previous_plan_state = None, None
+        
+        # Each skeleton/day call has its own timeout; failed days fall back individually
+        planner = ParallelDayPlanner(self.gemini_chat)
+        return await planner.plan(
+            trip_details,
+            self._estimate_total_budget(trip_details),
+            trip_title=f"{budget_type.title()} {destination} Adventure" + (f" from {origin}" if origin else ""),
+            previous_plan=previous_plan,
+            previous_state=previous_plan_state,
+        )
+    
     async def _generate_intelligent_itinerary(self, trip_details: Dict[str, Any], original_message: str) -> TripPlan:
         """Generate intelligent, context-aware itinerary based on extracted details"""
         try:
@@ -522,7 +1034,12 @@ class TravelPlanningWorkflow:
             Consider the user's budget type and preferences.
             """
             
-            itinerary_response = self.gemini_chat.send_message(itinerary_prompt)
+            itinerary_response = await self._run_stage(
+                "itinerary",
+                self.gemini_chat.generate_async(itinerary_prompt),
+                settings.LLM_ITINERARY_TIMEOUT_SECONDS,
+                fallback="",
+            )
             
             # Create intelligent trip plan based on extracted details
             origin = trip_details.get("origin", "Your Location")
@@ -531,9 +1048,7 @@ class TravelPlanningWorkflow:
             duration = trip_details.get("duration_days", 3)
             travelers = trip_details.get("travelers", 1)
             
-            # Calculate budget based on type and destination
-            base_budget = 200 if budget_type == "economical" else 400 if budget_type == "moderate" else 800
-            total_budget = base_budget * duration * travelers
+            total_budget = self._estimate_total_budget(trip_details)
             
             # Generate intelligent trip plan with proper date types
             from datetime import date, timedelta
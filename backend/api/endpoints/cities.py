@@ -1,11 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from typing import List, Optional, Dict, Any
 from pydantic import HttpUrl
+import logging
 
 from backend.repositories.city_repository import city_repository
+from backend.services.climate_normals import climate_normals
 from backend.models.city_model import CityModel
 from backend.auth import get_current_user
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api/cities", tags=["cities"])
 
 @router.get("/", response_model=List[Dict[str, Any]])
@@ -69,6 +73,33 @@ async def get_city_suggestions(
     """
     return await city_repository.get_city_suggestions(q, limit)
 
+@router.get("/climate", response_model=List[Dict[str, Any]])
+async def search_cities_by_climate(
+    month: str = Query(..., description="Month name or number (e.g. 'Mar' or 3)"),
+    min_temp: Optional[float] = Query(None, description="Minimum average temperature (°C)"),
+    max_temp: Optional[float] = Query(None, description="Maximum average temperature (°C)"),
+    max_precipitation: Optional[float] = Query(None, ge=0, description="Maximum monthly precipitation (mm)"),
+    limit: int = Query(20, le=100, description="Number of results to return")
+):
+    """
+    Find cities by their climate normals for a month (e.g. 20-26°C in March)
+    """
+    ranges = {}
+    if min_temp is not None or max_temp is not None:
+        ranges["temperature"] = (min_temp, max_temp)
+    if max_precipitation is not None:
+        ranges["precipitation_mm"] = (None, max_precipitation)
+    try:
+        return climate_normals.query(month, ranges, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _reload_climate_normals() -> None:
+    try:
+        await climate_normals.load_from_db()
+    except Exception as e:
+        logger.warning(f"Failed to reload climate normals: {e}")
+
 @router.get("/{city_id}", response_model=Dict[str, Any])
 async def get_city(city_id: str):
     """
@@ -100,6 +131,7 @@ async def create_city(
     created_city = await city_repository.create_city(city_data.dict())
     if not created_city:
         raise HTTPException(status_code=400, detail="Failed to create city")
+    await _reload_climate_normals()
     
     return created_city
 
@@ -118,6 +150,7 @@ async def update_city(
     updated_city = await city_repository.update_city(city_id, city_data.dict(exclude_unset=True))
     if not updated_city:
         raise HTTPException(status_code=404, detail="City not found")
+    await _reload_climate_normals()
     
     return updated_city
 
@@ -135,3 +168,4 @@ async def delete_city(
     success = await city_repository.delete_city(city_id)
     if not success:
         raise HTTPException(status_code=404, detail="City not found")
+    await _reload_climate_normals()
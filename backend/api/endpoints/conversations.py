@@ -4,7 +4,7 @@ from typing import Optional, Dict, Any, List
 from datetime import datetime
 
 from backend.config import settings
-from backend.repositories import ConversationRepository
+from backend.repositories import ConversationRepository, get_conversation_repository
 
 router = APIRouter(prefix=f"{settings.API_PREFIX}/conversations", tags=["conversations"]) 
 
@@ -26,54 +26,79 @@ class ConversationSummary(BaseModel):
     conversation_id: str
     has_state: bool = True
 
+class MessagePage(BaseModel):
+    conversation_id: str
+    messages: List[Dict[str, Any]]
+    start: int  # Index of the first message; pass as `before` for the previous page
+    total: int
+    has_more: bool
+
+class AppendMessageResponse(BaseModel):
+    conversation_id: str
+    message: Dict[str, Any]
+    total: Optional[int] = None  # Messages in the conversation, including this one
+
 class ConversationResponse(BaseModel):
     conversation_id: str
     state: Dict[str, Any]
     updated_at: str = Field(default_factory=lambda: datetime.utcnow().isoformat())
 
-async def get_repo() -> ConversationRepository:
-    return await ConversationRepository.create()
-
 @router.get("/{conversation_id}", response_model=ConversationResponse)
-async def get_conversation(conversation_id: str, repo: ConversationRepository = Depends(get_repo)):
+async def get_conversation(conversation_id: str, repo: ConversationRepository = Depends(get_conversation_repository)):
     state = await repo.get(conversation_id)
     if state is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
     return ConversationResponse(conversation_id=conversation_id, state=state)
 
 @router.post("/", response_model=ConversationResponse)
-async def create_conversation(body: CreateConversationRequest, repo: ConversationRepository = Depends(get_repo)):
+async def create_conversation(body: CreateConversationRequest, repo: ConversationRepository = Depends(get_conversation_repository)):
     conv_id = body.conversation_id or datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
     initial_state = body.state or {"messages": [], "context": {}, "ui_actions": {}, "trip_plan": None}
     await repo.create_conversation(conv_id, initial_state, user_id=body.user_id)
     return ConversationResponse(conversation_id=conv_id, state=initial_state)
 
 @router.patch("/{conversation_id}", response_model=ConversationResponse)
-async def update_conversation(conversation_id: str, body: ConversationState, repo: ConversationRepository = Depends(get_repo)):
+async def update_conversation(conversation_id: str, body: ConversationState, repo: ConversationRepository = Depends(get_conversation_repository)):
     await repo.upsert(conversation_id, body.state)
     return ConversationResponse(conversation_id=conversation_id, state=body.state)
 
 @router.delete("/{conversation_id}")
-async def delete_conversation(conversation_id: str, repo: ConversationRepository = Depends(get_repo)):
+async def delete_conversation(conversation_id: str, repo: ConversationRepository = Depends(get_conversation_repository)):
     ok = await repo.delete(conversation_id)
     if not ok:
         raise HTTPException(status_code=404, detail="Conversation not found")
     return {"success": True}
 
 @router.post("/{conversation_id}/clear")
-async def clear_conversation(conversation_id: str, repo: ConversationRepository = Depends(get_repo)):
+async def clear_conversation(conversation_id: str, repo: ConversationRepository = Depends(get_conversation_repository)):
     ok = await repo.clear(conversation_id)
     if not ok:
         raise HTTPException(status_code=404, detail="Conversation not found")
     return {"success": True}
 
 @router.get("/", response_model=List[ConversationSummary])
-async def list_conversations(user_id: str = Query(..., description="User ID"), skip: int = 0, limit: int = 20, repo: ConversationRepository = Depends(get_repo)):
+async def list_conversations(user_id: str = Query(..., description="User ID"), skip: int = 0, limit: int = 20, repo: ConversationRepository = Depends(get_conversation_repository)):
     rows = await repo.list_by_user(user_id=user_id, limit=limit, skip=skip)
     return [ConversationSummary(**r) for r in rows]
 
-@router.post("/{conversation_id}/messages", response_model=ConversationResponse)
-async def append_message(conversation_id: str, body: AppendMessageRequest, repo: ConversationRepository = Depends(get_repo)):
+@router.get("/{conversation_id}/messages", response_model=MessagePage)
+async def get_messages(
+    conversation_id: str,
+    limit: int = Query(50, ge=1, le=500, description="Messages per page"),
+    before: Optional[int] = Query(None, ge=0, description="Return messages before this index (default: latest)"),
+    repo: ConversationRepository = Depends(get_conversation_repository),
+):
+    page = await repo.get_message_page(conversation_id, limit=limit, before=before)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return MessagePage(conversation_id=conversation_id, **page)
+
+@router.post("/{conversation_id}/messages", response_model=AppendMessageResponse)
+async def append_message(conversation_id: str, body: AppendMessageRequest, repo: ConversationRepository = Depends(get_conversation_repository)):
     message = {"role": body.role, "content": body.content, "meta": body.meta or {}, "ts": datetime.utcnow().isoformat()}
-    state = await repo.append_message(conversation_id, message)
-    return ConversationResponse(conversation_id=conversation_id, state=state)
+    total = await repo.append_message(conversation_id, message)
+    if total is None:
+        # Cold cache: one page reloads the count (and the cached window) without reading every bucket
+        page = await repo.get_message_page(conversation_id, limit=1)
+        total = page["total"] if page else None
+    return AppendMessageResponse(conversation_id=conversation_id, message=message, total=total)
@@ -6,7 +6,97 @@ class Settings(BaseSettings):
     GEMINI_API_KEY: Optional[str] = None
     OPENWEATHER_API_KEY: Optional[str] = None
     MAPBOX_ACCESS_TOKEN: Optional[str] = None
+    GOOGLE_MAPS_API_KEY: Optional[str] = None
+    GOOGLE_SEARCH_API_KEY: Optional[str] = None
+    GOOGLE_SEARCH_ENGINE_ID: Optional[str] = None
+
+    # LLM (Gemini)
+    GEMINI_MAX_CONCURRENCY: int = 8  # Max in-flight Gemini requests per worker
+    CHAT_POOL_MAX_SESSIONS: int = 512  # Per-conversation chats kept in memory (LRU)
+    CHAT_HISTORY_WINDOW: int = 20  # Messages of history re-sent on each turn
+    LLM_REPLY_TIMEOUT_SECONDS: float = 20.0
+    LLM_EXTRACTION_TIMEOUT_SECONDS: float = 10.0
+    LLM_ITINERARY_TIMEOUT_SECONDS: float = 30.0
+    ITINERARY_GENERATION_MODE: str = "single"  # single (one prompt) | per_day (skeleton + parallel days)
+    AGENT_ENGINE: str = "pipeline"  # "pipeline" (staged calls) or "graph" (compiled LangGraph workflow)
+    GRAPH_CHECKPOINTER: str = "redis"  # Graph engine checkpoints: redis | memory | none
+    GRAPH_CHECKPOINT_TTL_SECONDS: int = 24 * 3600
+    GRAPH_CHECKPOINT_MONGO: bool = False  # Also persist graph checkpoints in MongoDB
+    GRAPH_CHECKPOINT_MONGO_TTL_SECONDS: int = 7 * 24 * 3600
+    ITINERARY_DAY_CONCURRENCY: int = 4  # Days generated at once in per_day mode
+    ITINERARY_DAY_MAX_ATTEMPTS: int = 3  # Attempts per day before a placeholder day is used
+    LLM_ITINERARY_DAY_TIMEOUT_SECONDS: float = 20.0
+    ITINERARY_BUDGET_TOLERANCE: float = 1.25  # Reused days may exceed the new daily budget by this factor
+    TRIP_EXTRACTOR_CONFIDENCE_THRESHOLD: float = 0.6  # Below this the LLM extracts trip details
+    ITINERARY_STORE_ENABLED: bool = True  # Serve identical itinerary requests from the itinerary store
+    ITINERARY_STORE_TTL_SECONDS: int = 7 * 24 * 3600  # Freshness of a stored itinerary
+    ITINERARY_STORE_REDIS_TTL_SECONDS: int = 3600
+    ITINERARY_STORE_VERSION: int = 1  # Bump when prompts change so older plans stop matching
+    LLM_SINGLEFLIGHT_REDIS: bool = False  # Coalesce identical prompts across workers via Redis
+    LLM_SINGLEFLIGHT_LOCK_TTL_SECONDS: int = 60
+    LLM_SINGLEFLIGHT_RESULT_TTL_SECONDS: int = 30
+    TRAVEL_TIPS_CACHE_MAX_ENTRIES: int = 1024
+    TRAVEL_TIPS_CACHE_LOCAL_TTL_SECONDS: int = 600
+    TRAVEL_TIPS_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    LLM_BREAKER_WINDOW_SECONDS: float = 60.0  # Rolling window for error rate / p95 latency
+    LLM_BREAKER_MIN_REQUESTS: int = 10  # Samples needed before the breaker can trip
+    LLM_BREAKER_ERROR_RATE: float = 0.5
+    LLM_BREAKER_P95_LATENCY_SECONDS: float = 15.0
+    LLM_BREAKER_OPEN_SECONDS: float = 30.0  # Cool-down before half-open probes
+    LLM_BREAKER_HALF_OPEN_PROBES: int = 1
+    LLM_HEDGE_ENABLED: bool = False  # Send a second request when the first is slow
+    LLM_HEDGE_PERCENTILE: float = 0.95  # Latency percentile after which to hedge
+    LLM_HEDGE_MIN_DELAY_SECONDS: float = 1.0
+    
+    # LLM provider ("gemini", "stub" = in-process fake, "stub_http" = stub LLM server)
+    LLM_PROVIDER: str = "gemini"
+    LLM_STUB_URL: str = "http://127.0.0.1:8900"
+    LLM_STUB_LATENCY_DISTRIBUTION: str = "lognormal"  # fixed | uniform | lognormal
+    LLM_STUB_LATENCY_MS: float = 800.0  # Median reply latency
+    LLM_STUB_LATENCY_SIGMA: float = 0.5  # Lognormal sigma, or +/- fraction for uniform
+    LLM_STUB_ERROR_RATE: float = 0.0
+    LLM_STUB_STREAM_CHUNK_DELAY_MS: float = 30.0
+    LLM_STUB_SEED: Optional[int] = None
     
+    # Background jobs (python -m backend.worker)
+    JOB_WORKER_CONCURRENCY: int = 4  # Jobs run concurrently per worker process
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF_SECONDS: float = 2.0  # Doubles with each attempt
+    JOB_TIMEOUT_SECONDS: float = 120.0
+    JOB_LEASE_SECONDS: int = 60  # Claimed jobs not renewed within this are requeued
+    JOB_CLAIM_POLL_INTERVAL_SECONDS: float = 0.2  # How often idle workers check for new jobs
+    JOB_TTL_SECONDS: int = 24 * 3600
+    JOB_DEDUP_TTL_SECONDS: int = 3600
+
+    # Outbound HTTP (weather, maps and search APIs)
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    HTTP_PER_HOST_LIMIT: int = 10  # Concurrent requests to any one host
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 3.0
+    HTTP_TIMEOUT_SECONDS: float = 10.0
+    HTTP_MAX_RETRIES: int = 2  # Retries on transport errors, 429 and 5xx
+    HTTP_RETRY_BACKOFF_SECONDS: float = 0.5  # Doubles with each retry
+    HTTP_RETRY_MAX_BACKOFF_SECONDS: float = 5.0
+
+    # Weather forecast cache (per geohash cell / place name and date)
+    WEATHER_CACHE_MAX_ENTRIES: int = 4096
+    WEATHER_CACHE_LOCAL_TTL_SECONDS: int = 600  # Capped by the entry's own TTL
+    WEATHER_CACHE_CURRENT_TTL_SECONDS: int = 600  # Current conditions
+    WEATHER_CACHE_TODAY_TTL_SECONDS: int = 1800
+    WEATHER_CACHE_NEAR_TTL_SECONDS: int = 3 * 3600  # 1-2 days ahead
+    WEATHER_CACHE_MID_TTL_SECONDS: int = 12 * 3600  # Up to the forecast horizon
+    WEATHER_CACHE_FAR_TTL_SECONDS: int = 7 * 24 * 3600  # Beyond it
+    WEATHER_FORECAST_HORIZON_DAYS: int = 5  # Days the provider forecasts; later dates use climate normals
+    WEATHER_GEOHASH_PRECISION: int = 5  # ~5km cells
+    CLIMATE_NORMALS_MAX_DISTANCE_KM: float = 150.0  # Coordinates further than this from any city have no normals
+
+    # Route matrix (per city pair and transport mode)
+    ROUTE_MATRIX_CACHE_MAX_ENTRIES: int = 8192
+    ROUTE_MATRIX_LOCAL_TTL_SECONDS: int = 3600
+    ROUTE_MATRIX_PROVIDER_TTL_SECONDS: int = 7 * 24 * 3600  # Distance Matrix API results
+    ROUTE_MATRIX_ESTIMATE_TTL_SECONDS: int = 24 * 3600  # Haversine baseline entries
+
     # Server Configuration
     ENVIRONMENT: str = "development"
     DEBUG: bool = True
@@ -24,9 +114,33 @@ class Settings(BaseSettings):
     # Database (MongoDB)
     MONGO_URI: str = "mongodb://localhost:27017"
     MONGO_DB_NAME: str = "globetrotter"
+    MONGO_MAX_POOL_SIZE: int = 100  # Connections per process
+    MONGO_MIN_POOL_SIZE: int = 10  # Kept open while idle
+    MONGO_MAX_IDLE_TIME_MS: int = 60000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 5000
 
     # Cache (Redis)
     REDIS_URL: str = "redis://localhost:6379/0"
+    REDIS_MAX_CONNECTIONS: int = 100  # Connection pool size per process
+    REDIS_WARMUP_CONNECTIONS: int = 10  # Opened at startup
+    CACHE_CODEC: str = "orjson"  # Conversation/context cache entries: json | orjson | msgpack
+    CACHE_COMPRESSION: str = "zstd"  # none | zlib | zstd
+    CACHE_COMPRESSION_THRESHOLD_BYTES: int = 1024  # Smaller entries are stored uncompressed
+    CACHE_COMPRESSION_LEVEL: int = 3
+    CONVERSATION_CACHE_MESSAGE_WINDOW: int = 200  # Most recent messages kept in each cached conversation
+    CONVERSATION_MESSAGE_BUCKET_SIZE: int = 100  # Messages per conversation_messages document
+    CONVERSATION_MIGRATION_ENABLED: bool = True  # Move embedded state.messages into buckets on startup
+    CONVERSATION_MIGRATION_BATCH_SIZE: int = 100
+    CONVERSATION_MIGRATION_PAUSE_SECONDS: float = 0.1  # Between batches
+
+    # Write-behind persistence of chat turns (Redis stream, flushed to Mongo in batches)
+    WRITE_BEHIND_ENABLED: bool = True  # False writes each turn straight to Mongo
+    WRITE_BEHIND_BATCH_SIZE: int = 200  # Writes per flush
+    WRITE_BEHIND_FLUSH_INTERVAL_SECONDS: float = 0.5  # Longest a write waits for its batch to fill
+    WRITE_BEHIND_LEASE_SECONDS: int = 30  # Streams of processes silent this long are replayed
+    WRITE_BEHIND_RECOVERY_INTERVAL_SECONDS: float = 60.0
+    WRITE_BEHIND_RETRY_BACKOFF_SECONDS: float = 0.5  # Doubles with each failed flush
+    WRITE_BEHIND_RETRY_MAX_BACKOFF_SECONDS: float = 30.0
     
     class Config:
         env_file = ".env"
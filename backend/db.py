@@ -12,12 +12,19 @@ from backend.config import settings
 _mongo_client: Optional[AsyncIOMotorClient] = None
 _db: Optional[AsyncIOMotorDatabase] = None
 _redis: Optional[aioredis.Redis] = None
+_binary_redis: Optional[aioredis.Redis] = None
 
 
 def _get_mongo_client() -> AsyncIOMotorClient:
     global _mongo_client
     if _mongo_client is None:
-        _mongo_client = AsyncIOMotorClient(settings.MONGO_URI)
+        _mongo_client = AsyncIOMotorClient(
+            settings.MONGO_URI,
+            maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+            minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+            serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        )
     return _mongo_client
 
 
@@ -32,7 +39,12 @@ def get_db() -> AsyncIOMotorDatabase:
 def _get_redis_client() -> aioredis.Redis:
     global _redis
     if _redis is None:
-        _redis = aioredis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+        _redis = aioredis.from_url(
+            settings.REDIS_URL,
+            encoding="utf-8",
+            decode_responses=True,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+        )
     return _redis
 
 
@@ -41,8 +53,20 @@ async def get_redis() -> aioredis.Redis:
     return _get_redis_client()
 
 
+async def get_binary_redis() -> aioredis.Redis:
+    """Client returning raw bytes, for values written by ``services.codec``"""
+    global _binary_redis
+    if _binary_redis is None:
+        _binary_redis = aioredis.from_url(
+            settings.REDIS_URL,
+            decode_responses=False,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+        )
+    return _binary_redis
+
+
 async def close_connections() -> None:
-    global _mongo_client, _db, _redis
+    global _mongo_client, _db, _redis, _binary_redis
     if _mongo_client is not None:
         _mongo_client.close()
         _mongo_client = None
@@ -50,3 +74,6 @@ async def close_connections() -> None:
     if _redis is not None:
         await _redis.close()
         _redis = None
+    if _binary_redis is not None:
+        await _binary_redis.close()
+        _binary_redis = None
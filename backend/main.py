@@ -1,10 +1,11 @@
 from fastapi import FastAPI, Depends, HTTPException, Request, Depends, status
 from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
-from typing import Dict, Any, List, Optional, Union
+from typing import Dict, Any, List, Optional, Union, AsyncIterator
+import asyncio
 import logging
 import os
 import json
@@ -17,16 +18,28 @@ from backend.api.endpoints import trips, cities, conversations
 # Add the project root to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from backend.agent.workflow import travel_agent, AgentState
+from backend.agent.workflow import travel_agent, AgentState, graph_node_stats
 from backend.models import TravelAssistantResponse, UIActions, TripPlan, Activity, DayPlan, CityVisit
 from backend.config import settings
-from backend.repositories import ConversationRepository
-from backend.db import close_connections
+from backend.auth import get_current_user
+from backend.repositories import ConversationRepository, repository_registry, get_conversation_repository
 from backend.services.blacklist_service import BlacklistService, BlacklistType
 from backend.services.context_service import ContextService
 from backend.services.multimodal_service import MultiModalService, VoiceInput
 from backend.services.advanced_ai_service import AdvancedAIService
+from backend.services.trip_extractor import trip_detail_extractor
+from backend.services.singleflight import llm_singleflight
+from backend.services.circuit_breaker import gemini_breaker
+from backend.services.gemini_service import hedge_stats
+from backend.services.job_queue import job_queue
+from backend.services.http_client import http_client
+from backend.services.weather_cache import weather_cache
+from backend.services.climate_normals import climate_normals
+from backend.services.route_matrix import route_matrix
+from backend.services.write_behind import write_behind
+from backend.services.codec import cache_codec
 from backend.repositories.city_repository import city_repository
+from backend.repositories.itinerary_store_repository import itinerary_store
 
 # Configure logging
 logging.basicConfig(level=logging.INFO if settings.DEBUG else logging.WARNING)
@@ -98,27 +111,29 @@ class ChatRequest(BaseModel):
     context: Optional[Dict[str, Any]] = Field(None, description="Additional context for the conversation")
     preferences: Optional[Dict[str, Any]] = Field(None, description="User travel preferences")
     stream: bool = Field(False, description="Whether to stream the response")
+    async_itinerary: bool = Field(False, description="Build the trip plan as a background job and return its job_id")
 
 class ChatResponse(BaseModel):
     message: str = Field(..., description="Assistant's response message")
     conversation_id: str = Field(..., description="Conversation ID")
     ui_actions: Optional[Dict[str, Any]] = Field(None, description="UI actions to perform")
     trip_plan: Optional[Dict[str, Any]] = Field(None, description="Generated trip plan")
+    job_id: Optional[str] = Field(None, description="Background job building the trip plan")
     timestamp: str = Field(default_factory=lambda: datetime.utcnow().isoformat())
 
 class HealthCheck(BaseModel):
     status: str
     version: str
     environment: str
+    llm_circuit: Optional[Dict[str, Any]] = None
 
-# Conversation repository will be initialized on startup
-conv_repo: Optional[ConversationRepository] = None
+# Background move of embedded conversation messages into buckets
+message_migration_task: Optional[asyncio.Task] = None
 
 # Helper function to get or create conversation
 async def get_conversation(conversation_id: Optional[str] = None) -> tuple[str, AgentState]:
     """Get or create a conversation stored in MongoDB/Redis."""
-    global conv_repo
-    assert conv_repo is not None, "Conversation repository not initialized"
+    conv_repo = repository_registry.conversations
     if conversation_id:
         existing = await conv_repo.get(conversation_id)
         if existing:
@@ -139,57 +154,159 @@ async def get_conversation(conversation_id: Optional[str] = None) -> tuple[str,
     await conv_repo.upsert(new_id, to_jsonable(state))
     return new_id, state
 
+async def persist_user_message(conv_repo: ConversationRepository, conv_id: str, message: str) -> Optional[Dict[str, Any]]:
+    """Persist the user's message before the assistant starts working on it.
+
+    Returns the conversation state without its messages (including any stored trip plan).
+    """
+    # Read first: this also warms the cache the message is then appended to
+    state = await conv_repo.get_fields(conv_id)
+    await write_behind.submit(conv_id, messages=[{
+        "role": "user",
+        "content": message,
+        "ts": datetime.utcnow().isoformat(),
+    }])
+    return state
+
+async def persist_chat_turn(chat_request: ChatRequest, conv_id: str, response: TravelAssistantResponse) -> None:
+    """Persist the assistant message, trip plan and conversation summary for one turn.
+
+    All three go to the write-behind buffer together: one Redis round trip here, and
+    Mongo is written in the background.
+    """
+    fields: Dict[str, Any] = {}
+    # Attach trip plan to state if present
+    if getattr(response, "trip_plan", None):
+        # Ensure all dates are JSON-serializable for Mongo
+        fields["trip_plan"] = jsonable_encoder(response.trip_plan)  # type: ignore[attr-defined]
+        if response.itinerary_state is not None:
+            fields["itinerary_state"] = jsonable_encoder(response.itinerary_state)
+    await write_behind.submit(
+        conv_id,
+        messages=[{
+            "role": "assistant",
+            "content": response.message,
+            "ts": datetime.utcnow().isoformat(),
+        }],
+        fields=fields,
+        # Conversation summary in context service (optional historical log)
+        history={
+            "user_id": chat_request.user_id,
+            "message": chat_request.message,
+            "response": response.message,
+            "trip_data": fields.get("trip_plan"),
+        },
+    )
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+async def submit_trip_plan_job(chat_request: ChatRequest, conv_id: str) -> Optional[str]:
+    """Queue the trip plan for this turn when the client asked for it asynchronously."""
+    if not chat_request.async_itinerary or not travel_agent._should_trigger_itinerary(chat_request.message):
+        return None
+    job, _ = await job_queue.submit("trip_plan", {
+        "message": chat_request.message,
+        "preferences": chat_request.preferences or {},
+        "conversation_id": conv_id,
+        "user_id": chat_request.user_id,
+    })
+    return job["id"]
+
+async def stream_chat(
+    chat_request: ChatRequest,
+    conv_id: str,
+    previous_state: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[str]:
+    """Stream reply tokens, then ui_actions and trip_plan events, as Server-Sent Events."""
+    final: Optional[TravelAssistantResponse] = None
+    text_parts: List[str] = []
+    try:
+        yield sse_event("start", {"conversation_id": conv_id})
+        job_id = await submit_trip_plan_job(chat_request, conv_id)
+        if job_id:
+            yield sse_event("job", {"job_id": job_id})
+        async for event, payload in travel_agent.stream_message(
+            message=chat_request.message,
+            user_id=chat_request.user_id,
+            session_id=conv_id,
+            user_preferences=chat_request.preferences or {},
+            plan_trip=job_id is None,
+            previous_state=previous_state
+        ):
+            if event == "token":
+                text_parts.append(payload)
+                yield sse_event("token", {"text": payload})
+            elif event == "done":
+                final = payload
+            else:
+                yield sse_event(event, payload)
+        yield sse_event("done", {
+            "conversation_id": conv_id,
+            "timestamp": datetime.utcnow().isoformat(),
+        })
+    except Exception as e:
+        logger.error(f"Error streaming chat: {str(e)}", exc_info=True)
+        yield sse_event("error", {"detail": f"Error processing your request: {str(e)}"})
+    finally:
+        # Persist whatever was produced, even if the client disconnected mid-stream
+        if final is None and text_parts:
+            final = TravelAssistantResponse(message="".join(text_parts), conversation_id=conv_id)
+        if final is not None:
+            try:
+                # Shielded so a client disconnect doesn't cancel the write
+                await asyncio.shield(persist_chat_turn(chat_request, conv_id, final))
+            except Exception as e:
+                logger.error(f"Error persisting streamed chat turn: {str(e)}")
+
 @app.post(f"{settings.API_PREFIX}/chat", response_model=ChatResponse)
-async def chat(chat_request: ChatRequest):
-    """Handle chat messages and return assistant responses using AI Travel Planning Agent."""
+async def chat(
+    chat_request: ChatRequest,
+    conv_repo: ConversationRepository = Depends(get_conversation_repository)
+):
+    """Handle chat messages and return assistant responses using AI Travel Planning Agent.
+
+    With ``stream=true`` the reply is sent as Server-Sent Events: ``start``, a series
+    of ``token`` events, then ``ui_actions`` and ``trip_plan`` when a plan was built,
+    and finally ``done`` (or ``error``).
+    """
     try:
         # Resolve conversation ID
         conv_id = chat_request.conversation_id or f"session_{datetime.utcnow().timestamp()}"
 
-        # Persist user message to conversation history
-        if conv_repo is not None:
-            await conv_repo.append_message(conv_id, {
-                "role": "user",
-                "content": chat_request.message,
-                "ts": datetime.utcnow().isoformat(),
-            })
+        # Persist user message to conversation history; the state carries any previous trip plan
+        previous_state = await persist_user_message(conv_repo, conv_id, chat_request.message)
+
+        if chat_request.stream:
+            return StreamingResponse(
+                stream_chat(chat_request, conv_id, previous_state),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        # With async_itinerary the trip plan is built by a worker; poll /api/jobs/{job_id}
+        job_id = await submit_trip_plan_job(chat_request, conv_id)
 
         # Process message through the AI Travel Planning Agent workflow
         response = await travel_agent.process_message(
             message=chat_request.message,
             user_id=chat_request.user_id,
             session_id=conv_id,
-            user_preferences=chat_request.preferences or {}
+            user_preferences=chat_request.preferences or {},
+            plan_trip=job_id is None,
+            previous_state=previous_state
         )
 
-        # Persist assistant message and any trip plan into conversation state
-        if conv_repo is not None:
-            state = await conv_repo.append_message(conv_id, {
-                "role": "assistant",
-                "content": response.message,
-                "ts": datetime.utcnow().isoformat(),
-            })
-            # Attach trip plan to state if present
-            if getattr(response, "trip_plan", None):
-                # Ensure all dates are JSON-serializable for Mongo
-                state["trip_plan"] = jsonable_encoder(response.trip_plan)  # type: ignore[attr-defined]
-                await conv_repo.upsert(conv_id, state)
-
-        # Update conversation summary in context service (optional historical log)
-        await context_service.update_conversation_history(
-            user_id=chat_request.user_id,
-            session_id=conv_id,
-            message=chat_request.message,
-            response=response.message,
-            trip_data=(jsonable_encoder(response.trip_plan) if getattr(response, "trip_plan", None) else None)
-        )
+        await persist_chat_turn(chat_request, conv_id, response)
 
         # Convert to ChatResponse format
         chat_response = ChatResponse(
             conversation_id=conv_id,
             message=response.message,
             ui_actions=(response.ui_actions.model_dump() if response.ui_actions else None),
-            trip_plan=(jsonable_encoder(response.trip_plan) if getattr(response, "trip_plan", None) else None)
+            trip_plan=(jsonable_encoder(response.trip_plan) if getattr(response, "trip_plan", None) else None),
+            job_id=job_id
         )
 
         return chat_response
@@ -204,12 +321,69 @@ async def chat(chat_request: ChatRequest):
 @app.get(f"{settings.API_PREFIX}/health", response_model=HealthCheck)
 async def health_check():
     """Health check endpoint."""
+    llm_circuit = gemini_breaker.snapshot()
     return {
-        "status": "healthy",
+        "status": "degraded" if llm_circuit["state"] == "open" else "healthy",
         "version": settings.VERSION,
-        "environment": settings.ENVIRONMENT
+        "environment": settings.ENVIRONMENT,
+        "llm_circuit": llm_circuit
+    }
+
+@app.get(f"{settings.API_PREFIX}/metrics")
+async def get_metrics():
+    """Runtime counters for fast paths and caches."""
+    return {
+        "trip_extractor": trip_detail_extractor.stats(),
+        "llm_singleflight": llm_singleflight.stats(),
+        "travel_tips_cache": advanced_ai_service.tips_cache.stats(),
+        "itinerary_store": itinerary_store.stats(),
+        "llm_hedging": dict(hedge_stats),
+        "agent_graph": {name: dict(stats) for name, stats in graph_node_stats.items()},
+        "http": http_client.stats(),
+        "weather_cache": weather_cache.stats(),
+        "climate_normals": climate_normals.stats(),
+        "route_matrix": route_matrix.stats(),
+        "write_behind": write_behind.stats(),
+        "connection_warmup": repository_registry.warmup,
+        "cache_codec": cache_codec.stats()
     }
 
+# Background job endpoints (jobs are run by `python -m backend.worker`)
+@app.post(f"{settings.API_PREFIX}/jobs/itinerary", status_code=status.HTTP_202_ACCEPTED)
+async def submit_itinerary_job(user_input: Dict[str, Any]):
+    """Queue itinerary generation and return the job id right away."""
+    try:
+        job, created = await job_queue.submit("itinerary", user_input)
+        return {"job_id": job["id"], "status": job["status"], "deduplicated": not created}
+    except Exception as e:
+        logger.error(f"Error submitting itinerary job: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get(f"{settings.API_PREFIX}/jobs/{{job_id}}")
+async def get_job(job_id: str):
+    """Job status with any partial result, and the final result once it succeeded."""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job.pop("payload", None)
+    return job
+
+@app.get(f"{settings.API_PREFIX}/jobs/{{job_id}}/events")
+async def job_events(job_id: str):
+    """Job status, partial results and the final result as Server-Sent Events."""
+    if await job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events() -> AsyncIterator[str]:
+        async for event in job_queue.events(job_id):
+            yield sse_event(event.get("status", "update"), event)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # Blacklist Management Endpoints
 class BlacklistRequest(BaseModel):
     user_id: str = Field(..., description="User ID")
@@ -428,6 +602,45 @@ async def generate_travel_tips(request: TravelTipsRequest):
         logger.error(f"Error generating travel tips: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.delete(f"{settings.API_PREFIX}/admin/cache/travel-tips/{{destination}}")
+async def purge_travel_tips_cache(destination: str, current_user: dict = Depends(get_current_user)):
+    """Purge cached AI travel tips for a destination (Admin only)"""
+    if not current_user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    try:
+        purged = await advanced_ai_service.purge_travel_tips(destination)
+        return {"status": "success", "destination": destination, "purged": purged}
+        
+    except Exception as e:
+        logger.error(f"Error purging travel tips cache: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get(f"{settings.API_PREFIX}/admin/itinerary-store")
+async def get_itinerary_store_entries(limit: int = 20, current_user: dict = Depends(get_current_user)):
+    """Most reused stored itineraries with their usage stats (Admin only)"""
+    if not current_user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    try:
+        entries = await itinerary_store.top_entries(limit=min(max(1, limit), 100))
+        return {"status": "success", "entries": jsonable_encoder(entries), **itinerary_store.stats()}
+        
+    except Exception as e:
+        logger.error(f"Error reading itinerary store: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete(f"{settings.API_PREFIX}/admin/itinerary-store/{{key}}")
+async def delete_itinerary_store_entry(key: str, current_user: dict = Depends(get_current_user)):
+    """Drop a stored itinerary so the next identical request generates a new one (Admin only)"""
+    if not current_user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    try:
+        deleted = await itinerary_store.invalidate(key)
+        return {"status": "success", "key": key, "deleted": deleted}
+        
+    except Exception as e:
+        logger.error(f"Error deleting itinerary store entry: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 class ItineraryOptimizationRequest(BaseModel):
     itinerary: Dict[str, Any] = Field(..., description="Current itinerary")
     preferences: Dict[str, Any] = Field(default_factory=dict, description="User preferences")
@@ -447,14 +660,40 @@ async def optimize_itinerary_timing(request: ItineraryOptimizationRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/generate-itinerary")
-async def generate_itinerary_endpoint(user_input: Dict[str, Any]):
-    """Generate itinerary matching the frontend service call."""
+async def generate_itinerary_endpoint(user_input: Dict[str, Any], async_job: bool = False):
+    """Generate itinerary matching the frontend service call.
+
+    With ``?async_job=true`` the work is queued and a job id is returned instead.
+    """
+    if async_job:
+        return await submit_itinerary_job(user_input)
     try:
-        result = itinerary_generator.generate_itinerary(user_input)
+        result = await itinerary_generator.generate_itinerary(user_input)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate-itinerary/stream")
+async def stream_itinerary_endpoint(user_input: Dict[str, Any]):
+    """Same itinerary as /generate-itinerary, sent as Server-Sent Events while it is written.
+
+    Emits ``activity`` and ``day`` events as each object completes, then ``itinerary``
+    with the whole validated document (or ``error``).
+    """
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event in itinerary_generator.stream_itinerary(user_input):
+                yield sse_event(event.pop("type"), event)
+        except Exception as e:
+            logger.error(f"Error streaming itinerary: {e}")
+            yield sse_event("error", {"message": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.get("/")
 async def root():
     """Root endpoint with API documentation."""
@@ -467,22 +706,61 @@ async def root():
 
 @app.on_event("startup")
 async def on_startup():
-    global conv_repo
-    conv_repo = await ConversationRepository.create()
+    global message_migration_task
+    # Shared repositories and warm connection pools before the first request
+    await repository_registry.startup()
+    conv_repo = repository_registry.conversations
+    try:
+        await conv_repo.ensure_indexes()
+    except Exception as e:
+        logger.warning(f"Failed to ensure conversation message indexes: {e}")
+    if settings.CONVERSATION_MIGRATION_ENABLED:
+        message_migration_task = asyncio.create_task(conv_repo.migrate_embedded_messages())
     # Ensure DB indexes for cities are created on startup
     try:
         await city_repository.ensure_indexes()
     except Exception as e:
         logger.warning(f"Failed to ensure city indexes: {e}")
+    try:
+        await itinerary_store.ensure_indexes()
+    except Exception as e:
+        logger.warning(f"Failed to ensure itinerary store indexes: {e}")
+    try:
+        await travel_agent.ensure_indexes()
+    except Exception as e:
+        logger.warning(f"Failed to ensure graph checkpoint indexes: {e}")
+    # Load destination names for the rule-based trip extractor
+    try:
+        await trip_detail_extractor.load_gazetteer()
+    except Exception as e:
+        logger.warning(f"Failed to load trip extractor gazetteer: {e}")
+    # Month-by-city climate matrices for dates beyond the forecast range
+    try:
+        await climate_normals.load_from_db()
+    except Exception as e:
+        logger.warning(f"Failed to load climate normals: {e}")
+    try:
+        await route_matrix.load_from_db()
+    except Exception as e:
+        logger.warning(f"Failed to load route matrix coordinates: {e}")
     # Initialize async services
     try:
         await context_service.init()
     except Exception as e:
         logger.warning(f"Failed to initialize context service: {e}")
+    # Chat turns are buffered in Redis and flushed to Mongo in batches
+    try:
+        await write_behind.start(conv_repo, context_service)
+    except Exception as e:
+        logger.warning(f"Failed to start write-behind persistence, writing through: {e}")
 
 @app.on_event("shutdown")
 async def on_shutdown():
-    await close_connections()
+    if message_migration_task is not None:
+        message_migration_task.cancel()
+    await write_behind.stop()
+    await http_client.close()
+    await repository_registry.shutdown()
 
 if __name__ == "__main__":
     import uvicorn
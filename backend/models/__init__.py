@@ -83,3 +83,4 @@ class TravelAssistantResponse(BaseModel):
     trip: Optional[TripPlan] = None  # Keep for backward compatibility
     pdf_payload: Optional[Dict[str, str]] = None  # title, content_html
     conversation_id: Optional[str] = None
+    itinerary_state: Optional[Dict[str, Any]] = None  # Stored with trip_plan to patch it on later turns
@@ -18,6 +18,10 @@ class CityModel(BaseModel):
     languages: List[str] = []
     best_time_to_visit: List[str] = []
     avg_temperature: Dict[str, float] = {}  # Month: temperature
+    avg_temperature_min: Dict[str, float] = {}  # Month: mean daily low
+    avg_temperature_max: Dict[str, float] = {}  # Month: mean daily high
+    avg_precipitation_mm: Dict[str, float] = {}  # Month: total precipitation
+    avg_humidity: Dict[str, float] = {}  # Month: relative humidity (%)
     must_see_attractions: List[Dict[str, Any]] = []
     local_cuisine: List[str] = []
     safety_rating: float = 0.0
@@ -2,5 +2,10 @@
 from .city_repository import city_repository
 from .trip_repository import trip_repository
 from .conversation_repository import ConversationRepository
+from .itinerary_store_repository import itinerary_store
+from .registry import RepositoryRegistry, repository_registry, get_conversation_repository
 
-__all__ = ['city_repository', 'trip_repository', 'ConversationRepository']
+__all__ = [
+    'city_repository', 'trip_repository', 'ConversationRepository', 'itinerary_store',
+    'RepositoryRegistry', 'repository_registry', 'get_conversation_repository',
+]
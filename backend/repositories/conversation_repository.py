@@ -1,172 +1,625 @@
 from __future__ import annotations
 
-import json
-from typing import Optional, Dict, Any
-from datetime import timedelta
+import asyncio
+import logging
+from typing import Optional, Dict, Any, List, Set, Tuple, Callable, Awaitable
+from datetime import datetime, timedelta
 
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, IndexModel, ASCENDING, ReplaceOne, DeleteMany, UpdateOne
+from pymongo.errors import BulkWriteError
 from redis import asyncio as aioredis
-from pymongo import ReturnDocument
 
-from backend.db import get_db, get_redis
+from backend.config import settings
+from backend.db import get_db, get_binary_redis
+from backend.services.codec import cache_codec
+
+logger = logging.getLogger(__name__)
 
 CONV_CACHE_TTL_SECONDS = int(timedelta(days=1).total_seconds())
 
+# Meta hash field holding the total number of messages (the cached list may be a trimmed window)
+MESSAGE_COUNT_FIELD = "__message_count"
+
+# Appends to the cached message window, but only while the cache is warm: a cold cache is
+# rebuilt from Mongo on the next read, and a partial list must not be mistaken for a full one.
+_APPEND_MESSAGE_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    return -1
+end
+redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[2]), -1)
+local count = redis.call('HINCRBY', KEYS[2], ARGV[3], 1)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return count
+"""
+
+# Sets state fields in the meta hash, only while the cache is warm
+_SET_FIELDS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
 
 class ConversationRepository:
+    """Conversation state in Mongo, cached in Redis as a message list plus a field hash.
+
+    Messages are not embedded in the conversation document: they live in the
+    ``conversation_messages`` collection in buckets of ``CONVERSATION_MESSAGE_BUCKET_SIZE``
+    (one document per ``conversation_id`` / ``bucket_seq``), and the conversation keeps
+    only the other state fields and ``message_count``. Message ``i`` is in bucket
+    ``i // size``, so any page of history is read from the one or two buckets covering it.
+    Documents from before the split (``state.messages``, no ``message_count``) are
+    migrated when first touched, or in the background by ``migrate_embedded_messages``.
+
+    ``conv:{id}:messages`` holds the last ``CONVERSATION_CACHE_MESSAGE_WINDOW`` messages and
+    ``conv:{id}:meta`` the other state fields and the message count, so appending a
+    message or setting a field costs the same however long the chat is. Cached values are
+    encoded with ``cache_codec``, so ``redis`` must be a binary (non-decoding) client.
+    """
+
     def __init__(self, db: AsyncIOMotorDatabase, redis: aioredis.Redis):
         self.db = db
         self.redis = redis
         self.collection = self.db["conversations"]
+        self.messages = self.db["conversation_messages"]
+        self.bucket_size = max(1, settings.CONVERSATION_MESSAGE_BUCKET_SIZE)
 
     @classmethod
     async def create(cls) -> "ConversationRepository":
         db = get_db()
-        redis = await get_redis()
+        redis = await get_binary_redis()
         return cls(db, redis)
 
-    def _cache_key(self, conversation_id: str) -> str:
-        return f"conv:{conversation_id}"
+    async def ensure_indexes(self):
+        """Create necessary indexes for the message buckets (idempotent)"""
+        indexes = [
+            IndexModel([("conversation_id", ASCENDING), ("bucket_seq", ASCENDING)], name="conversation_bucket", unique=True),
+        ]
+        await self.messages.create_indexes(indexes)
+
+    def _messages_key(self, conversation_id: str) -> str:
+        return f"conv:{conversation_id}:messages"
+
+    def _meta_key(self, conversation_id: str) -> str:
+        return f"conv:{conversation_id}:meta"
+
+    async def _cache_state(
+        self, conversation_id: str, fields: Dict[str, Any], messages: List[Dict[str, Any]], count: int
+    ) -> None:
+        """Replace the cached representation: state ``fields``, the tail of ``messages`` and the total ``count``"""
+        window = messages[-settings.CONVERSATION_CACHE_MESSAGE_WINDOW:]
+        meta = {key: cache_codec.encode(value) for key, value in fields.items() if key != "messages"}
+        meta[MESSAGE_COUNT_FIELD] = count
+        messages_key, meta_key = self._messages_key(conversation_id), self._meta_key(conversation_id)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(messages_key, meta_key)
+                if window:
+                    pipe.rpush(messages_key, *(cache_codec.encode(message) for message in window))
+                    pipe.expire(messages_key, CONV_CACHE_TTL_SECONDS)
+                pipe.hset(meta_key, mapping=meta)
+                pipe.expire(meta_key, CONV_CACHE_TTL_SECONDS)
+                await pipe.execute()
+        except Exception:
+            pass
+
+    async def _invalidate(self, conversation_id: str) -> None:
+        try:
+            await self.redis.delete(self._messages_key(conversation_id), self._meta_key(conversation_id))
+        except Exception:
+            pass
+
+    async def _write_buckets(self, conversation_id: str, messages: List[Dict[str, Any]]) -> None:
+        """Replace every bucket of a conversation with ``messages``"""
+        now = datetime.utcnow()
+        size = self.bucket_size
+        operations: List[Any] = [
+            ReplaceOne(
+                {"conversation_id": conversation_id, "bucket_seq": seq},
+                {
+                    "conversation_id": conversation_id,
+                    "bucket_seq": seq,
+                    "count": len(messages[seq * size:(seq + 1) * size]),
+                    "messages": messages[seq * size:(seq + 1) * size],
+                    "updated_at": now,
+                },
+                upsert=True,
+            )
+            for seq in range((len(messages) + size - 1) // size)
+        ]
+        operations.append(DeleteMany({"conversation_id": conversation_id, "bucket_seq": {"$gte": len(operations)}}))
+        await self.messages.bulk_write(operations, ordered=True)
+
+    async def _insert_buckets(self, conversation_id: str, messages: List[Dict[str, Any]]) -> None:
+        """Create the buckets holding ``messages``, leaving any bucket that already exists untouched"""
+        now = datetime.utcnow()
+        size = self.bucket_size
+        operations = [
+            UpdateOne(
+                {"conversation_id": conversation_id, "bucket_seq": seq},
+                {"$setOnInsert": {
+                    "count": len(messages[seq * size:(seq + 1) * size]),
+                    "messages": messages[seq * size:(seq + 1) * size],
+                    "updated_at": now,
+                }},
+                upsert=True,
+            )
+            for seq in range((len(messages) + size - 1) // size)
+        ]
+        if not operations:
+            return
+        try:
+            await self.messages.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Another writer created the same bucket first, which is all this wanted
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+
+    async def _read_range(self, conversation_id: str, start: int, end: int) -> List[Dict[str, Any]]:
+        """Messages ``start`` (inclusive) to ``end`` (exclusive), reading only the buckets that hold them"""
+        if end <= start:
+            return []
+        size = self.bucket_size
+        first, last = start // size, (end - 1) // size
+        cursor = self.messages.find(
+            {"conversation_id": conversation_id, "bucket_seq": {"$gte": first, "$lte": last}},
+            {"bucket_seq": 1, "messages": 1},
+        ).sort("bucket_seq", ASCENDING)
+        messages: List[Dict[str, Any]] = []
+        async for bucket in cursor:
+            base = bucket["bucket_seq"] * size
+            for offset, message in enumerate(bucket.get("messages") or []):
+                # Slots reserved by a write that hasn't landed yet are null
+                if message is not None and start <= base + offset < end:
+                    messages.append(message)
+        return messages
+
+    async def migrate_conversation(self, conversation_id: str) -> bool:
+        """Move a conversation's embedded ``state.messages`` into buckets; True if it needed it.
+
+        A missing conversation is created empty. Safe to run concurrently and alongside
+        live appends: buckets are only ever inserted, never replaced or deleted, so a
+        migration that lost the race to another (which then switched the document over and
+        let appends write to the buckets) changes nothing, and the document is only switched
+        over once.
+        """
+        doc = await self.collection.find_one({"_id": conversation_id}, {"state": 1, "message_count": 1})
+        if doc is None:
+            await self.collection.update_one(
+                {"_id": conversation_id},
+                {"$setOnInsert": {"state": {}, "message_count": 0}},
+                upsert=True,
+            )
+            return False
+        if "message_count" in doc:
+            return False
+        state = doc.get("state")
+        messages = (state.get("messages") if isinstance(state, dict) else None) or []
+        await self._insert_buckets(conversation_id, messages)
+        update: Dict[str, Any] = {"$set": {"message_count": len(messages)}}
+        if isinstance(state, dict):
+            update["$unset"] = {"state.messages": ""}
+        else:
+            # 'state' may be null on older documents
+            update["$set"]["state"] = {}
+        result = await self.collection.update_one({"_id": conversation_id, "message_count": {"$exists": False}}, update)
+        return result.modified_count > 0
+
+    async def migrate_embedded_messages(self, batch_size: Optional[int] = None) -> int:
+        """Migrate every conversation still holding embedded messages; returns how many were moved"""
+        batch_size = batch_size or settings.CONVERSATION_MIGRATION_BATCH_SIZE
+        migrated = 0
+        failed: List[str] = []
+        while True:
+            cursor = self.collection.find({"message_count": {"$exists": False}, "_id": {"$nin": failed}}, {"_id": 1})
+            ids = [doc["_id"] async for doc in cursor.limit(batch_size)]
+            if not ids:
+                break
+            for conversation_id in ids:
+                try:
+                    if await self.migrate_conversation(conversation_id):
+                        migrated += 1
+                except Exception as e:
+                    logger.warning(f"Failed to migrate messages of conversation {conversation_id}: {e}")
+                    failed.append(conversation_id)
+            # Leave room for live traffic between batches
+            await asyncio.sleep(settings.CONVERSATION_MIGRATION_PAUSE_SECONDS)
+        if migrated or failed:
+            logger.info(f"Migrated messages of {migrated} conversations into buckets ({len(failed)} failed)")
+        return migrated
+
+    async def _load_from_mongo(
+        self, conversation_id: str, with_messages: bool, refresh_cache: bool = True
+    ) -> Tuple[Optional[Dict[str, Any]], int]:
+        """State (with every message if ``with_messages``) and message count; None if there is none"""
+        try:
+            doc = await self.collection.find_one({"_id": conversation_id}, {"state": 1, "message_count": 1})
+            if doc is not None and "message_count" not in doc:
+                await self.migrate_conversation(conversation_id)
+                doc = await self.collection.find_one({"_id": conversation_id}, {"state": 1, "message_count": 1})
+            if not doc:
+                return None, 0
+            count = int(doc.get("message_count") or 0)
+            fields = {key: value for key, value in (doc.get("state") or {}).items() if key != "messages"}
+            if with_messages:
+                messages = await self._read_range(conversation_id, 0, count)
+            elif refresh_cache:
+                messages = await self._read_range(
+                    conversation_id, max(0, count - settings.CONVERSATION_CACHE_MESSAGE_WINDOW), count
+                )
+            else:
+                messages = []
+        except Exception:
+            # Mongo unavailable; no cached state
+            return None, 0
+        if refresh_cache:
+            await self._cache_state(conversation_id, fields, messages, count)
+        if with_messages:
+            return {**fields, "messages": messages}, count
+        return fields, count
+
+    async def _read_cache(self, conversation_id: str, with_messages: bool) -> Tuple[Optional[Dict[str, Any]], int]:
+        """Cached state (None if the cache is cold) and how many older messages it lacks.
+
+        With ``with_messages`` the state holds the cached window of messages; the first
+        ``missing`` messages of the conversation were trimmed from it.
+        """
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hgetall(self._meta_key(conversation_id))
+                if with_messages:
+                    pipe.lrange(self._messages_key(conversation_id), 0, -1)
+                results = await pipe.execute()
+        except Exception:
+            return None, 0
+        # Field names arrive as bytes from the binary client
+        meta = {key.decode() if isinstance(key, bytes) else key: value for key, value in results[0].items()}
+        if not meta:
+            return None, 0
+        try:
+            count = int(meta.pop(MESSAGE_COUNT_FIELD, 0))
+            state = {key: cache_codec.decode(value) for key, value in meta.items()}
+            missing = 0
+            if with_messages:
+                state["messages"] = [cache_codec.decode(message) for message in results[1]]
+                missing = max(0, count - len(state["messages"]))
+        except Exception:
+            # ignore cache parse errors
+            return None, 0
+        return state, missing
 
     async def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Full state including every message; prefer ``get_fields`` / ``get_message_page``"""
         # Try Redis first
-        cached = await self.redis.get(self._cache_key(conversation_id))
-        if cached:
-            try:
-                return json.loads(cached)
-            except Exception:
-                # ignore cache parse errors
-                pass
-        # Fallback to Mongo (async)
+        cached, missing = await self._read_cache(conversation_id, with_messages=True)
+        if cached is not None:
+            if missing:
+                # Older messages trimmed from the window are read from their buckets; the
+                # cached fields and window stay authoritative, as they may not be flushed yet
+                try:
+                    older = await self._read_range(conversation_id, 0, missing)
+                except Exception:
+                    older = []
+                cached["messages"] = older + cached["messages"]
+            return cached
+        # Fallback to Mongo (async); refreshes the cold cache
+        state, _ = await self._load_from_mongo(conversation_id, with_messages=True)
+        return state
+
+    async def get_fields(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """State without the message history (trip plan, itinerary state, context, ...)"""
+        cached, _ = await self._read_cache(conversation_id, with_messages=False)
+        if cached is not None:
+            return cached
+        state, _ = await self._load_from_mongo(conversation_id, with_messages=False)
+        return state
+
+    async def get_message_page(
+        self, conversation_id: str, limit: int, before: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Up to ``limit`` messages ending just before index ``before`` (default: the newest).
+
+        Returns ``{"messages", "start", "total", "has_more"}``; ``start`` is the index of
+        the first message returned, so ``before=start`` fetches the previous page.
+        None if the conversation doesn't exist.
+        """
+        limit = max(0, limit)
+        count: Optional[int] = None
+        window: Optional[List[Dict[str, Any]]] = None
         try:
-            doc = await self.collection.find_one({"_id": conversation_id})
-            if not doc:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hget(self._meta_key(conversation_id), MESSAGE_COUNT_FIELD)
+                pipe.lrange(self._messages_key(conversation_id), -max(limit, 1), -1)
+                cached_count, cached_messages = await pipe.execute()
+            if cached_count is not None:
+                count = int(cached_count)
+                window = [cache_codec.decode(message) for message in cached_messages]
+        except Exception:
+            pass
+        if count is None:
+            state, count = await self._load_from_mongo(conversation_id, with_messages=False)
+            if state is None:
                 return None
-            state = doc.get("state") or {}
-            # refresh cache
+
+        end = count if before is None else max(0, min(before, count))
+        start = max(0, end - limit)
+        if end == count and window is not None and len(window) >= end - start:
+            messages = window[len(window) - (end - start):] if end > start else []
+        else:
             try:
-                await self.redis.set(self._cache_key(conversation_id), json.dumps(state), ex=CONV_CACHE_TTL_SECONDS)
+                messages = await self._read_range(conversation_id, start, end)
             except Exception:
-                pass
-            return state
+                messages = []
+        return {"messages": messages, "start": start, "total": count, "has_more": start > 0}
+
+    async def get_messages(self, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+        """The last ``limit`` messages (all of them if ``limit`` <= 0)"""
+        if limit <= 0:
+            state = await self.get(conversation_id) or {}
+            return state.get("messages") or []
+        page = await self.get_message_page(conversation_id, limit)
+        return page["messages"] if page else []
+
+    async def _replace_state(
+        self, conversation_id: str, state: Dict[str, Any], on_insert: Optional[Dict[str, Any]] = None
+    ) -> None:
+        messages = state.get("messages") or []
+        fields = {key: value for key, value in state.items() if key != "messages"}
+        try:
+            await self._write_buckets(conversation_id, messages)
+            update: Dict[str, Any] = {"$set": {"state": fields, "message_count": len(messages)}}
+            if on_insert:
+                update["$setOnInsert"] = on_insert
+            await self.collection.update_one({"_id": conversation_id}, update, upsert=True)
         except Exception:
-            # Mongo unavailable; no cached state
-            return None
+            # ignore Mongo errors and proceed with cache-only
+            pass
+        await self._cache_state(conversation_id, fields, messages, len(messages))
 
     async def upsert(self, conversation_id: str, state: Dict[str, Any]) -> None:
+        await self._replace_state(conversation_id, state)
+
+    async def set_fields(self, conversation_id: str, fields: Dict[str, Any]) -> None:
+        """Set top-level state fields (not ``messages``) without rewriting the rest of the state"""
+        fields = {key: value for key, value in fields.items() if key != "messages"}
+        if not fields:
+            return
         try:
             await self.collection.update_one(
                 {"_id": conversation_id},
-                {"$set": {"state": state}},
+                {"$set": {f"state.{key}": value for key, value in fields.items()}},
                 upsert=True,
             )
         except Exception:
-            # ignore Mongo errors and proceed with cache-only
             pass
         try:
-            await self.redis.set(self._cache_key(conversation_id), json.dumps(state), ex=CONV_CACHE_TTL_SECONDS)
+            args: List[Any] = [CONV_CACHE_TTL_SECONDS]
+            for key, value in fields.items():
+                args.extend([key, cache_codec.encode(value)])
+            await self.redis.eval(_SET_FIELDS_SCRIPT, 1, self._meta_key(conversation_id), *args)
         except Exception:
             pass
 
     async def create_conversation(self, conversation_id: str, state: Dict[str, Any], user_id: Optional[str] = None) -> None:
-        doc = {
-            "_id": conversation_id,
-            "state": state,
-            "user_id": user_id,
-        }
-        try:
-            await self.collection.update_one({"_id": conversation_id}, {"$setOnInsert": doc, "$set": {"state": state}}, upsert=True)
-        except Exception:
-            pass
-        try:
-            await self.redis.set(self._cache_key(conversation_id), json.dumps(state), ex=CONV_CACHE_TTL_SECONDS)
-        except Exception:
-            pass
+        await self._replace_state(conversation_id, state, on_insert={"user_id": user_id})
 
     async def delete(self, conversation_id: str) -> bool:
         try:
             res = await self.collection.delete_one({"_id": conversation_id})
             deleted = res.deleted_count > 0
+            await self.messages.delete_many({"conversation_id": conversation_id})
         except Exception:
             deleted = True  # consider deleted in cache-only mode
-        try:
-            await self.redis.delete(self._cache_key(conversation_id))
-        except Exception:
-            pass
+        await self._invalidate(conversation_id)
         return deleted
 
     async def clear(self, conversation_id: str) -> bool:
         modified = True
         try:
-            update = await self.collection.update_one({"_id": conversation_id}, {"$set": {"state": {}}})
+            update = await self.collection.update_one(
+                {"_id": conversation_id}, {"$set": {"state": {}, "message_count": 0}}
+            )
             modified = update.modified_count > 0
+            await self.messages.delete_many({"conversation_id": conversation_id})
         except Exception:
             pass
-        try:
-            await self.redis.delete(self._cache_key(conversation_id))
-        except Exception:
-            pass
+        await self._invalidate(conversation_id)
         return modified
 
     async def list_by_user(self, user_id: str, limit: int = 20, skip: int = 0) -> list[Dict[str, Any]]:
         try:
-            cursor = self.collection.find({"user_id": user_id}).skip(skip).limit(limit).sort("_id")
+            cursor = self.collection.find({"user_id": user_id}, {"state": 1, "message_count": 1}).skip(skip).limit(limit).sort("_id")
             results: list[Dict[str, Any]] = []
             async for doc in cursor:
                 results.append({
                     "conversation_id": doc.get("_id"),
-                    "has_state": bool(doc.get("state")),
+                    "has_state": bool(doc.get("state") or doc.get("message_count")),
                 })
             return results
         except Exception:
             # In cache-only mode we cannot list by user from Mongo
             return []
 
-    async def append_message(self, conversation_id: str, message: Dict[str, Any]) -> Dict[str, Any]:
-        # Strategy: avoid conflicting updates on 'state' and 'state.messages' in the same operation.
-        # 1) Try to push to an existing messages array.
-        try:
-            update_result = await self.collection.find_one_and_update(
-                {"_id": conversation_id, "state.messages": {"$type": "array"}},
-                {"$push": {"state.messages": message}},
-                upsert=False,
+    async def _reserve(self, conversation_id: str, update: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply ``update`` to the conversation document; returns it with only ``message_count``"""
+        async def apply() -> Optional[Dict[str, Any]]:
+            return await self.collection.find_one_and_update(
+                {"_id": conversation_id, "message_count": {"$exists": True}},
+                update,
+                projection={"message_count": 1},
                 return_document=ReturnDocument.AFTER,
             )
-        except Exception:
-            update_result = None
 
-        # 2) If no document or messages not initialized, initialize with the first message in a separate upsert.
-        if not update_result:
-            # Try initialize in Mongo; if it fails, fall back to Redis-only
+        doc = await apply()
+        if doc is None:
+            # New conversation, or one still holding embedded messages
+            await self.migrate_conversation(conversation_id)
+            doc = await apply()
+        return doc
+
+    async def _stored_ids(self, conversation_id: str, count: int, depth: int) -> Set[str]:
+        """Ids of the last ``depth`` stored messages"""
+        tail = await self._read_range(conversation_id, max(0, count - depth), count)
+        return {message.get("id") for message in tail if message.get("id")}
+
+    async def apply_writes(
+        self,
+        writes: List[Dict[str, Any]],
+        replay: bool = False,
+        on_reserved: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None,
+    ) -> None:
+        """Apply buffered writes (``{"conversation_id", "messages", "fields"}``) to Mongo, in order.
+
+        Each conversation costs one update (reserving the message indexes and setting the
+        fields), run concurrently; the messages of every conversation are then written
+        into their slots with one bulk_write.
+        The reserved indexes are recorded on each write as ``positions`` (None for a
+        message already stored), and a write that has them reuses them instead of
+        reserving again, so retrying after a failed bulk_write fills the same slots.
+        ``on_reserved`` is awaited with the newly reserved writes before anything is
+        written, so a caller can keep the positions for a replay elsewhere.
+        With ``replay``, messages of unreserved writes whose ``id`` is already stored are skipped.
+        """
+        batched: Dict[str, Tuple[List[Dict[str, Any]], Dict[str, Any]]] = {}
+        for write in writes:
+            conversation_writes, fields = batched.setdefault(write["conversation_id"], ([], {}))
+            conversation_writes.append(write)
+            fields.update({key: value for key, value in (write.get("fields") or {}).items() if key != "messages"})
+
+        async def reserve(conversation_id: str, conversation_writes: List[Dict[str, Any]], fields: Dict[str, Any]):
+            pending = [write for write in conversation_writes if write.get("messages") and write.get("positions") is None]
+            set_fields = {f"state.{key}": value for key, value in fields.items()}
+            stored: Set[str] = set()
+            if replay and pending:
+                # Read the count (applying the idempotent field updates) before deciding what's new
+                doc = await self._reserve(conversation_id, {"$set": set_fields} if set_fields else {"$inc": {"message_count": 0}})
+                set_fields = {}
+                depth = sum(len(write["messages"]) for write in pending) + self.bucket_size
+                stored = await self._stored_ids(conversation_id, int(doc["message_count"]), depth)
+            new = [
+                (write, n) for write in pending
+                for n, message in enumerate(write["messages"]) if message.get("id") not in stored
+            ]
+            update: Dict[str, Any] = {}
+            if new:
+                update["$inc"] = {"message_count": len(new)}
+            if set_fields:
+                update["$set"] = set_fields
+            first = 0
+            if update:
+                doc = await self._reserve(conversation_id, update)
+                first = int(doc["message_count"]) - len(new)
+            for write in pending:
+                write["positions"] = [None] * len(write["messages"])
+            for offset, (write, n) in enumerate(new):
+                write["positions"][n] = first + offset
+            return pending
+
+        results = await asyncio.gather(
+            *(reserve(key, *value) for key, value in batched.items()), return_exceptions=True
+        )
+        reserved = [write for result in results if not isinstance(result, BaseException) for write in result]
+        if reserved and on_reserved is not None:
+            await on_reserved(reserved)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        slots: Dict[Tuple[str, int], Dict[int, Dict[str, Any]]] = {}
+        for write in writes:
+            for message, position in zip(write.get("messages") or [], write.get("positions") or []):
+                if position is not None:
+                    slots.setdefault(
+                        (write["conversation_id"], position // self.bucket_size), {}
+                    )[position % self.bucket_size] = message
+        if slots:
+            await self._write_slots(slots)
+
+    async def _write_slots(self, slots: Dict[Tuple[str, int], Dict[int, Dict[str, Any]]]) -> None:
+        """Write messages into their reserved slots (bucket offset -> message); idempotent.
+
+        Setting a slot rather than pushing keeps messages in index order whichever
+        writer lands first; earlier slots still empty are padded with null.
+        """
+        now = datetime.utcnow()
+        operations: List[Any] = []
+        for (conversation_id, seq), messages in slots.items():
+            query = {"conversation_id": conversation_id, "bucket_seq": seq}
+            # Create the bucket as an array first; setting "messages.N" on a missing field makes an object
+            operations.append(UpdateOne(query, {"$setOnInsert": {"messages": [], "count": 0}}, upsert=True))
+            update: Dict[str, Any] = {f"messages.{offset}": message for offset, message in messages.items()}
+            update["updated_at"] = now
+            operations.append(UpdateOne(query, {"$set": update, "$max": {"count": max(messages) + 1}}))
+        while operations:
             try:
-                await self.collection.update_one(
-                    {"_id": conversation_id},
-                    {"$set": {"state": {"messages": [message]}}},
-                    upsert=True,
-                )
-                update_result = await self.collection.find_one({"_id": conversation_id})
-            except Exception:
-                # Build state from cache, append message, and write back to cache
-                cached = await self.redis.get(self._cache_key(conversation_id))
-                state: Dict[str, Any] = {}
-                if cached:
-                    try:
-                        state = json.loads(cached)
-                    except Exception:
-                        state = {}
-                msgs = state.get("messages") or []
-                msgs.append(message)
-                state["messages"] = msgs
-                try:
-                    await self.redis.set(self._cache_key(conversation_id), json.dumps(state), ex=CONV_CACHE_TTL_SECONDS)
-                except Exception:
-                    pass
-                return state
+                await self.messages.bulk_write(operations, ordered=True)
+                return
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                if not errors or errors[0].get("code") != 11000:
+                    raise
+                # Another writer created the same bucket first; carry on after it
+                operations = operations[errors[0]["index"] + 1:]
 
-        # Update cache
-        state = (update_result or {}).get("state", {})
+    def queue_cache_writes(
+        self, pipe: Any, conversation_id: str, messages: List[Dict[str, Any]], fields: Optional[Dict[str, Any]] = None
+    ) -> int:
+        """Add the cache side of a write to a Redis pipeline; returns the number of commands added.
+
+        Each command's reply is the same as from ``append_message`` / ``set_fields``:
+        -1 or 0 when the cache was cold and left untouched.
+        """
+        for message in messages:
+            pipe.eval(
+                _APPEND_MESSAGE_SCRIPT, 2,
+                self._messages_key(conversation_id), self._meta_key(conversation_id),
+                cache_codec.encode(message), settings.CONVERSATION_CACHE_MESSAGE_WINDOW,
+                MESSAGE_COUNT_FIELD, CONV_CACHE_TTL_SECONDS,
+            )
+        fields = {key: value for key, value in (fields or {}).items() if key != "messages"}
+        if fields:
+            args: List[Any] = [CONV_CACHE_TTL_SECONDS]
+            for key, value in fields.items():
+                args.extend([key, cache_codec.encode(value)])
+            pipe.eval(_SET_FIELDS_SCRIPT, 1, self._meta_key(conversation_id), *args)
+        return len(messages) + (1 if fields else 0)
+
+    async def invalidate(self, conversation_id: str) -> None:
+        """Drop the cached copy so the next read reloads it from Mongo"""
+        await self._invalidate(conversation_id)
+
+    async def append_message(self, conversation_id: str, message: Dict[str, Any]) -> Optional[int]:
+        """Append one message; returns the message count when the cache is warm, else None.
+
+        Neither side reads the conversation back: Mongo increments the message count and
+        sets the reserved slot of the current bucket, and Redis does an RPUSH onto the cached window, so
+        the cost doesn't grow with the conversation.
+        """
         try:
-            await self.redis.set(self._cache_key(conversation_id), json.dumps(state), ex=CONV_CACHE_TTL_SECONDS)
+            await self.apply_writes([{"conversation_id": conversation_id, "messages": [message]}])
+            stored = True
         except Exception:
-            pass
-        return state
+            stored = False
+
+        try:
+            count = await self.redis.eval(
+                _APPEND_MESSAGE_SCRIPT, 2,
+                self._messages_key(conversation_id), self._meta_key(conversation_id),
+                cache_codec.encode(message), settings.CONVERSATION_CACHE_MESSAGE_WINDOW,
+                MESSAGE_COUNT_FIELD, CONV_CACHE_TTL_SECONDS,
+            )
+        except Exception:
+            return None
+        if count == -1:
+            if not stored:
+                # Cache-only mode: the cache is the only copy, so start one
+                await self._cache_state(conversation_id, {}, [message], 1)
+                return 1
+            return None
+        return int(count)
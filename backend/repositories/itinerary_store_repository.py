@@ -0,0 +1,221 @@
+from typing import List, Optional, Dict, Any, Set, Tuple
+from datetime import date, datetime, timedelta
+import asyncio
+import hashlib
+import json
+import logging
+
+from pymongo import IndexModel, ASCENDING, DESCENDING
+
+from backend.config import settings
+from backend.db import get_db, get_redis
+from backend.models import TripPlan
+
+logger = logging.getLogger(__name__)
+
+# Normalized budget tiers; anything unknown is treated as moderate
+BUDGET_TIERS = {
+    "economical": "economical", "economy": "economical", "budget": "economical", "cheap": "economical",
+    "moderate": "moderate", "mid-range": "moderate", "midrange": "moderate", "standard": "moderate",
+    "luxury": "luxury", "premium": "luxury",
+}
+
+
+def travelers_bucket(travelers: Any) -> str:
+    try:
+        count = int(travelers or 1)
+    except (TypeError, ValueError):
+        count = 1
+    if count <= 1:
+        return "solo"
+    if count == 2:
+        return "couple"
+    return "small-group" if count <= 4 else "group"
+
+
+def canonical_inputs(trip_details: Dict[str, Any], mode: Optional[str] = None) -> Dict[str, Any]:
+    """Normalized itinerary inputs: requests that map to the same dict share a stored plan"""
+    interests = trip_details.get("interests") or []
+    if isinstance(interests, str):
+        interests = [interests]
+    return {
+        "v": settings.ITINERARY_STORE_VERSION,
+        "mode": mode or settings.ITINERARY_GENERATION_MODE,
+        "destination": " ".join(str(trip_details.get("destination") or "").lower().split()),
+        "duration_days": max(1, int(trip_details.get("duration_days") or 3)),
+        "budget_tier": BUDGET_TIERS.get(str(trip_details.get("budget_type") or "").lower(), "moderate"),
+        "interests": sorted({str(i).strip().lower() for i in interests if i}),
+        "travelers": travelers_bucket(trip_details.get("travelers")),
+    }
+
+
+def itinerary_key(trip_details: Dict[str, Any], mode: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """Content address (sha256 of the canonical inputs) and the inputs themselves"""
+    inputs = canonical_inputs(trip_details, mode)
+    digest = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+    return digest, inputs
+
+
+def rebase_plan_dates(plan: TripPlan, start: date) -> TripPlan:
+    """Shift every date in ``plan`` so the trip starts on ``start``"""
+    delta = start - plan.start_date
+    if not delta:
+        return plan
+
+    def shift(value: str) -> str:
+        try:
+            return (date.fromisoformat(value) + delta).isoformat()
+        except (TypeError, ValueError):
+            return value
+
+    cities = []
+    for city in plan.cities:
+        cities.append(city.model_copy(update={
+            "arrival": {**city.arrival, "date": shift(city.arrival.get("date"))},
+            "departure": {**city.departure, "date": shift(city.departure.get("date"))},
+            "days": [day.model_copy(update={"date": day.date + delta}) for day in city.days],
+        }))
+    return plan.model_copy(update={
+        "start_date": plan.start_date + delta,
+        "end_date": plan.end_date + delta,
+        "cities": cities,
+    })
+
+
+class ItineraryStore:
+    """Content-addressed store of generated TripPlans: Mongo for durability, Redis in front.
+
+    Entries carry their own freshness deadline (``expires_at``, also a Mongo TTL index)
+    and per-entry usage counters (``hits``, ``last_hit_at``).
+    """
+
+    def __init__(self):
+        self.db = get_db()
+        self.collection = self.db.itinerary_store
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._stat_updates: Set[asyncio.Task] = set()  # Referenced until done so they aren't collected
+        # Indexes are created on application startup via ensure_indexes()
+
+    async def ensure_indexes(self):
+        """Create necessary indexes for the itinerary store (idempotent)"""
+        indexes = [
+            IndexModel([("expires_at", ASCENDING)], name="expires_ttl", expireAfterSeconds=0),
+            IndexModel([("hits", DESCENDING)], name="hits_idx"),
+        ]
+        await self.collection.create_indexes(indexes)
+
+    def _cache_key(self, key: str) -> str:
+        return f"itin:{key}"
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Fresh entry for ``key`` ({"trip_plan", "plan_state", ...}) or None"""
+        entry = None
+        redis = await get_redis()
+        try:
+            cached = await redis.get(self._cache_key(key))
+            if cached:
+                entry = json.loads(cached)
+        except Exception as e:
+            logger.warning(f"Itinerary store cache read failed: {e}")
+
+        if entry is None:
+            doc = await self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+            if doc:
+                entry = {
+                    "trip_plan": doc["trip_plan"],
+                    "plan_state": doc.get("plan_state"),
+                    "expires_at": doc["expires_at"].isoformat(),
+                }
+                await self._cache(key, entry, doc["expires_at"])
+
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Usage stats are best-effort and must not delay (or fail) a hit
+        task = asyncio.create_task(self._record_hit(key))
+        self._stat_updates.add(task)
+        task.add_done_callback(self._stat_updates.discard)
+        return entry
+
+    async def _record_hit(self, key: str) -> None:
+        try:
+            await self.collection.update_one(
+                {"_id": key},
+                {"$inc": {"hits": 1}, "$set": {"last_hit_at": datetime.utcnow()}},
+            )
+        except Exception as e:
+            logger.warning(f"Failed to record itinerary store hit: {e}")
+
+    async def put(
+        self,
+        key: str,
+        inputs: Dict[str, Any],
+        trip_plan: Dict[str, Any],
+        plan_state: Optional[Dict[str, Any]] = None,
+        ttl_seconds: Optional[int] = None,
+    ) -> None:
+        """Store a generated plan (JSON-encoded) under its content address"""
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl_seconds or settings.ITINERARY_STORE_TTL_SECONDS)
+        await self.collection.update_one(
+            {"_id": key},
+            {
+                "$set": {
+                    "inputs": inputs,
+                    "trip_plan": trip_plan,
+                    "plan_state": plan_state,
+                    "generated_at": now,
+                    "expires_at": expires_at,
+                },
+                "$setOnInsert": {"hits": 0, "created_at": now},
+            },
+            upsert=True,
+        )
+        self.writes += 1
+        await self._cache(key, {"trip_plan": trip_plan, "plan_state": plan_state, "expires_at": expires_at.isoformat()}, expires_at)
+
+    async def _cache(self, key: str, entry: Dict[str, Any], expires_at: datetime) -> None:
+        remaining = int((expires_at - datetime.utcnow()).total_seconds())
+        ttl = min(settings.ITINERARY_STORE_REDIS_TTL_SECONDS, remaining)
+        if ttl <= 0:
+            return
+        try:
+            redis = await get_redis()
+            await redis.set(self._cache_key(key), json.dumps(entry), ex=ttl)
+        except Exception as e:
+            logger.warning(f"Itinerary store cache write failed: {e}")
+
+    async def invalidate(self, key: str) -> bool:
+        result = await self.collection.delete_one({"_id": key})
+        try:
+            redis = await get_redis()
+            await redis.delete(self._cache_key(key))
+        except Exception:
+            pass
+        return result.deleted_count > 0
+
+    async def top_entries(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most reused entries with their usage stats"""
+        cursor = self.collection.find(
+            {}, {"inputs": 1, "hits": 1, "last_hit_at": 1, "generated_at": 1, "expires_at": 1}
+        ).sort("hits", DESCENDING).limit(limit)
+        entries = []
+        async for doc in cursor:
+            doc["key"] = doc.pop("_id")
+            entries.append(doc)
+        return entries
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+# Create a singleton instance
+itinerary_store = ItineraryStore()
@@ -0,0 +1,90 @@
+"""
+Process-wide repositories, created once at startup.
+
+``repository_registry.startup()`` builds the repositories over the shared Mongo and
+Redis clients (pool sizes come from settings) and warms the connection pools, so request
+handlers receive a ready instance through ``get_conversation_repository`` instead of
+constructing one or looking up clients per request.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Dict, Any, Optional
+
+from backend.config import settings
+from backend.db import get_db, get_redis, get_binary_redis, close_connections
+from backend.repositories.conversation_repository import ConversationRepository
+
+logger = logging.getLogger(__name__)
+
+
+class RepositoryRegistry:
+    """Holds the shared repository instances between startup and shutdown"""
+
+    def __init__(self):
+        self._conversations: Optional[ConversationRepository] = None
+        self.warmup: Dict[str, Any] = {}
+
+    @property
+    def started(self) -> bool:
+        return self._conversations is not None
+
+    @property
+    def conversations(self) -> ConversationRepository:
+        if self._conversations is None:
+            raise RuntimeError("Repositories not initialized; call repository_registry.startup() first")
+        return self._conversations
+
+    async def startup(self, warm_up: bool = True) -> None:
+        """Create the repositories (idempotent) and optionally warm the connection pools"""
+        if self._conversations is None:
+            self._conversations = ConversationRepository(get_db(), await get_binary_redis())
+        if warm_up:
+            await self.warm_up()
+
+    async def warm_up(self) -> Dict[str, Any]:
+        """Open pooled connections before the first requests need them.
+
+        Concurrent pings each check out their own connection, so this fills the Redis
+        pools up to ``REDIS_WARMUP_CONNECTIONS`` each; Mongo keeps ``MONGO_MIN_POOL_SIZE``
+        connections open by itself once it has connected.
+        """
+        started = time.perf_counter()
+        db = get_db()
+        # The text client serves most services, the binary one the codec-encoded caches
+        clients = [await get_redis(), await get_binary_redis()]
+        mongo, *pings = await asyncio.gather(
+            db.command("ping"),
+            *(client.ping() for client in clients for _ in range(max(1, settings.REDIS_WARMUP_CONNECTIONS))),
+            return_exceptions=True,
+        )
+        self.warmup = {
+            "mongo": not isinstance(mongo, BaseException),
+            "redis_connections": sum(1 for ping in pings if not isinstance(ping, BaseException)),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        if isinstance(mongo, BaseException):
+            logger.warning(f"MongoDB warm-up failed: {mongo}")
+        if self.warmup["redis_connections"] < len(pings):
+            logger.warning(f"Redis warm-up opened {self.warmup['redis_connections']}/{len(pings)} connections")
+        return self.warmup
+
+    async def shutdown(self) -> None:
+        """Drop the repositories and close the shared clients"""
+        self._conversations = None
+        await close_connections()
+
+
+# Create a singleton instance
+repository_registry = RepositoryRegistry()
+
+
+async def get_conversation_repository() -> ConversationRepository:
+    """FastAPI dependency returning the shared conversation repository"""
+    return repository_registry.conversations
+
+
+__all__ = ['RepositoryRegistry', 'repository_registry', 'get_conversation_repository']
@@ -1,4 +1,4 @@
 # This file makes the services directory a Python package
-from .gemini_service import GeminiChat, ItineraryGenerator
+from .gemini_service import GeminiChat, GeminiChatPool, ItineraryGenerator
 
-__all__ = ['GeminiChat', 'ItineraryGenerator']
+__all__ = ['GeminiChat', 'GeminiChatPool', 'ItineraryGenerator']
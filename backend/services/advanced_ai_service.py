@@ -22,15 +22,38 @@ from langchain_core.prompts import ChatPromptTemplate
 
 from ..config import settings
 from ..models import Hotel, TripPlan, CityVisit
+from .singleflight import llm_singleflight, prompt_key
+from .cache_service import TwoTierCache
+from .llm_provider import get_llm_provider, as_langchain_llm
 
 logger = logging.getLogger(__name__)
 
+# Trip-length buckets (max days, label) used to share cached tips between similar requests
+TIPS_DURATION_BUCKETS = [(3, "1-3d"), (7, "4-7d"), (14, "8-14d")]
+# Daily budget buckets (max per-day budget, label)
+TIPS_BUDGET_BUCKETS = [(50, "shoestring"), (150, "budget"), (400, "mid")]
+
+def _normalize_cache_part(value: str) -> str:
+    return " ".join((value or "").lower().split())
+
+def travel_tips_cache_key(destination: str, travel_style: str, duration: int, budget: float) -> str:
+    """Cache key for travel tips with duration and daily budget bucketed"""
+    days = max(1, int(duration or 1))
+    duration_bucket = next((label for limit, label in TIPS_DURATION_BUCKETS if days <= limit), "15d+")
+    per_day = (budget or 0) / days
+    budget_bucket = next((label for limit, label in TIPS_BUDGET_BUCKETS if per_day < limit), "luxury")
+    return f"{_normalize_cache_part(destination)}:{_normalize_cache_part(travel_style)}:{duration_bucket}:{budget_bucket}"
+
 class AdvancedAIService:
     """Advanced AI service for intelligent travel planning"""
     
     def __init__(self):
         # Initialize LLM with graceful fallback
-        if GOOGLE_GENAI_AVAILABLE and settings.GEMINI_API_KEY:
+        if settings.LLM_PROVIDER != "gemini":
+            # Offline provider (stub) for load testing without Gemini quota
+            self.llm = as_langchain_llm(get_llm_provider())
+            logger.info(f"Advanced AI service using '{settings.LLM_PROVIDER}' LLM provider")
+        elif GOOGLE_GENAI_AVAILABLE and settings.GEMINI_API_KEY:
             try:
                 self.llm = ChatGoogleGenerativeAI(
                     model="gemini-1.5-pro",
@@ -46,6 +69,14 @@ class AdvancedAIService:
             logger.info("Advanced AI service running without LLM - using fallback responses")
             self.llm = None
         
+        # Tips barely change between users with similar inputs, so cache them
+        self.tips_cache = TwoTierCache(
+            "tips",
+            max_entries=settings.TRAVEL_TIPS_CACHE_MAX_ENTRIES,
+            local_ttl=settings.TRAVEL_TIPS_CACHE_LOCAL_TTL_SECONDS,
+            redis_ttl=settings.TRAVEL_TIPS_CACHE_TTL_SECONDS,
+        )
+        
         # Travel alert sources (in production, use real APIs)
         self.alert_sources = {
             "weather": "https://api.openweathermap.org/data/2.5/alerts",
@@ -359,6 +390,24 @@ class AdvancedAIService:
         travel_style: str,
         duration: int,
         budget: float
+    ) -> Dict[str, Any]:
+        """Generate AI-powered travel tips for destination (cached on bucketed inputs)"""
+        return await self.tips_cache.get_or_set(
+            travel_tips_cache_key(destination, travel_style, duration, budget),
+            lambda: self._generate_ai_travel_tips(destination, travel_style, duration, budget),
+            should_cache=lambda result: result.get("status") == "success"
+        )
+    
+    async def purge_travel_tips(self, destination: str) -> int:
+        """Drop cached travel tips for a destination; returns the number of entries removed"""
+        return await self.tips_cache.purge_prefix(f"{_normalize_cache_part(destination)}:")
+    
+    async def _generate_ai_travel_tips(
+        self,
+        destination: str,
+        travel_style: str,
+        duration: int,
+        budget: float
     ) -> Dict[str, Any]:
         """Generate AI-powered travel tips for destination"""
         try:
@@ -386,16 +435,25 @@ class AdvancedAIService:
             ])
             
             chain = prompt | self.llm
-            response = await chain.ainvoke({
-                "destination": destination,
-                "travel_style": travel_style,
-                "duration": duration,
-                "budget": budget
-            })
+            
+            async def invoke_chain() -> str:
+                response = await chain.ainvoke({
+                    "destination": destination,
+                    "travel_style": travel_style,
+                    "duration": duration,
+                    "budget": budget
+                })
+                return response.content
+            
+            # Identical requests in flight at the same time share one LLM call
+            content = await llm_singleflight.do(
+                prompt_key("tips", destination, travel_style, duration, budget),
+                invoke_chain
+            )
             
             # Parse AI response
             try:
-                tips_data = json.loads(response.content)
+                tips_data = json.loads(content)
                 if isinstance(tips_data, list):
                     return {
                         "status": "success",
@@ -408,7 +466,7 @@ class AdvancedAIService:
                 return {
                     "status": "success",
                     "destination": destination,
-                    "tips_text": response.content,
+                    "tips_text": content,
                     "generated_at": datetime.utcnow().isoformat()
                 }
             
@@ -1,6 +1,10 @@
 """
 LangChain tools for integrating external APIs (Google Search, Weather, Hotels, Maps).
 These tools are used by the LangGraph workflow for travel planning.
+
+``_arun`` is the primary path: it goes through the shared pooled client in
+``http_client`` so concurrent tool calls overlap on the event loop. ``_run`` stays
+for synchronous callers.
 """
 
 from typing import Dict, Any, List, Optional
@@ -10,10 +14,12 @@ import requests
 import json
 import asyncio
 import logging
-from datetime import datetime, timedelta
-import aiohttp
+from datetime import date, datetime, timedelta
 
 from ..config import settings
+from .http_client import http_client
+from .route_matrix import MODE_PROFILES
+from .weather_cache import weather_cache, location_label, estimate_days
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +33,9 @@ class GoogleSearchTool(BaseTool):
         super().__init__(**kwargs)
         # Initialize search wrapper as a private attribute to avoid Pydantic issues
         self._search = None  # GoogleSearchAPIWrapper() when available
+        self._api_key = settings.GOOGLE_SEARCH_API_KEY
+        self._engine_id = settings.GOOGLE_SEARCH_ENGINE_ID
+        self._base_url = "https://www.googleapis.com/customsearch/v1"
     
     def _run(self, query: str) -> str:
         """Execute Google search"""
@@ -60,8 +69,28 @@ class GoogleSearchTool(BaseTool):
         return f"Search results for {query}: Beautiful destination with many attractions, local culture, and great food options. Perfect for travelers seeking adventure and relaxation."
     
     async def _arun(self, query: str) -> str:
-        """Async version of Google search"""
-        return self._run(query)
+        """Async version of Google search (Custom Search JSON API when configured)"""
+        if self._api_key and self._engine_id:
+            try:
+                data = await http_client.get_json(self._base_url, params={
+                    "key": self._api_key,
+                    "cx": self._engine_id,
+                    "q": f"travel destination {query} attractions things to do",
+                    "num": 5
+                })
+                snippets = [
+                    f"{item.get('title', '')}: {item.get('snippet', '')}".strip()
+                    for item in data.get("items", [])
+                ]
+                if snippets:
+                    return f"Search results for {query}: " + " ".join(snippets)
+            except Exception as e:
+                logger.error(f"Google search error: {e}")
+            return self._get_mock_search_results(query)
+        if self._search is not None:
+            # The LangChain wrapper is blocking
+            return await asyncio.to_thread(self._run, query)
+        return self._get_mock_search_results(query)
 
 class WeatherTool(BaseTool):
     """Tool for fetching weather forecasts using OpenWeatherMap API"""
@@ -74,6 +103,16 @@ class WeatherTool(BaseTool):
         self._api_key = settings.OPENWEATHER_API_KEY
         self._base_url = "http://api.openweathermap.org/data/2.5"
     
+    def _params(self, location: str, days: Optional[int] = None) -> Dict[str, Any]:
+        params = {
+            "q": location,
+            "appid": self._api_key,
+            "units": "metric"
+        }
+        if days is not None:
+            params["cnt"] = min(days * 8, 40)  # 8 forecasts per day, max 40
+        return params
+    
     def _run(self, location: str, days: int = 7) -> str:
         """Get weather forecast for location"""
         try:
@@ -81,93 +120,78 @@ class WeatherTool(BaseTool):
                 return self._get_mock_weather_data(location, days)
             
             # Get current weather
-            current_url = f"{self._base_url}/weather"
-            current_params = {
-                "q": location,
-                "appid": self._api_key,
-                "units": "metric"
-            }
-            
-            current_response = requests.get(current_url, params=current_params)
+            current_response = requests.get(
+                f"{self._base_url}/weather", params=self._params(location), timeout=settings.HTTP_TIMEOUT_SECONDS
+            )
             current_data = current_response.json()
             
             if current_response.status_code != 200:
                 return self._get_mock_weather_data(location, days)
             
             # Get forecast
-            forecast_url = f"{self._base_url}/forecast"
-            forecast_params = {
-                "q": location,
-                "appid": self._api_key,
-                "units": "metric",
-                "cnt": min(days * 8, 40)  # 8 forecasts per day, max 40
-            }
+            forecast_response = requests.get(
+                f"{self._base_url}/forecast", params=self._params(location, days), timeout=settings.HTTP_TIMEOUT_SECONDS
+            )
+            forecast_data = forecast_response.json() if forecast_response.status_code == 200 else None
             
-            forecast_response = requests.get(forecast_url, params=forecast_params)
-            forecast_data = forecast_response.json()
-            
-            # Format weather information
-            weather_info = {
-                "location": location,
-                "current": {
-                    "temperature": current_data["main"]["temp"],
-                    "description": current_data["weather"][0]["description"],
-                    "humidity": current_data["main"]["humidity"],
-                    "wind_speed": current_data["wind"]["speed"]
-                },
-                "forecast": []
-            }
-            
-            if forecast_response.status_code == 200:
-                for item in forecast_data["list"][:days*2]:  # 2 forecasts per day
-                    weather_info["forecast"].append({
-                        "date": item["dt_txt"],
-                        "temperature": item["main"]["temp"],
-                        "description": item["weather"][0]["description"],
-                        "humidity": item["main"]["humidity"]
-                    })
-            
-            return json.dumps(weather_info, indent=2)
+            return self._format_weather(location, days, current_data, forecast_data)
             
         except Exception as e:
             logger.error(f"Weather API error: {e}")
             return self._get_mock_weather_data(location, days)
     
-    def _get_mock_weather_data(self, location: str, days: int = 7) -> str:
-        """Return mock weather data when API is not available"""
-        import random
-        from datetime import datetime, timedelta
-        
-        # Generate realistic mock weather data
-        base_temp = 25  # Base temperature in Celsius
-        weather_conditions = ["sunny", "partly cloudy", "cloudy", "light rain", "clear"]
-        
+    def _format_weather(self, location: str, days: int, current_data: Dict, forecast_data: Optional[Dict]) -> str:
+        """Format weather information"""
         weather_info = {
             "location": location,
             "current": {
-                "temperature": base_temp + random.randint(-5, 10),
-                "description": random.choice(weather_conditions),
-                "humidity": random.randint(40, 80),
-                "wind_speed": random.randint(5, 15)
+                "temperature": current_data["main"]["temp"],
+                "description": current_data["weather"][0]["description"],
+                "humidity": current_data["main"]["humidity"],
+                "wind_speed": current_data["wind"]["speed"]
             },
             "forecast": []
         }
-        
-        # Generate forecast for next few days
-        for i in range(min(days, 7)):
-            date = datetime.now() + timedelta(days=i)
-            weather_info["forecast"].append({
-                "date": date.strftime("%Y-%m-%d %H:%M:%S"),
-                "temperature": base_temp + random.randint(-3, 8),
-                "description": random.choice(weather_conditions),
-                "humidity": random.randint(40, 80)
-            })
-        
+            
+        if forecast_data:
+            for item in forecast_data["list"][:days*2]:  # 2 forecasts per day
+                weather_info["forecast"].append({
+                    "date": item["dt_txt"],
+                    "temperature": item["main"]["temp"],
+                    "description": item["weather"][0]["description"],
+                    "humidity": item["main"]["humidity"]
+                })
+            
         return json.dumps(weather_info, indent=2)
     
+    def _get_mock_weather_data(self, location: str, days: int = 7) -> str:
+        """Expected weather from climate normals when the API is not available"""
+        today = date.today()
+        daily = estimate_days(location, [today + timedelta(days=i) for i in range(max(1, days))])
+        return json.dumps({"location": location, "current": self._current_from(daily[0]), "forecast": daily}, indent=2)
+    
+    @staticmethod
+    def _current_from(day: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "temperature": day["temperature"],
+            "description": day["description"],
+            "humidity": day["humidity"],
+            "wind_speed": None
+        }
+    
     async def _arun(self, location: str, days: int = 7) -> str:
-        """Async version of weather forecast"""
-        return self._run(location, days)
+        """Async version of weather forecast, served from the shared per-date forecast cache"""
+        today = date.today()
+        dates = [today + timedelta(days=i) for i in range(max(1, days))]
+        current, forecasts = await asyncio.gather(
+            weather_cache.get_current(location),
+            weather_cache.get_forecasts([location], dates)
+        )
+        daily = [forecast for _, forecast in sorted(forecasts[location_label(location)].items())]
+        if current is None:
+            # No API key or current conditions unavailable: fall back to today's forecast
+            current = self._current_from(daily[0])
+        return json.dumps({"location": location, "current": current, "forecast": daily}, indent=2)
 
 class HotelSearchTool(BaseTool):
     """Tool for searching hotels using various hotel APIs"""
@@ -180,26 +204,29 @@ class HotelSearchTool(BaseTool):
         # This would integrate with actual hotel APIs like Booking.com, Amadeus, etc.
         # For now, we'll simulate hotel data
     
-    def _run(self, location: str, checkin: str = None, checkout: str = None, 
+    def _run(self, location: str, checkin: str = None, checkout: str = None,
              sort_by: str = "price", max_results: int = 10) -> str:
         """Search for hotels in location"""
         try:
             # Simulate hotel search results
             # In production, this would call actual hotel APIs
             hotels = self._simulate_hotel_search(location, sort_by, max_results)
-            
-            return json.dumps({
-                "location": location,
-                "checkin": checkin,
-                "checkout": checkout,
-                "sort_by": sort_by,
-                "hotels": hotels
-            }, indent=2)
+            return self._format_results(location, checkin, checkout, sort_by, hotels)
             
         except Exception as e:
             logger.error(f"Hotel search error: {e}")
             return f"Error searching hotels: {str(e)}"
     
+    def _format_results(self, location: str, checkin: Optional[str], checkout: Optional[str],
+                        sort_by: str, hotels: List[Dict]) -> str:
+        return json.dumps({
+            "location": location,
+            "checkin": checkin,
+            "checkout": checkout,
+            "sort_by": sort_by,
+            "hotels": hotels
+        }, indent=2)
+    
     def _simulate_hotel_search(self, location: str, sort_by: str, max_results: int) -> List[Dict]:
         """Simulate hotel search results"""
         # This is mock data - replace with actual API calls
@@ -230,8 +257,20 @@ class HotelSearchTool(BaseTool):
     
     async def _arun(self, location: str, checkin: str = None, checkout: str = None,
                    sort_by: str = "price", max_results: int = 10) -> str:
-        """Async version of hotel search"""
-        return self._run(location, checkin, checkout, sort_by, max_results)
+        """Async version of hotel search.
+        
+        The simulated inventory is built in memory, so it runs inline on the loop; a
+        provider integration belongs here and should go through ``http_client``.
+        """
+        try:
+            hotels = self._simulate_hotel_search(location, sort_by, max_results)
+            return self._format_results(location, checkin, checkout, sort_by, hotels)
+        except Exception as e:
+            logger.error(f"Hotel search error: {e}")
+            return f"Error searching hotels: {str(e)}"
+
+# Directions API parameters per route mode (same as the route matrix); flights are always simulated
+DIRECTIONS_MODES = {mode: profile.provider_params for mode, profile in MODE_PROFILES.items() if profile.provider_params}
 
 class RouteSearchTool(BaseTool):
     """Tool for finding transportation routes using Google Maps API"""
@@ -241,15 +280,28 @@ class RouteSearchTool(BaseTool):
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        # This would use Google Maps API or similar
-        self._maps_api_key = getattr(settings, 'GOOGLE_MAPS_API_KEY', None)
+        self._maps_api_key = settings.GOOGLE_MAPS_API_KEY
+        self._base_url = "https://maps.googleapis.com/maps/api/directions/json"
+    
+    def _uses_directions(self, mode: str) -> bool:
+        return bool(self._maps_api_key) and mode in DIRECTIONS_MODES
+    
+    def _directions_params(self, origin: str, destination: str, mode: str) -> Dict[str, Any]:
+        return {"origin": origin, "destination": destination, "key": self._maps_api_key, **DIRECTIONS_MODES[mode]}
     
     def _run(self, origin: str, destination: str, mode: str = "driving") -> str:
         """Find routes between origin and destination"""
         try:
-            # Simulate route data
-            # In production, this would call Google Maps API
-            route_data = self._simulate_route_search(origin, destination, mode)
+            route_data = None
+            if self._uses_directions(mode):
+                response = requests.get(
+                    self._base_url, params=self._directions_params(origin, destination, mode),
+                    timeout=settings.HTTP_TIMEOUT_SECONDS
+                )
+                if response.status_code == 200:
+                    route_data = self._parse_directions(origin, destination, mode, response.json())
+            if route_data is None:
+                route_data = self._simulate_route_search(origin, destination, mode)
             
             return json.dumps(route_data, indent=2)
             
@@ -257,6 +309,39 @@ class RouteSearchTool(BaseTool):
             logger.error(f"Route search error: {e}")
             return f"Error finding routes: {str(e)}"
     
+    def _parse_directions(self, origin: str, destination: str, mode: str, data: Dict) -> Optional[Dict]:
+        """Route data from a Directions API response, or None when it found no route"""
+        if data.get("status") != "OK" or not data.get("routes"):
+            logger.warning(f"No {mode} directions from {origin} to {destination}: {data.get('status')}")
+            return None
+        routes = []
+        for index, route in enumerate(data["routes"], start=1):
+            legs = route.get("legs") or []
+            duration = round(sum(leg["duration"]["value"] for leg in legs) / 60)
+            distance = round(sum(leg["distance"]["value"] for leg in legs) / 1000, 1)
+            routes.append({
+                "route_id": f"route_{index}_{mode}",
+                "duration_minutes": duration,
+                "distance_km": distance,
+                "cost": round(MODE_PROFILES[mode].base_cost + distance * MODE_PROFILES[mode].cost_per_km, 2),
+                "steps": [
+                    f"Start from {origin}",
+                    f"Travel via {mode}" + (f" ({route['summary']})" if route.get("summary") else ""),
+                    f"Arrive at {destination}"
+                ]
+            })
+        best = routes[0]
+        return {
+            "origin": origin,
+            "destination": destination,
+            "mode": mode,
+            "duration_minutes": best["duration_minutes"],
+            "distance_km": best["distance_km"],
+            "estimated_cost": best["cost"],
+            "currency": "USD",
+            "routes": routes
+        }
+    
     def _simulate_route_search(self, origin: str, destination: str, mode: str) -> Dict:
         """Simulate route search results"""
         # Mock route data - replace with actual API calls
@@ -300,8 +385,21 @@ class RouteSearchTool(BaseTool):
         }
     
     async def _arun(self, origin: str, destination: str, mode: str = "driving") -> str:
-        """Async version of route search"""
-        return self._run(origin, destination, mode)
+        """Async version of route search (Google Directions API when configured)"""
+        try:
+            route_data = None
+            if self._uses_directions(mode):
+                try:
+                    data = await http_client.get_json(self._base_url, params=self._directions_params(origin, destination, mode))
+                    route_data = self._parse_directions(origin, destination, mode, data)
+                except Exception as e:
+                    logger.error(f"Directions API error: {e}")
+            if route_data is None:
+                route_data = self._simulate_route_search(origin, destination, mode)
+            return json.dumps(route_data, indent=2)
+        except Exception as e:
+            logger.error(f"Route search error: {e}")
+            return f"Error finding routes: {str(e)}"
 
 class BudgetEstimatorTool(BaseTool):
     """Tool for estimating trip budgets based on destinations, hotels, and activities"""
@@ -0,0 +1,198 @@
+"""
+Two-tier cache: an in-process LRU in front of a shared Redis tier.
+Misses are filled through a singleflight so an expiring hot key doesn't stampede the backend.
+"""
+
+from typing import Dict, Any, List, Tuple, Callable, Awaitable, Optional
+from collections import OrderedDict
+import json
+import logging
+import random
+import time
+
+from ..db import get_redis
+from .singleflight import SingleFlight, llm_singleflight
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TwoTierCache:
+    """LRU + Redis cache for JSON-serializable values.
+
+    Entries live ``local_ttl`` seconds in process and ``redis_ttl`` seconds in Redis
+    (both with a little jitter so entries written together don't expire together).
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        max_entries: int = 1024,
+        local_ttl: int = 300,
+        redis_ttl: int = 86400,
+        singleflight: Optional[SingleFlight] = None,
+    ):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self.singleflight = singleflight or llm_singleflight
+        self._local: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    @staticmethod
+    def _jittered(ttl: int) -> int:
+        return max(1, int(ttl * random.uniform(0.9, 1.1)))
+
+    def _get_local(self, key: str) -> Any:
+        entry = self._local.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._local[key]
+            return _MISSING
+        self._local.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        local_ttl = min(self.local_ttl, ttl) if ttl else self.local_ttl
+        self._local[key] = (time.monotonic() + self._jittered(local_ttl), value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def get(self, key: str) -> Any:
+        """Return the cached value, or None on a miss in both tiers"""
+        value = self._get_local(key)
+        if value is not _MISSING:
+            return value
+        try:
+            redis = await get_redis()
+            cached = await redis.get(self._redis_key(key))
+        except Exception as e:
+            logger.warning(f"Redis cache read failed for {self.namespace}: {e}")
+            return None
+        if cached is None:
+            return None
+        value = json.loads(cached)
+        self._set_local(key, value)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        """Store in both tiers; ``ttl`` overrides ``redis_ttl`` and caps ``local_ttl``"""
+        self._set_local(key, value, ttl)
+        try:
+            redis = await get_redis()
+            await redis.set(self._redis_key(key), json.dumps(value), ex=self._jittered(ttl or self.redis_ttl))
+        except Exception as e:
+            logger.warning(f"Redis cache write failed for {self.namespace}: {e}")
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Cached values for ``keys`` (misses are left out), one MGET for the local misses"""
+        found: Dict[str, Any] = {}
+        remote: List[str] = []
+        for key in dict.fromkeys(keys):
+            value = self._get_local(key)
+            if value is _MISSING:
+                remote.append(key)
+            else:
+                self.local_hits += 1
+                found[key] = value
+        if remote:
+            try:
+                redis = await get_redis()
+                cached = await redis.mget([self._redis_key(key) for key in remote])
+            except Exception as e:
+                logger.warning(f"Redis cache read failed for {self.namespace}: {e}")
+                cached = [None] * len(remote)
+            for key, raw in zip(remote, cached):
+                if raw is None:
+                    self.misses += 1
+                    continue
+                self.redis_hits += 1
+                found[key] = json.loads(raw)
+                self._set_local(key, found[key])
+        return found
+
+    async def set_many(self, items: Dict[str, Tuple[Any, Optional[int]]]) -> None:
+        """Store ``{key: (value, ttl)}`` in both tiers with one pipelined round trip"""
+        if not items:
+            return
+        for key, (value, ttl) in items.items():
+            self._set_local(key, value, ttl)
+        try:
+            redis = await get_redis()
+            async with redis.pipeline(transaction=False) as pipe:
+                for key, (value, ttl) in items.items():
+                    pipe.set(self._redis_key(key), json.dumps(value), ex=self._jittered(ttl or self.redis_ttl))
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Redis cache write failed for {self.namespace}: {e}")
+
+    async def get_or_set(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        should_cache: Optional[Callable[[Any], bool]] = None,
+        ttl: Optional[int] = None,
+    ) -> Any:
+        """Return the cached value or load, cache and return it.
+
+        Concurrent misses for the same key share a single ``loader`` call. Values for
+        which ``should_cache`` returns False (e.g. error responses) are returned but
+        not stored. ``ttl`` is passed on to ``set``.
+        """
+        value = self._get_local(key)
+        if value is not _MISSING:
+            self.local_hits += 1
+            return value
+
+        async def fill() -> Any:
+            cached = await self.get(key)
+            if cached is not None:
+                self.redis_hits += 1
+                return cached
+            self.misses += 1
+            loaded = await loader()
+            if should_cache is None or should_cache(loaded):
+                await self.set(key, loaded, ttl)
+            return loaded
+
+        return await self.singleflight.do(self._redis_key(key), fill)
+
+    async def purge_prefix(self, prefix: str) -> int:
+        """Drop every entry whose key starts with ``prefix`` from both tiers"""
+        purged_local = [k for k in self._local if k.startswith(prefix)]
+        for k in purged_local:
+            del self._local[k]
+        purged = len(purged_local)
+        try:
+            redis = await get_redis()
+            # Escape glob metacharacters so the prefix is matched literally
+            pattern = "".join(f"\\{c}" if c in "*?[]\\" else c for c in self._redis_key(prefix)) + "*"
+            keys = [k async for k in redis.scan_iter(match=pattern, count=500)]
+            if keys:
+                purged = max(purged, await redis.delete(*keys))
+        except Exception as e:
+            logger.warning(f"Redis cache purge failed for {self.namespace}: {e}")
+        return purged
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.local_hits + self.redis_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.local_hits + self.redis_hits) / lookups, 4) if lookups else 0.0,
+            "local_entries": len(self._local),
+        }
+
+# Export for easy import
+__all__ = ['TwoTierCache']
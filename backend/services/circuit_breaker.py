@@ -0,0 +1,182 @@
+"""
+Circuit breaker for the LLM backend, driven by rolling error-rate and p95-latency windows.
+While open, calls fail fast with CircuitOpenError so callers can serve their fallback
+instead of waiting on a degraded upstream.
+"""
+
+from typing import Dict, Any, Optional, Callable, Awaitable, TypeVar
+from collections import deque
+import logging
+import math
+import time
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the backend while the circuit is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open; retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed -> open -> half-open breaker over a sliding time window.
+
+    The circuit opens when, over the last ``window_seconds`` with at least
+    ``min_requests`` samples, the error rate reaches ``error_rate_threshold`` or the
+    p95 latency exceeds ``p95_latency_threshold``. After ``open_seconds`` up to
+    ``half_open_max_calls`` probe calls are let through; a successful, fast probe
+    closes the circuit and any failure re-opens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: Optional[float] = None,
+        min_requests: Optional[int] = None,
+        error_rate_threshold: Optional[float] = None,
+        p95_latency_threshold: Optional[float] = None,
+        open_seconds: Optional[float] = None,
+        half_open_max_calls: Optional[int] = None,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds or settings.LLM_BREAKER_WINDOW_SECONDS
+        self.min_requests = min_requests or settings.LLM_BREAKER_MIN_REQUESTS
+        self.error_rate_threshold = error_rate_threshold or settings.LLM_BREAKER_ERROR_RATE
+        self.p95_latency_threshold = p95_latency_threshold or settings.LLM_BREAKER_P95_LATENCY_SECONDS
+        self.open_seconds = open_seconds or settings.LLM_BREAKER_OPEN_SECONDS
+        self.half_open_max_calls = half_open_max_calls or settings.LLM_BREAKER_HALF_OPEN_PROBES
+        # (timestamp, latency seconds, succeeded)
+        self._samples: "deque[tuple[float, float, bool]]" = deque()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self.opened_count = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._half_open_calls = 0
+            logger.info(f"Circuit '{self.name}' half-open, probing backend")
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls would be rejected outright"""
+        return self.state == OPEN
+
+    def before_call(self) -> None:
+        """Reserve a call slot, raising CircuitOpenError if the call must not go out"""
+        state = self.state
+        if state == OPEN:
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.open_seconds - (time.monotonic() - self._opened_at))
+        if state == HALF_OPEN:
+            if self._half_open_calls >= self.half_open_max_calls:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, 0.0)
+            self._half_open_calls += 1
+
+    def release(self) -> None:
+        """Give back the slot of a call started with ``before_call`` that never went out"""
+        if self._state == HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def record(self, latency: float, succeeded: bool) -> None:
+        """Record the outcome of a call started with ``before_call``"""
+        now = time.monotonic()
+        self._samples.append((now, latency, succeeded))
+        self._prune(now)
+
+        if self._state == HALF_OPEN:
+            if succeeded and latency <= self.p95_latency_threshold:
+                self._close()
+            else:
+                self._open("probe failed")
+            return
+        if self._state == OPEN:
+            return
+
+        if len(self._samples) < self.min_requests:
+            return
+        error_rate = self._error_rate()
+        if error_rate >= self.error_rate_threshold:
+            self._open(f"error rate {error_rate:.0%}")
+            return
+        p95 = self.latency_percentile(0.95)
+        if p95 is not None and p95 > self.p95_latency_threshold:
+            self._open(f"p95 latency {p95:.2f}s")
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run ``fn`` through the breaker"""
+        self.before_call()
+        started = time.monotonic()
+        try:
+            result = await fn()
+        except Exception:
+            self.record(time.monotonic() - started, False)
+            raise
+        self.record(time.monotonic() - started, True)
+        return result
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Latency at ``percentile`` (0-1) over the window, or None with too few samples"""
+        self._prune(time.monotonic())
+        latencies = sorted(latency for _, latency, ok in self._samples if ok)
+        if len(latencies) < self.min_requests:
+            return None
+        index = min(len(latencies) - 1, max(0, math.ceil(percentile * len(latencies)) - 1))
+        return latencies[index]
+
+    def _error_rate(self) -> float:
+        if not self._samples:
+            return 0.0
+        return sum(1 for _, _, ok in self._samples if not ok) / len(self._samples)
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - self.window_seconds
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+
+    def _open(self, reason: str) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self.opened_count += 1
+        logger.warning(f"Circuit '{self.name}' opened: {reason}")
+
+    def _close(self) -> None:
+        self._state = CLOSED
+        # Start from a clean window so the samples that tripped it don't re-open it
+        self._samples.clear()
+        logger.info(f"Circuit '{self.name}' closed")
+
+    def snapshot(self) -> Dict[str, Any]:
+        p95 = self.latency_percentile(0.95)
+        return {
+            "name": self.name,
+            "state": self.state,
+            "samples": len(self._samples),
+            "error_rate": round(self._error_rate(), 4),
+            "p95_latency_seconds": round(p95, 3) if p95 is not None else None,
+            "opened_count": self.opened_count,
+            "rejected": self.rejected,
+        }
+
+# Breaker shared by every Gemini call in this worker
+gemini_breaker = CircuitBreaker("gemini")
+
+# Export for easy import
+__all__ = ['CircuitBreaker', 'CircuitOpenError', 'gemini_breaker']
@@ -0,0 +1,241 @@
+"""
+Climate normals: expected conditions for any city and date without a network call.
+
+At startup the monthly climate fields of every city document (``avg_temperature`` and the
+optional min/max temperature, precipitation and humidity maps) are packed into dense
+``(cities x 12)`` numpy matrices, with gaps filled by interpolating around the year.
+Point queries interpolate between mid-month normals; range queries ("cities between
+20-26°C in March") are a single vectorized mask over a month column.
+"""
+
+from typing import Dict, Any, List, Optional, Tuple, Iterable, Union
+from datetime import date
+import calendar
+import logging
+
+import numpy as np
+
+from ..config import settings
+from ..repositories.city_repository import city_repository
+from .geo import Location, coords_of, haversine_km, normalize_location
+
+logger = logging.getLogger(__name__)
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+# Climate field -> CityModel attribute holding its month map
+CLIMATE_FIELDS = {
+    "temperature": "avg_temperature",
+    "temp_min": "avg_temperature_min",
+    "temp_max": "avg_temperature_max",
+    "precipitation_mm": "avg_precipitation_mm",
+    "humidity": "avg_humidity",
+}
+# (upper bound in °C, label) for describing a mean temperature
+TEMPERATURE_BANDS = [(0, "freezing"), (10, "cold"), (17, "cool"), (23, "mild"), (29, "warm")]
+
+RangeBound = Tuple[Optional[float], Optional[float]]
+
+
+def month_index(key: Union[str, int]) -> Optional[int]:
+    """0-based month for "Mar", "march", "3" or 3; None if unrecognized"""
+    text = str(key).strip()
+    if text.isdigit():
+        number = int(text)
+        return number - 1 if 1 <= number <= 12 else None
+    prefix = text[:3].title()
+    return MONTHS.index(prefix) if prefix in MONTHS else None
+
+
+def _month_row(values: Dict[str, Any]) -> np.ndarray:
+    """12 monthly values with missing months filled by circular linear interpolation"""
+    row = np.full(12, np.nan)
+    for key, value in (values or {}).items():
+        index = month_index(key)
+        if index is not None and value is not None:
+            try:
+                row[index] = float(value)
+            except (TypeError, ValueError):
+                continue
+    known = np.flatnonzero(~np.isnan(row))
+    if 0 < len(known) < 12:
+        # Tile the known months across three years so interpolation wraps Dec -> Jan
+        xs = np.concatenate([known - 12, known, known + 12])
+        row = np.interp(np.arange(12), xs, np.tile(row[known], 3))
+    return row
+
+
+def _describe(temperature: float, precipitation_mm: float) -> str:
+    if np.isnan(temperature):
+        return "no climate data"
+    band = next((label for limit, label in TEMPERATURE_BANDS if temperature < limit), "hot")
+    if not np.isnan(precipitation_mm) and precipitation_mm >= 100:
+        return f"typically {band}, often rainy"
+    return f"typically {band}"
+
+
+def _value(number: float, digits: int = 1) -> Optional[float]:
+    return None if np.isnan(number) else round(float(number), digits)
+
+
+class ClimateNormals:
+    """Dense month-by-city climate matrices built from the cities collection"""
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.countries: List[str] = []
+        self.coords = np.empty((0, 2))
+        self.matrices: Dict[str, np.ndarray] = {field: np.empty((0, 12)) for field in CLIMATE_FIELDS}
+        self._index: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def load(self, cities: Iterable[Dict[str, Any]]) -> int:
+        """Rebuild the matrices from city documents; returns the number of cities with normals"""
+        names, countries, coords = [], [], []
+        rows: Dict[str, List[np.ndarray]] = {field: [] for field in CLIMATE_FIELDS}
+        for city in cities:
+            if not city.get("name") or not city.get(CLIMATE_FIELDS["temperature"]):
+                continue
+            names.append(city["name"])
+            countries.append(city.get("country") or "")
+            # 0.0 is a valid coordinate, so only a missing one is NaN
+            coords.append(tuple(
+                np.nan if city.get(axis) is None else float(city[axis]) for axis in ("latitude", "longitude")
+            ))
+            for field, attribute in CLIMATE_FIELDS.items():
+                rows[field].append(_month_row(city.get(attribute) or {}))
+
+        self.names, self.countries = names, countries
+        self.coords = np.array(coords, dtype=float).reshape(-1, 2)
+        self.matrices = {field: np.array(field_rows, dtype=float).reshape(-1, 12) for field, field_rows in rows.items()}
+        temperature = self.matrices["temperature"]
+        # Typical daily range when the city has no min/max normals
+        for field, offset in (("temp_min", -4.0), ("temp_max", 4.0)):
+            matrix = self.matrices[field]
+            missing = np.isnan(matrix)
+            matrix[missing] = temperature[missing] + offset
+
+        self._index = {}
+        for row, (name, country) in enumerate(zip(names, countries)):
+            self._index.setdefault(normalize_location(name), row)
+            if country:
+                self._index.setdefault(normalize_location(f"{name}, {country}"), row)
+        return len(names)
+
+    async def load_from_db(self) -> int:
+        """Load normals for every city in the cities collection"""
+        projection = {"name": 1, "country": 1, "latitude": 1, "longitude": 1, **{a: 1 for a in CLIMATE_FIELDS.values()}}
+        cities = [city async for city in city_repository.collection.find({}, projection)]
+        count = self.load(cities)
+        logger.info(f"Climate normals loaded for {count} cities")
+        return count
+
+    def find(self, location: Location) -> Optional[int]:
+        """Matrix row for a place name or the nearest city to coordinates, if any"""
+        if isinstance(location, str):
+            normalized = normalize_location(location)
+            row = self._index.get(normalized)
+            if row is None and "," in normalized:
+                row = self._index.get(normalized.split(",")[0].strip())
+            return row
+        coords = coords_of(location)
+        if coords is None or not len(self.names):
+            return None
+        distances = haversine_km(coords[0], coords[1], self.coords[:, 0], self.coords[:, 1])
+        if np.all(np.isnan(distances)):
+            return None
+        nearest = int(np.nanargmin(distances))
+        return nearest if distances[nearest] <= settings.CLIMATE_NORMALS_MAX_DISTANCE_KM else None
+
+    @staticmethod
+    def _month_weights(days: List[date]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Neighbouring months and blend weight for each date (normals sit mid-month)"""
+        position = np.array([
+            day.month - 1 + (day.day - 0.5) / calendar.monthrange(day.year, day.month)[1] - 0.5
+            for day in days
+        ])
+        lower = np.floor(position)
+        weight = position - lower
+        return lower.astype(int) % 12, (lower.astype(int) + 1) % 12, weight
+
+    def expected_many(self, location: Location, days: List[date]) -> Optional[List[Dict[str, Any]]]:
+        """Expected daily conditions for each date, or None if the location has no normals"""
+        row = self.find(location)
+        if row is None:
+            return None
+        lower, upper, weight = self._month_weights(days)
+        values = {
+            field: matrix[row, lower] * (1 - weight) + matrix[row, upper] * weight
+            for field, matrix in self.matrices.items()
+        }
+        # Monthly precipitation is a total, not a rate: take the month's own value
+        precipitation = self.matrices["precipitation_mm"][row, np.array([day.month - 1 for day in days])]
+        return [
+            {
+                "date": day.isoformat(),
+                "temperature": _value(values["temperature"][i]),
+                "temp_min": _value(values["temp_min"][i]),
+                "temp_max": _value(values["temp_max"][i]),
+                "description": _describe(values["temperature"][i], precipitation[i]),
+                "humidity": _value(values["humidity"][i], 0),
+                "precipitation_mm": _value(precipitation[i]),
+                "precipitation_probability": None,
+                "source": "climate_normals",
+                "normals_city": self.names[row],
+            }
+            for i, day in enumerate(days)
+        ]
+
+    def expected(self, location: Location, day: date) -> Optional[Dict[str, Any]]:
+        result = self.expected_many(location, [day])
+        return result[0] if result else None
+
+    def query(self, month: Union[str, int], ranges: Dict[str, RangeBound], limit: int = 20) -> List[Dict[str, Any]]:
+        """Cities whose normals for ``month`` fall inside every ``{field: (low, high)}`` range.
+
+        Bounds are inclusive and either may be None. Results are ordered by how close the
+        temperature is to the middle of the requested temperature range, if one was given.
+        """
+        index = month_index(month)
+        if index is None:
+            raise ValueError(f"Unknown month '{month}'")
+        unknown = set(ranges) - set(CLIMATE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown climate fields: {', '.join(sorted(unknown))}")
+
+        mask = np.ones(len(self.names), dtype=bool)
+        for field, (low, high) in ranges.items():
+            column = self.matrices[field][:, index]
+            mask &= ~np.isnan(column)
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        rows = np.flatnonzero(mask)
+
+        low, high = ranges.get("temperature", (None, None))
+        if low is not None or high is not None:
+            target = np.mean([bound for bound in (low, high) if bound is not None])
+            rows = rows[np.argsort(np.abs(self.matrices["temperature"][rows, index] - target), kind="stable")]
+        return [
+            {
+                "name": self.names[row],
+                "country": self.countries[row],
+                "month": MONTHS[index],
+                **{field: _value(self.matrices[field][row, index]) for field in CLIMATE_FIELDS},
+            }
+            for row in rows[:limit]
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cities": len(self.names),
+            "fields": {field: int((~np.isnan(matrix).all(axis=1)).sum()) for field, matrix in self.matrices.items()},
+        }
+
+
+# Create a singleton instance
+climate_normals = ClimateNormals()
+
+__all__ = ['ClimateNormals', 'climate_normals', 'month_index', 'MONTHS', 'CLIMATE_FIELDS']
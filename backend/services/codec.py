@@ -0,0 +1,197 @@
+"""
+Compact binary encoding for values cached in Redis.
+
+An encoded value is a two-byte header followed by the payload:
+- byte 0: ``HEADER_MAGIC`` (0xFE, which never starts JSON text)
+- byte 1: ``format << 4 | compression``
+
+Formats: json (stdlib, compact), orjson, msgpack. Compression: none, zlib, zstd, applied
+only when the serialized value exceeds ``CACHE_COMPRESSION_THRESHOLD_BYTES``. The header
+records how each entry was written, so the writing codec (``CACHE_CODEC`` /
+``CACHE_COMPRESSION``) can change while older entries, including plain JSON text from
+before this layer existed, are still read.
+"""
+
+from typing import Dict, Any, Optional, Union
+import json
+import logging
+import zlib
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except Exception:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except Exception:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except Exception:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+HEADER_MAGIC = 0xFE
+FORMATS = {"json": 0, "orjson": 1, "msgpack": 2}
+COMPRESSIONS = {"none": 0, "zlib": 1, "zstd": 2}
+_FORMAT_NAMES = {code: name for name, code in FORMATS.items()}
+_COMPRESSION_NAMES = {code: name for name, code in COMPRESSIONS.items()}
+# One encode in this many is also measured as plain JSON for the ratio against it
+_BASELINE_SAMPLE_EVERY = 32
+
+
+def _available_format(name: str) -> str:
+    if name == "orjson" and not ORJSON_AVAILABLE:
+        logger.warning("orjson not installed; caching with json")
+        return "json"
+    if name == "msgpack" and not MSGPACK_AVAILABLE:
+        logger.warning("msgpack not installed; caching with json")
+        return "json"
+    if name not in FORMATS:
+        raise ValueError(f"Unknown cache codec '{name}' (expected one of {', '.join(FORMATS)})")
+    return name
+
+
+def _available_compression(name: str) -> str:
+    if name == "zstd" and not ZSTD_AVAILABLE:
+        logger.warning("zstandard not installed; compressing cache entries with zlib")
+        return "zlib"
+    if name not in COMPRESSIONS:
+        raise ValueError(f"Unknown cache compression '{name}' (expected one of {', '.join(COMPRESSIONS)})")
+    return name
+
+
+class CacheCodec:
+    """Serializes cache values with a versioned header and tracks the bytes saved"""
+
+    def __init__(
+        self,
+        codec: Optional[str] = None,
+        compression: Optional[str] = None,
+        threshold: Optional[int] = None,
+        level: Optional[int] = None,
+    ):
+        self.format = _available_format(codec or settings.CACHE_CODEC)
+        self.compression = _available_compression(compression or settings.CACHE_COMPRESSION)
+        self.threshold = settings.CACHE_COMPRESSION_THRESHOLD_BYTES if threshold is None else threshold
+        self.level = settings.CACHE_COMPRESSION_LEVEL if level is None else level
+        self._zstd_compressor = None
+        self._zstd_decompressor = None
+        self.encoded = 0
+        self.compressed = 0
+        self.serialized_bytes = 0  # Before compression
+        self.stored_bytes = 0  # Including headers
+        self.decoded = 0
+        self.legacy_decoded = 0  # Plain JSON entries without a header
+        self._baseline_json_bytes = 0
+        self._baseline_stored_bytes = 0
+
+    def _serialize(self, value: Any) -> bytes:
+        if self.format == "orjson":
+            return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+        if self.format == "msgpack":
+            return msgpack.packb(value, default=str, use_bin_type=True)
+        return json.dumps(value, default=str, separators=(",", ":")).encode("utf-8")
+
+    @staticmethod
+    def _deserialize(format_code: int, payload: bytes) -> Any:
+        name = _FORMAT_NAMES.get(format_code)
+        if name == "orjson":
+            # orjson output is JSON, so the stdlib reads it too when orjson is missing
+            return orjson.loads(payload) if ORJSON_AVAILABLE else json.loads(payload)
+        if name == "msgpack":
+            if not MSGPACK_AVAILABLE:
+                raise ValueError("Cache entry is msgpack but msgpack is not installed")
+            return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+        if name == "json":
+            return json.loads(payload)
+        raise ValueError(f"Unknown cache entry format {format_code}")
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == "zstd":
+            if self._zstd_compressor is None:
+                self._zstd_compressor = zstandard.ZstdCompressor(level=self.level)
+            return self._zstd_compressor.compress(data)
+        return zlib.compress(data, max(0, min(self.level, 9)))
+
+    def _decompress(self, compression_code: int, data: bytes) -> bytes:
+        name = _COMPRESSION_NAMES.get(compression_code)
+        if name == "none":
+            return data
+        if name == "zlib":
+            return zlib.decompress(data)
+        if name == "zstd":
+            if not ZSTD_AVAILABLE:
+                raise ValueError("Cache entry is zstd-compressed but zstandard is not installed")
+            if self._zstd_decompressor is None:
+                self._zstd_decompressor = zstandard.ZstdDecompressor()
+            return self._zstd_decompressor.decompress(data)
+        raise ValueError(f"Unknown cache entry compression {compression_code}")
+
+    def encode(self, value: Any) -> bytes:
+        payload = self._serialize(value)
+        self.serialized_bytes += len(payload)
+        compression = "none"
+        if self.compression != "none" and len(payload) > self.threshold:
+            compressed = self._compress(payload)
+            # Small or already-dense values can come out larger
+            if len(compressed) < len(payload):
+                compression = self.compression
+                payload = compressed
+                self.compressed += 1
+        data = bytes((HEADER_MAGIC, FORMATS[self.format] << 4 | COMPRESSIONS[compression])) + payload
+        self.encoded += 1
+        self.stored_bytes += len(data)
+        if self.encoded % _BASELINE_SAMPLE_EVERY == 1:
+            # Size of the same value as the plain json.dumps text cached before this codec
+            self._baseline_json_bytes += len(json.dumps(value, default=str).encode("utf-8"))
+            self._baseline_stored_bytes += len(data)
+        return data
+
+    def decode(self, data: Union[bytes, str]) -> Any:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.decoded += 1
+        if not data or data[0] != HEADER_MAGIC:
+            self.legacy_decoded += 1
+            return json.loads(data)
+        if len(data) < 2:
+            raise ValueError("Truncated cache entry header")
+        codec = data[1]
+        return self._deserialize(codec >> 4, self._decompress(codec & 0x0F, data[2:]))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "format": self.format,
+            "compression": self.compression,
+            "threshold_bytes": self.threshold,
+            "encoded": self.encoded,
+            "compressed": self.compressed,
+            "serialized_bytes": self.serialized_bytes,
+            "stored_bytes": self.stored_bytes,
+            # Serialized size / stored size; above 1 means compression is paying off
+            "compression_ratio": round(self.serialized_bytes / self.stored_bytes, 3) if self.stored_bytes else None,
+            # Plain json.dumps size / stored size, over sampled entries
+            "ratio_vs_json": (
+                round(self._baseline_json_bytes / self._baseline_stored_bytes, 3) if self._baseline_stored_bytes else None
+            ),
+            "decoded": self.decoded,
+            "legacy_decoded": self.legacy_decoded,
+        }
+
+
+# Create a singleton instance
+cache_codec = CacheCodec()
+
+__all__ = ['CacheCodec', 'cache_codec', 'FORMATS', 'COMPRESSIONS', 'HEADER_MAGIC']
@@ -3,15 +3,16 @@ Context service for managing user preferences and conversation context persisten
 Integrates with MongoDB and Redis for storage and caching.
 """
 
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
 import redis.asyncio as redis
-import json
 import logging
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 
 from ..config import settings
+from .codec import cache_codec
 
 logger = logging.getLogger(__name__)
 
@@ -73,7 +74,7 @@ class ContextService:
                 cache_key = f"context:{user_id}:{session_id}"
                 cached_context = await self.redis_client.get(cache_key)
                 if cached_context:
-                    return json.loads(cached_context)
+                    return cache_codec.decode(cached_context)
             
             # Fallback to MongoDB
             context_doc = await self.context_collection.find_one({"user_id": user_id})
@@ -127,7 +128,7 @@ class ContextService:
                 await self.redis_client.setex(
                     cache_key,
                     timedelta(hours=24),  # Cache for 24 hours
-                    json.dumps(context, default=str)
+                    cache_codec.encode(context)
                 )
             
             logger.info(f"Saved context for user {user_id}")
@@ -172,6 +173,37 @@ class ContextService:
             logger.error(f"Error saving user preferences: {e}")
             return False
     
+    @staticmethod
+    def _history_update(
+        user_id: str,
+        message: str,
+        response: str,
+        trip_data: Dict[str, Any] = None,
+        timestamp: datetime = None,
+        turn_id: str = None
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Filter and update appending one entry to a user's conversation history"""
+        conversation_entry = {
+            "timestamp": timestamp or datetime.utcnow(),
+            "user_message": message,
+            "ai_response": response,
+            "trip_data": trip_data
+        }
+        if turn_id:
+            conversation_entry["turn_id"] = turn_id
+        return (
+            {"user_id": user_id},
+            {
+                "$push": {
+                    "conversation_history": {
+                        "$each": [conversation_entry],
+                        "$slice": -50  # Keep only last 50 conversations
+                    }
+                },
+                "$set": {"last_activity": datetime.utcnow()}
+            }
+        )
+
     async def update_conversation_history(
         self,
         user_id: str,
@@ -182,25 +214,9 @@ class ContextService:
     ) -> bool:
         """Update conversation history"""
         try:
-            conversation_entry = {
-                "timestamp": datetime.utcnow(),
-                "user_message": message,
-                "ai_response": response,
-                "trip_data": trip_data
-            }
-            
             # Update in MongoDB
             await self.context_collection.update_one(
-                {"user_id": user_id},
-                {
-                    "$push": {
-                        "conversation_history": {
-                            "$each": [conversation_entry],
-                            "$slice": -50  # Keep only last 50 conversations
-                        }
-                    },
-                    "$set": {"last_activity": datetime.utcnow()}
-                },
+                *self._history_update(user_id, message, response, trip_data),
                 upsert=True
             )
             
@@ -209,6 +225,31 @@ class ContextService:
         except Exception as e:
             logger.error(f"Error updating conversation history: {e}")
             return False
+
+    async def apply_history(self, entries: List[Dict[str, Any]], replay: bool = False) -> None:
+        """Append buffered history entries (``_history_update`` arguments) with one bulk_write.
+
+        Timestamps may be ISO strings. With ``replay``, entries whose ``turn_id`` is
+        already stored are skipped.
+        """
+        if replay:
+            kept = []
+            for entry in entries:
+                stored = await self.context_collection.find_one(
+                    {"user_id": entry["user_id"], "conversation_history.turn_id": entry.get("turn_id")},
+                    {"_id": 1}
+                )
+                if stored is None:
+                    kept.append(entry)
+            entries = kept
+        if not entries:
+            return
+        operations = []
+        for entry in entries:
+            if isinstance(entry.get("timestamp"), str):
+                entry = {**entry, "timestamp": datetime.fromisoformat(entry["timestamp"])}
+            operations.append(UpdateOne(*self._history_update(**entry), upsert=True))
+        await self.context_collection.bulk_write(operations, ordered=True)
     
     async def get_conversation_history(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Get recent conversation history"""
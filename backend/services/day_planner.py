@@ -0,0 +1,379 @@
+"""
+Parallel per-day itinerary planner.
+
+Instead of one large prompt for the whole trip, the planner:
+1. plans a day-level skeleton (city and theme per day) with one short prompt,
+2. generates each day's activities concurrently under a concurrency cap,
+   retrying a failed day on its own,
+3. merges the days into CityVisit/DayPlan blocks and validates the TripPlan.
+A day that still fails after its retries gets a placeholder so the trip is always complete.
+
+Each generated day is recorded with a content hash of the inputs that shape it (city,
+theme, content-relevant trip details). Given the previous plan and its PlanState, only days
+whose hash changed (or that no longer fit the daily budget) are regenerated; the rest are
+reused with their dates rebased and their totals re-priced.
+"""
+
+from typing import Dict, Any, List, Optional, Protocol, Tuple
+from datetime import date, timedelta
+import asyncio
+import hashlib
+import json
+import logging
+
+from pydantic import BaseModel
+
+from ..config import settings
+from ..models import TripPlan, DayPlan, Activity
+from .circuit_breaker import CircuitOpenError
+from .llm_json import extract_json, coerce_activity
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THEMES = ["highlights", "culture", "food", "nature", "neighborhoods", "shopping", "relaxed"]
+# Trip details that change what a day contains; everything else (budget type, amount,
+# travelers, trip length) only changes pricing or adds/removes days
+CONTENT_FIELDS = ("destination", "country", "interests", "transport_preference", "accommodation_type")
+
+
+class TextGenerator(Protocol):
+    async def generate_async(self, prompt: str, system_prompt: Optional[str] = None) -> str: ...
+
+
+class DaySkeleton(BaseModel):
+    """What one day of the trip is about, decided before any activity is generated"""
+    day_number: int
+    date: date
+    city: str
+    country: str = "Unknown"
+    theme: str = "highlights"
+
+
+class PlanState(BaseModel):
+    """What is kept next to a TripPlan so it can be patched instead of regenerated"""
+    trip_details: Dict[str, Any] = {}
+    skeleton: List[DaySkeleton] = []
+    # day_number (as str, for JSON storage) -> content hash; "" marks a placeholder day
+    day_hashes: Dict[str, str] = {}
+    regenerated_days: List[int] = []
+    reused_days: List[int] = []
+
+
+def content_fields(trip_details: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: trip_details.get(field) for field in CONTENT_FIELDS}
+
+
+def day_content_hash(day: DaySkeleton, trip_details: Dict[str, Any]) -> str:
+    """Hash of everything that determines a day's activities (not its date or pricing)"""
+    canonical = json.dumps({
+        "day_number": day.day_number,
+        "city": day.city,
+        "country": day.country,
+        "theme": day.theme,
+        "trip": content_fields(trip_details),
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class DayGenerationError(Exception):
+    """The LLM reply for a day could not be turned into a valid DayPlan"""
+
+
+class ParallelDayPlanner:
+    """Skeleton -> concurrent per-day generation -> merge into a validated TripPlan"""
+
+    def __init__(
+        self,
+        llm: TextGenerator,
+        max_concurrency: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        day_timeout: Optional[float] = None,
+    ):
+        self.llm = llm
+        self.max_concurrency = max_concurrency or settings.ITINERARY_DAY_CONCURRENCY
+        self.max_attempts = max_attempts or settings.ITINERARY_DAY_MAX_ATTEMPTS
+        self.day_timeout = day_timeout or settings.LLM_ITINERARY_DAY_TIMEOUT_SECONDS
+
+    async def plan(
+        self,
+        trip_details: Dict[str, Any],
+        total_budget: float,
+        start_date: Optional[date] = None,
+        trip_title: Optional[str] = None,
+        previous_plan: Optional[TripPlan] = None,
+        previous_state: Optional[PlanState] = None,
+    ) -> Tuple[TripPlan, PlanState]:
+        """Build the trip, reusing unchanged days of ``previous_plan`` when given"""
+        duration = max(1, int(trip_details.get("duration_days") or 3))
+        if previous_plan is None or previous_state is None:
+            previous_plan, previous_state = None, None
+        start = start_date or self._reuse_start(previous_plan) or date.today()
+
+        skeleton = None
+        if previous_state is not None and content_fields(previous_state.trip_details) == content_fields(trip_details):
+            skeleton = self._extend_skeleton(previous_state.skeleton, trip_details, duration, start)
+        if skeleton is None:
+            skeleton = await self.plan_skeleton(trip_details, duration, start)
+
+        per_day_budget = round(total_budget / duration, 2)
+        travelers = max(1, int(trip_details.get("travelers") or 1))
+        previous_days = {
+            day.day_number: day
+            for city in (previous_plan.cities if previous_plan else [])
+            for day in city.days
+        }
+
+        hashes = {str(day.day_number): day_content_hash(day, trip_details) for day in skeleton}
+        days: Dict[int, DayPlan] = {}
+        stale: List[DaySkeleton] = []
+        for outline in skeleton:
+            old_day = previous_days.get(outline.day_number)
+            old_hash = previous_state.day_hashes.get(str(outline.day_number)) if previous_state else None
+            if old_day is not None and old_hash and old_hash == hashes[str(outline.day_number)] \
+                    and self._fits_budget(old_day, travelers, per_day_budget):
+                days[outline.day_number] = self._rebase_day(old_day, outline.date, travelers, per_day_budget)
+            else:
+                stale.append(outline)
+
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+
+        async def bounded(day: DaySkeleton) -> Tuple[DayPlan, bool]:
+            async with semaphore:
+                return await self.generate_day(day, trip_details, per_day_budget)
+
+        for outline, (day, generated) in zip(stale, await asyncio.gather(*(bounded(day) for day in stale))):
+            days[outline.day_number] = day
+            if not generated:
+                # Placeholder days are always stale so the next change retries them
+                hashes[str(outline.day_number)] = ""
+
+        state = PlanState(
+            trip_details=trip_details,
+            skeleton=skeleton,
+            day_hashes=hashes,
+            regenerated_days=[day.day_number for day in stale],
+            reused_days=[n for n in days if n not in {day.day_number for day in stale}],
+        )
+        if previous_plan is not None:
+            logger.info(f"Patched itinerary: reused days {state.reused_days}, regenerated {state.regenerated_days}")
+        plan = self.merge(skeleton, [days[day.day_number] for day in skeleton], trip_details, total_budget, trip_title)
+        return plan, state
+
+    @staticmethod
+    def _reuse_start(previous_plan: Optional[TripPlan]) -> Optional[date]:
+        """Keep the previous trip's dates unless they are already in the past"""
+        if previous_plan is not None and previous_plan.start_date >= date.today():
+            return previous_plan.start_date
+        return None
+
+    def _extend_skeleton(
+        self,
+        previous: List[DaySkeleton],
+        trip_details: Dict[str, Any],
+        duration: int,
+        start: date,
+    ) -> Optional[List[DaySkeleton]]:
+        """Previous outline cut or extended to ``duration`` days, with dates from ``start``"""
+        if not previous:
+            return None
+        themes = self._themes(trip_details)
+        skeleton = []
+        for i in range(duration):
+            base = previous[i] if i < len(previous) else previous[-1]
+            skeleton.append(DaySkeleton(
+                day_number=i + 1,
+                date=start + timedelta(days=i),
+                city=base.city,
+                country=base.country,
+                theme=base.theme if i < len(previous) else themes[i % len(themes)],
+            ))
+        return skeleton
+
+    def _fits_budget(self, day: DayPlan, travelers: int, per_day_budget: float) -> bool:
+        spent = sum(a.estimated_cost for a in day.activities) * travelers
+        return spent <= per_day_budget * settings.ITINERARY_BUDGET_TOLERANCE
+
+    def _rebase_day(self, day: DayPlan, new_date: date, travelers: int, per_day_budget: float) -> DayPlan:
+        """Reuse a day's content with a new date and re-priced total"""
+        return day.model_copy(update={
+            "date": new_date,
+            "daily_budget_total": self._price_day(day.activities, travelers, per_day_budget),
+        })
+
+    @staticmethod
+    def _price_day(activities: List[Activity], travelers: int, per_day_budget: float) -> float:
+        spent = round(sum(a.estimated_cost for a in activities) * travelers, 2)
+        return spent or per_day_budget
+
+    @staticmethod
+    def _themes(trip_details: Dict[str, Any]) -> List[str]:
+        interests = trip_details.get("interests") or []
+        return list(interests) + [t for t in DEFAULT_THEMES if t not in interests]
+
+    async def plan_skeleton(self, trip_details: Dict[str, Any], duration: int, start: date) -> List[DaySkeleton]:
+        """City and theme for each day; falls back to one city with rotating themes"""
+        destination = trip_details.get("destination") or "Tokyo"
+        country = trip_details.get("country") or "Unknown"
+        themes = self._themes(trip_details)
+        fallback = [
+            DaySkeleton(
+                day_number=i + 1,
+                date=start + timedelta(days=i),
+                city=destination,
+                country=country,
+                theme=themes[i % len(themes)],
+            )
+            for i in range(duration)
+        ]
+        if duration == 1:
+            return fallback
+
+        prompt = f"""
+            Plan the day-by-day outline of a {duration}-day trip.
+
+            Trip Details: {trip_details}
+
+            Return ONLY a JSON array with exactly {duration} objects, one per day, in order:
+            [{{"day_number": 1, "city": "city name", "country": "country", "theme": "short theme"}}]
+            Stay in {destination} unless the trip details clearly ask for several cities.
+            """
+        try:
+            raw = await asyncio.wait_for(self.llm.generate_async(prompt), timeout=self.day_timeout)
+            entries = extract_json(raw)
+            if not isinstance(entries, list) or len(entries) != duration:
+                raise ValueError(f"expected {duration} days, got {len(entries) if isinstance(entries, list) else 'non-list'}")
+            return [
+                DaySkeleton(
+                    day_number=i + 1,
+                    date=start + timedelta(days=i),
+                    city=str(entry.get("city") or destination),
+                    country=str(entry.get("country") or country),
+                    theme=str(entry.get("theme") or fallback[i].theme),
+                )
+                for i, entry in enumerate(entries)
+            ]
+        except Exception as e:
+            logger.warning(f"Skeleton planning failed, using single-city outline: {e}")
+            return fallback
+
+    async def generate_day(
+        self,
+        day: DaySkeleton,
+        trip_details: Dict[str, Any],
+        per_day_budget: float
+    ) -> Tuple[DayPlan, bool]:
+        """Generate one day, retrying just this day.
+
+        Returns the day and whether it was generated (False for a placeholder day after
+        every attempt failed).
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                raw = await asyncio.wait_for(
+                    self.llm.generate_async(self._day_prompt(day, trip_details, per_day_budget, attempt)),
+                    timeout=self.day_timeout,
+                )
+                return self._parse_day(day, raw, trip_details, per_day_budget), True
+            except CircuitOpenError:
+                break
+            except Exception as e:
+                logger.warning(f"Day {day.day_number} attempt {attempt}/{self.max_attempts} failed: {e}")
+        return self._placeholder_day(day, per_day_budget), False
+
+    def _day_prompt(self, day: DaySkeleton, trip_details: Dict[str, Any], per_day_budget: float, attempt: int) -> str:
+        retry_note = "\n            Your previous answer was not valid JSON; return only the JSON object." if attempt > 1 else ""
+        return f"""
+            Plan day {day.day_number} ({day.date.isoformat()}) of a trip in {day.city}, {day.country}.
+            Theme of the day: {day.theme}
+            Trip Details: {trip_details}
+            Budget for the day: about {per_day_budget} USD for the whole group.
+
+            Return ONLY a JSON object:
+            {{"activities": [{{"time": "HH:MM", "name": "place or activity", "description": "one sentence",
+              "estimated_cost": 0.0, "lat": 0.0, "lng": 0.0}}]}}
+            Use 3 to 5 activities in chronological order with real places in {day.city}.{retry_note}
+            """
+
+    def _parse_day(self, day: DaySkeleton, raw: str, trip_details: Dict[str, Any], per_day_budget: float) -> DayPlan:
+        data = extract_json(raw)
+        items = data.get("activities") if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            raise DayGenerationError("no activities in response")
+
+        activities: List[Activity] = []
+        for index, item in enumerate(items):
+            try:
+                activities.append(coerce_activity(item, f"day{day.day_number}-act{index + 1}", index))
+            except ValueError as e:
+                logger.debug(f"Skipping malformed activity on day {day.day_number}: {e}")
+        if not activities:
+            raise DayGenerationError("no valid activities in response")
+
+        activities.sort(key=lambda a: a.time)
+        travelers = max(1, int(trip_details.get("travelers") or 1))
+        return DayPlan(
+            day_number=day.day_number,
+            date=day.date,
+            activities=activities,
+            daily_budget_total=self._price_day(activities, travelers, per_day_budget),
+        )
+
+    @staticmethod
+    def _placeholder_day(day: DaySkeleton, per_day_budget: float) -> DayPlan:
+        return DayPlan(
+            day_number=day.day_number,
+            date=day.date,
+            activities=[Activity(
+                activity_id=f"day{day.day_number}-act1",
+                time="09:00",
+                name=f"Explore {day.city} - {day.theme.title()}",
+                description=f"Discover {day.theme} spots in {day.city} at your own pace.",
+                estimated_cost=25.0,
+                place_coords={"lat": 0.0, "lng": 0.0},
+                estimated=True,
+            )],
+            daily_budget_total=per_day_budget,
+        )
+
+    def merge(
+        self,
+        skeleton: List[DaySkeleton],
+        days: List[DayPlan],
+        trip_details: Dict[str, Any],
+        total_budget: float,
+        trip_title: Optional[str] = None,
+    ) -> TripPlan:
+        """Group consecutive days in the same city into CityVisits and validate the plan"""
+        transport = trip_details.get("transport_preference") or "flight"
+        cities: List[Dict[str, Any]] = []
+        for outline, day in zip(skeleton, sorted(days, key=lambda d: d.day_number)):
+            if not cities or cities[-1]["city_name"] != outline.city:
+                cities.append({
+                    "city_name": outline.city,
+                    "country": outline.country,
+                    "arrival": {"date": str(outline.date), "time": "09:00", "by": transport},
+                    "departure": {"date": str(outline.date), "time": "18:00", "by": transport},
+                    "hotels": [],
+                    "days": [],
+                    "transport_options": {},
+                })
+            cities[-1]["days"].append(day)
+            cities[-1]["departure"]["date"] = str(outline.date + timedelta(days=1))
+
+        start = skeleton[0].date
+        destination = trip_details.get("destination") or skeleton[0].city
+        return TripPlan(
+            trip_title=trip_title or f"{len(skeleton)}-Day {destination} Itinerary",
+            total_days=len(skeleton),
+            start_date=start,
+            end_date=start + timedelta(days=len(skeleton)),
+            total_budget=total_budget,
+            currency="USD",
+            cities=cities,
+        )
+
+# Export for easy import
+__all__ = [
+    'ParallelDayPlanner', 'DaySkeleton', 'PlanState', 'DayGenerationError',
+    'day_content_hash', 'extract_json',
+]
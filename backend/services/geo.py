@@ -0,0 +1,59 @@
+"""
+Location helpers shared by the weather and routing services.
+"""
+
+from typing import Dict, Optional, Tuple, Union
+import re
+
+import numpy as np
+
+# A place name, or coordinates as (lat, lng) or {"lat": ..., "lng": ...}
+Location = Union[str, Tuple[float, float], Dict[str, float]]
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS_KM = 6371.0
+
+
+def geohash(lat: float, lng: float, precision: int = 5) -> str:
+    """Standard base32 geohash; precision 5 is a ~5km cell"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def normalize_location(name: str) -> str:
+    """Case-, punctuation- and whitespace-insensitive place name ("  Paris,France. " -> "paris, france")"""
+    cleaned = re.sub(r"[^\w\s,]", "", name.lower())
+    return ", ".join(" ".join(part.split()) for part in cleaned.split(",") if part.strip())
+
+
+def coords_of(location: Location) -> Optional[Tuple[float, float]]:
+    if isinstance(location, dict):
+        return float(location["lat"]), float(location["lng"])
+    if isinstance(location, (tuple, list)):
+        return float(location[0]), float(location[1])
+    return None
+
+
+def haversine_km(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Great-circle distance in km; arguments broadcast like numpy arrays"""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+__all__ = ['Location', 'geohash', 'normalize_location', 'coords_of', 'haversine_km', 'EARTH_RADIUS_KM']
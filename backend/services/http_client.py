@@ -0,0 +1,112 @@
+"""
+Shared async HTTP client for outbound API calls (weather, maps, search).
+
+One pooled ``httpx.AsyncClient`` per event loop keeps connections alive across tool
+calls, a semaphore per host caps concurrent requests to any one provider, and
+``request_json`` retries transport errors, 429s and 5xx responses with exponential
+backoff (honouring ``Retry-After``).
+"""
+
+from typing import Dict, Any, Optional
+from collections import defaultdict
+from urllib.parse import urlsplit
+import asyncio
+import logging
+import random
+
+import httpx
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HttpClient:
+    """Lazily created pooled client with per-host limits and retries"""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"requests": 0, "retries": 0, "failures": 0})
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            # Pools and semaphores are bound to the loop that created them
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+                ),
+                timeout=httpx.Timeout(settings.HTTP_TIMEOUT_SECONDS, connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS),
+                follow_redirects=True,
+            )
+            self._loop = loop
+            self._host_limits = {}
+        return self._client
+
+    def _host_limit(self, host: str) -> asyncio.Semaphore:
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(max(1, settings.HTTP_PER_HOST_LIMIT))
+        return limit
+
+    @staticmethod
+    def _backoff(attempt: int, response: Optional[httpx.Response]) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), settings.HTTP_RETRY_MAX_BACKOFF_SECONDS)
+        delay = settings.HTTP_RETRY_BACKOFF_SECONDS * (2 ** attempt)
+        return min(delay, settings.HTTP_RETRY_MAX_BACKOFF_SECONDS) * random.uniform(0.5, 1.0)
+
+    async def request(self, method: str, url: str, *, retries: Optional[int] = None, **kwargs: Any) -> httpx.Response:
+        """Send a request, retrying transient failures; raises the last error when they run out"""
+        client = self._get_client()
+        host = urlsplit(url).netloc
+        stats = self._stats[host]
+        retries = settings.HTTP_MAX_RETRIES if retries is None else retries
+
+        for attempt in range(retries + 1):
+            response: Optional[httpx.Response] = None
+            try:
+                async with self._host_limit(host):
+                    stats["requests"] += 1
+                    response = await client.request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUSES or attempt == retries:
+                    response.raise_for_status()
+                    return response
+            except httpx.TransportError as e:
+                if attempt == retries:
+                    stats["failures"] += 1
+                    raise
+                logger.debug(f"{method} {host} failed ({e.__class__.__name__}), retrying")
+            except httpx.HTTPStatusError:
+                stats["failures"] += 1
+                raise
+            stats["retries"] += 1
+            await asyncio.sleep(self._backoff(attempt, response))
+        raise RuntimeError("unreachable")
+
+    async def get_json(self, url: str, params: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Any:
+        response = await self.request("GET", url, params=params, **kwargs)
+        return response.json()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {host: dict(counts) for host, counts in self._stats.items()}
+
+    async def close(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+        self._host_limits = {}
+
+
+# Create a singleton instance
+http_client = HttpClient()
+
+__all__ = ['HttpClient', 'http_client', 'RETRY_STATUSES']
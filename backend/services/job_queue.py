@@ -0,0 +1,297 @@
+"""
+Redis-backed job queue for long-running generation work (itineraries, trip plans).
+
+Layout:
+- ``job:{id}``            hash with status, payload, attempts, result, error and one
+                          ``partial:{key}`` field per key of the partial result
+- ``jobs:pending``        list of job ids ready to run (LPUSH / RPOPLPUSH)
+- ``jobs:processing``     list of job ids claimed by a worker
+- ``jobs:delayed``        sorted set of job ids waiting for a retry, scored by ready time
+- ``jobs:dedup:{hash}``   job id for an input hash, so identical submissions share a job
+- ``job:{id}:events``     pub/sub channel with status and partial-result events
+
+The API submits and reads jobs; ``python -m backend.worker`` runs them.
+"""
+
+from typing import Dict, Any, Optional, AsyncIterator, Tuple
+from datetime import datetime
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+
+from ..config import settings
+from ..db import get_redis
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TERMINAL_STATUSES = (SUCCEEDED, FAILED)
+
+# Moves retry-delayed jobs whose time has come back onto the pending list
+_PROMOTE_DELAYED_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+for _, id in ipairs(due) do
+    redis.call('ZREM', KEYS[1], id)
+    redis.call('LPUSH', KEYS[2], id)
+end
+return #due
+"""
+
+# Moves the next pending job to the processing list and starts its lease in one step, so
+# recover_abandoned never sees a claimed job without a current lease. Jobs whose hash
+# expired while queued are dropped.
+_CLAIM_SCRIPT = """
+local id = redis.call('RPOPLPUSH', KEYS[1], KEYS[2])
+while id do
+    local key = ARGV[1] .. id
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('HINCRBY', key, 'attempts', 1)
+        redis.call('HSET', key, 'status', ARGV[2], 'lease_until', ARGV[3], 'updated_at', ARGV[4])
+        return id
+    end
+    redis.call('LREM', KEYS[2], 0, id)
+    id = redis.call('RPOPLPUSH', KEYS[1], KEYS[2])
+end
+return false
+"""
+
+# Hands a dedup slot to a new job only if it still names the job the caller saw
+# (or has expired), so concurrent submitters can't both take over the slot
+_TAKE_OVER_DEDUP_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current and current ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+# Fields stored as JSON strings in the job hash
+_JSON_FIELDS = ("payload", "partial", "result")
+# Each key of the partial result is its own hash field, so concurrent reports don't clash
+PARTIAL_FIELD_PREFIX = "partial:"
+
+
+def input_hash(kind: str, payload: Dict[str, Any]) -> str:
+    """Stable hash of a job's kind and input, used for deduplication"""
+    canonical = json.dumps({"kind": kind, "payload": payload}, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class JobQueue:
+    """Submit, claim and track jobs stored in Redis"""
+
+    def __init__(self, prefix: str = "jobs"):
+        self.prefix = prefix
+        self.pending_key = f"{prefix}:pending"
+        self.processing_key = f"{prefix}:processing"
+        self.delayed_key = f"{prefix}:delayed"
+
+    @staticmethod
+    def job_key(job_id: str) -> str:
+        return f"job:{job_id}"
+
+    @staticmethod
+    def channel(job_id: str) -> str:
+        return f"job:{job_id}:events"
+
+    def _dedup_key(self, digest: str) -> str:
+        return f"{self.prefix}:dedup:{digest}"
+
+    async def submit(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        dedup: bool = True,
+        max_attempts: Optional[int] = None,
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Queue a job; returns ``(job, created)``.
+
+        With ``dedup`` an identical (kind, payload) submission that is still queued,
+        running or succeeded returns the existing job instead of creating a new one.
+        """
+        redis = await get_redis()
+        digest = input_hash(kind, payload)
+        job_id = uuid.uuid4().hex
+
+        if dedup:
+            claimed = await redis.set(self._dedup_key(digest), job_id, nx=True, ex=settings.JOB_DEDUP_TTL_SECONDS)
+            while not claimed:
+                existing_id = await redis.get(self._dedup_key(digest))
+                existing = await self.get(existing_id) if existing_id else None
+                if existing and existing["status"] != FAILED:
+                    return existing, False
+                # The earlier job failed or expired: take over the dedup slot, unless another
+                # submitter just did (then the next pass returns its job)
+                claimed = await redis.eval(
+                    _TAKE_OVER_DEDUP_SCRIPT, 1, self._dedup_key(digest),
+                    existing_id or "", job_id, settings.JOB_DEDUP_TTL_SECONDS,
+                )
+
+        now = datetime.utcnow().isoformat()
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "status": QUEUED,
+            "payload": json.dumps(payload, default=str),
+            "input_hash": digest,
+            "attempts": 0,
+            "max_attempts": max_attempts or settings.JOB_MAX_ATTEMPTS,
+            "created_at": now,
+            "updated_at": now,
+        }
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self.job_key(job_id), mapping=job)
+            pipe.expire(self.job_key(job_id), settings.JOB_TTL_SECONDS)
+            pipe.lpush(self.pending_key, job_id)
+            await pipe.execute()
+        await self._publish(job_id, {"status": QUEUED})
+        return self._decode(job), True
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        redis = await get_redis()
+        raw = await redis.hgetall(self.job_key(job_id))
+        return self._decode(raw) if raw else None
+
+    async def claim(self, timeout: int = 5) -> Optional[Dict[str, Any]]:
+        """Wait up to ``timeout`` seconds for the next job and mark it running"""
+        redis = await get_redis()
+        deadline = time.monotonic() + timeout
+        while True:
+            await redis.eval(_PROMOTE_DELAYED_SCRIPT, 2, self.delayed_key, self.pending_key, time.time())
+            # A script can't block, so an empty queue is polled rather than waited on with BRPOPLPUSH
+            job_id = await redis.eval(
+                _CLAIM_SCRIPT, 2, self.pending_key, self.processing_key,
+                self.job_key(""), RUNNING, time.time() + settings.JOB_LEASE_SECONDS, datetime.utcnow().isoformat(),
+            )
+            if job_id:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            await asyncio.sleep(min(settings.JOB_CLAIM_POLL_INTERVAL_SECONDS, remaining))
+        await self._publish(job_id, {"status": RUNNING})
+        return await self.get(job_id)
+
+    async def heartbeat(self, job_id: str) -> None:
+        """Extend the running job's lease so it isn't recovered as abandoned"""
+        await self._update(job_id, lease_until=time.time() + settings.JOB_LEASE_SECONDS)
+
+    async def report_partial(self, job_id: str, partial: Dict[str, Any]) -> None:
+        """Merge ``partial`` into the job's partial result and notify subscribers"""
+        await self._update(job_id, **{
+            f"{PARTIAL_FIELD_PREFIX}{key}": json.dumps(value, default=str) for key, value in partial.items()
+        })
+        await self._publish(job_id, {"status": RUNNING, "partial": partial})
+
+    async def complete(self, job_id: str, result: Any) -> None:
+        redis = await get_redis()
+        await self._update(job_id, status=SUCCEEDED, result=json.dumps(result, default=str), error="")
+        await redis.lrem(self.processing_key, 0, job_id)
+        await self._publish(job_id, {"status": SUCCEEDED, "result": result})
+
+    async def fail(self, job_id: str, error: str) -> bool:
+        """Record a failed attempt; returns True if the job was scheduled for a retry"""
+        redis = await get_redis()
+        job = await self.get(job_id)
+        await redis.lrem(self.processing_key, 0, job_id)
+        if job is None:
+            return False
+        if job["attempts"] < job["max_attempts"]:
+            delay = settings.JOB_RETRY_BACKOFF_SECONDS * (2 ** (job["attempts"] - 1))
+            await self._update(job_id, status=QUEUED, error=error)
+            await redis.zadd(self.delayed_key, {job_id: time.time() + delay})
+            await self._publish(job_id, {"status": QUEUED, "error": error, "retry_in": delay})
+            return True
+        await self._update(job_id, status=FAILED, error=error)
+        await redis.delete(self._dedup_key(job["input_hash"]))
+        await self._publish(job_id, {"status": FAILED, "error": error})
+        return False
+
+    async def recover_abandoned(self) -> int:
+        """Requeue claimed jobs whose worker stopped renewing the lease"""
+        redis = await get_redis()
+        recovered = 0
+        now = time.time()
+        for job_id in await redis.lrange(self.processing_key, 0, -1):
+            lease_until = await redis.hget(self.job_key(job_id), "lease_until")
+            if lease_until is not None and float(lease_until) > now:
+                continue
+            if await redis.lrem(self.processing_key, 1, job_id):
+                if await redis.exists(self.job_key(job_id)):
+                    await self._update(job_id, status=QUEUED)
+                    await redis.lpush(self.pending_key, job_id)
+                    recovered += 1
+        if recovered:
+            logger.warning(f"Requeued {recovered} abandoned job(s)")
+        return recovered
+
+    async def events(self, job_id: str, timeout: float = 300.0) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the job's current state, then its events until it finishes"""
+        redis = await get_redis()
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(self.channel(job_id))
+        try:
+            # Snapshot after subscribing so no event between the two is lost
+            job = await self.get(job_id)
+            if job is None:
+                return
+            yield {"status": job["status"], "partial": job.get("partial"), "result": job.get("result"), "error": job.get("error")}
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                event = json.loads(message["data"])
+                yield event
+                if event.get("status") in TERMINAL_STATUSES:
+                    return
+        finally:
+            await pubsub.unsubscribe(self.channel(job_id))
+            await pubsub.close()
+
+    async def stats(self) -> Dict[str, int]:
+        redis = await get_redis()
+        return {
+            "pending": await redis.llen(self.pending_key),
+            "processing": await redis.llen(self.processing_key),
+            "delayed": await redis.zcard(self.delayed_key),
+        }
+
+    async def _update(self, job_id: str, **fields: Any) -> None:
+        redis = await get_redis()
+        fields["updated_at"] = datetime.utcnow().isoformat()
+        await redis.hset(self.job_key(job_id), mapping=fields)
+
+    async def _publish(self, job_id: str, event: Dict[str, Any]) -> None:
+        redis = await get_redis()
+        await redis.publish(self.channel(job_id), json.dumps({"job_id": job_id, **event}, default=str))
+
+    @staticmethod
+    def _decode(raw: Dict[str, Any]) -> Dict[str, Any]:
+        job = dict(raw)
+        for field in _JSON_FIELDS:
+            if job.get(field):
+                job[field] = json.loads(job[field])
+            else:
+                job[field] = None
+        for field in [field for field in job if field.startswith(PARTIAL_FIELD_PREFIX)]:
+            job["partial"] = {**(job["partial"] or {}), field[len(PARTIAL_FIELD_PREFIX):]: json.loads(job.pop(field))}
+        for field in ("attempts", "max_attempts"):
+            job[field] = int(job.get(field) or 0)
+        job.pop("lease_until", None)
+        return job
+
+# Create a singleton instance
+job_queue = JobQueue()
+
+# Export for easy import
+__all__ = ['JobQueue', 'job_queue', 'input_hash', 'QUEUED', 'RUNNING', 'SUCCEEDED', 'FAILED']
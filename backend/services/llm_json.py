@@ -0,0 +1,355 @@
+"""
+Lenient and incremental JSON parsing for structured LLM output.
+
+- ``repair_json`` fixes the usual LLM defects: code fences and chatter around the JSON,
+  comments, single or smart quotes, unquoted keys, Python literals, trailing or missing
+  commas, raw newlines in strings and output cut off mid-document.
+- ``JSONStreamParser`` consumes a token stream and returns every object as soon as its
+  closing brace arrives, tagged with its path (``("days", "*", "activities", "*")``), so
+  consumers can act on the first day before the last one is generated.
+- ``coerce_activity``/``coerce_day`` validate parsed objects into the ``Activity`` and
+  ``DayPlan`` models, filling what the LLM left out.
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import date
+import json
+import logging
+import re
+
+from pydantic import ValidationError
+
+from ..models import DayPlan, Activity
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOTS = ["09:00", "13:00", "16:00", "19:30"]
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.MULTILINE)
+_BAREWORDS = {"True": "true", "False": "false", "None": "null", "NaN": "null", "Infinity": "null", "undefined": "null"}
+# Closing quote(s) accepted for each opening quote
+_QUOTES = {'"': '"', "'": "'", "“": "”\"", "”": "”\""}
+
+Path = Tuple[str, ...]
+
+
+def _complete_number(token: str) -> str:
+    """A number cut off or written loosely ("1.", "2.5e", "-", "1.e3") as valid JSON"""
+    token = re.sub(r"\.(?=[eE])", "", token.rstrip(".eE+-"))
+    return token or "0"
+
+
+def repair_json(text: str) -> str:
+    """Best-effort rewrite of LLM output into valid JSON (the first object or array in it)"""
+    cleaned = _FENCE_RE.sub("", text.strip())
+    starts = [i for i in (cleaned.find("{"), cleaned.find("[")) if i >= 0]
+    if not starts:
+        raise ValueError("no JSON found in response")
+    src = cleaned[min(starts):]
+
+    out: List[str] = []
+    stack: List[str] = []
+    i, n = 0, len(src)
+
+    def last_significant() -> str:
+        for piece in reversed(out):
+            stripped = piece.rstrip()
+            if stripped:
+                return stripped[-1]
+        return ""
+
+    def separate() -> None:
+        # A value directly after another value: the LLM dropped a comma
+        if stack and last_significant() in ('"', "}", "]") + tuple("0123456789el"):
+            out.append(",")
+
+    def strip_trailing_comma() -> None:
+        while out and not out[-1].strip():
+            out.pop()
+        if out and out[-1].rstrip().endswith(","):
+            out[-1] = out[-1].rstrip()[:-1]
+
+    while i < n:
+        ch = src[i]
+        if ch in _QUOTES:
+            separate()
+            closers = _QUOTES[ch]
+            buf = []
+            i += 1
+            while i < n and src[i] not in closers:
+                c = src[i]
+                if c == "\\" and i + 1 < n:
+                    nxt = src[i + 1]
+                    buf.append("'" if nxt == "'" else c + nxt)
+                    i += 2
+                    continue
+                if c == '"':
+                    buf.append('\\"')
+                elif c == "\n":
+                    buf.append("\\n")
+                elif c in "\r\t":
+                    buf.append("\\r" if c == "\r" else "\\t")
+                else:
+                    buf.append(c)
+                i += 1
+            out.append('"' + "".join(buf) + '"')
+            i += 1
+            if not stack:
+                break
+            continue
+        if ch == "/" and src.startswith("//", i):
+            end = src.find("\n", i)
+            i = n if end < 0 else end
+            continue
+        if ch == "/" and src.startswith("/*", i):
+            end = src.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            continue
+        if ch in "{[":
+            separate()
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+        elif ch in "}]":
+            strip_trailing_comma()
+            if last_significant() == ":":
+                out.append("null")
+            # Close anything the LLM left open inside this container
+            while stack and stack[-1] != ch:
+                out.append(stack.pop())
+            if stack:
+                out.append(stack.pop())
+            if not stack:
+                break
+        elif ch.isalpha() or ch == "_":
+            j = i
+            while j < n and (src[j].isalnum() or src[j] in "_$"):
+                j += 1
+            word = src[i:j]
+            k = j
+            while k < n and src[k] in " \t":
+                k += 1
+            separate()
+            if k < n and src[k] == ":":
+                out.append(json.dumps(word))  # unquoted key
+            else:
+                out.append(_BAREWORDS.get(word, word if word in ("true", "false", "null") else json.dumps(word)))
+            i = j
+            continue
+        elif ch in "-0123456789":
+            j = i + 1
+            while j < n and src[j] in "0123456789.eE+-":
+                j += 1
+            separate()
+            out.append(_complete_number(src[i:j]))
+            i = j
+            continue
+        elif ch in ",:" or ch.isspace():
+            out.append(ch)
+        i += 1
+
+    # Output cut off mid-document: drop the dangling part and close what's open
+    strip_trailing_comma()
+    if stack and stack[-1] == "}" and last_significant() == '"':
+        # A key without its value
+        tokens = [piece for piece in out if piece.strip()]
+        if len(tokens) >= 2 and tokens[-2] in ("{", ","):
+            while not out[-1].strip():
+                out.pop()
+            out.pop()
+            strip_trailing_comma()
+    if last_significant() == ":":
+        out.append("null")
+    while stack:
+        out.append(stack.pop())
+    return "".join(out)
+
+
+def loads_lenient(text: str) -> Any:
+    """``json.loads``, falling back to ``repair_json`` for malformed LLM output"""
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        return json.loads(repair_json(text))
+
+
+def extract_json(text: str) -> Any:
+    """Parse the JSON object or array in an LLM reply, ignoring code fences and chatter"""
+    if not text or text.startswith("Error generating response"):
+        raise ValueError(text or "empty response")
+    return json.loads(repair_json(text))
+
+
+def normalize_time(value: Any, index: int) -> str:
+    """``HH:MM`` for the activity, or a default slot by position"""
+    match = re.match(r"^\s*(\d{1,2}):(\d{2})", str(value or ""))
+    if match and int(match.group(1)) < 24 and int(match.group(2)) < 60:
+        return f"{int(match.group(1)):02d}:{match.group(2)}"
+    return DEFAULT_SLOTS[min(index, len(DEFAULT_SLOTS) - 1)]
+
+
+def _number(value: Any) -> float:
+    if isinstance(value, str):
+        match = re.search(r"-?\d+(?:\.\d+)?", value.replace(",", ""))
+        return float(match.group()) if match else 0.0
+    return float(value or 0.0)
+
+
+def _coords(value: Any) -> Dict[str, Any]:
+    """``{"lat", "lng"}`` from a coordinates object, a ``[lat, lng]`` pair or a ``"lat,lng"`` string"""
+    if isinstance(value, dict):
+        return {"lat": value.get("lat", value.get("latitude")), "lng": value.get("lng", value.get("lon", value.get("longitude")))}
+    if isinstance(value, str):
+        value = value.split(",")
+    if isinstance(value, (list, tuple)) and len(value) == 2:
+        return {"lat": value[0], "lng": value[1]}
+    return {}
+
+
+def coerce_activity(item: Dict[str, Any], activity_id: str, index: int, currency: str = "USD") -> Activity:
+    """Validate one LLM activity object into an ``Activity``; raises ValueError if unusable"""
+    if not isinstance(item, dict):
+        raise ValueError("activity is not an object")
+    name = item.get("name") or item.get("title") or item.get("location")
+    if not name:
+        raise ValueError("activity has no name")
+    coords = _coords(item.get("place_coords") or item.get("coordinates"))
+    try:
+        return Activity(
+            activity_id=str(item.get("activity_id") or activity_id),
+            time=normalize_time(item.get("time"), index),
+            name=str(name),
+            description=str(item.get("description") or item.get("notes") or ""),
+            estimated_cost=_number(item.get("estimated_cost", item.get("cost"))),
+            currency=str(item.get("currency") or currency),
+            place_coords={
+                "lat": _number(item.get("lat", coords.get("lat"))),
+                "lng": _number(item.get("lng", coords.get("lng"))),
+            },
+            estimated=True,
+        )
+    except (TypeError, ValidationError) as e:
+        raise ValueError(f"invalid activity: {e}") from e
+
+
+def coerce_day(item: Dict[str, Any], day_number: int, day_date: date, currency: str = "USD") -> DayPlan:
+    """Validate one LLM day object into a ``DayPlan``, skipping malformed activities"""
+    if not isinstance(item, dict):
+        raise ValueError("day is not an object")
+    try:
+        day_number = int(item.get("day_number") or item.get("day") or day_number)
+    except (TypeError, ValueError):
+        pass
+    try:
+        day_date = date.fromisoformat(str(item.get("date")))
+    except ValueError:
+        pass
+
+    activities: List[Activity] = []
+    for index, raw in enumerate(item.get("activities") or []):
+        try:
+            activities.append(coerce_activity(raw, f"day{day_number}-act{index + 1}", index, currency))
+        except ValueError as e:
+            logger.debug(f"Skipping malformed activity on day {day_number}: {e}")
+    activities.sort(key=lambda a: a.time)
+
+    total = item.get("daily_budget_total", item.get("total_cost"))
+    return DayPlan(
+        day_number=day_number,
+        date=day_date,
+        activities=activities,
+        daily_budget_total=round(_number(total) if total is not None else sum(a.estimated_cost for a in activities), 2),
+    )
+
+
+class _Frame:
+    __slots__ = ("kind", "start", "path", "segment_start")
+
+    def __init__(self, kind: str, start: int, path: Path):
+        self.kind = kind
+        self.start = start
+        self.path = path
+        self.segment_start = start + 1
+
+
+class JSONStreamParser:
+    """Incremental parser over a streamed JSON document.
+
+    ``feed`` returns ``(path, value)`` for every object that closed in the new text;
+    paths use ``"*"`` for array positions, e.g. ``("days", "*", "activities", "*")``.
+    Only objects are reported (their enclosing arrays close later, if at all).
+    ``finish`` parses the whole document, repairing it if it was malformed or cut off.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._keys: List[Optional[str]] = []
+        self._quote: Optional[str] = None
+        self._escape = False
+
+    def feed(self, chunk: str) -> List[Tuple[Path, Any]]:
+        self.buffer += chunk
+        completed: List[Tuple[Path, Any]] = []
+        buf = self.buffer
+        for i in range(self._pos, len(buf)):
+            ch = buf[i]
+            if self._quote is not None:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch in _QUOTES[self._quote]:
+                    self._quote = None
+                continue
+            if not self._stack:
+                # Chatter before or between documents
+                if ch in "{[":
+                    self._open(ch, i, ())
+                continue
+            top = self._stack[-1]
+            if ch in _QUOTES:
+                self._quote = ch
+            elif ch in "{[":
+                self._open(ch, i, top.path + (self._child_key(),))
+            elif ch in "}]":
+                self._stack.pop()
+                self._keys.pop()
+                if ch == "}" and top.kind == "{":
+                    try:
+                        completed.append((top.path, loads_lenient(buf[top.start:i + 1])))
+                    except ValueError as e:
+                        logger.debug(f"Unparseable object at {top.path}: {e}")
+            elif ch == ":" and top.kind == "{":
+                self._keys[-1] = buf[top.segment_start:i].strip().strip("\"'“”") or None
+            elif ch == ",":
+                top.segment_start = i + 1
+                if top.kind == "{":
+                    self._keys[-1] = None
+        self._pos = len(buf)
+        return completed
+
+    def finish(self) -> Any:
+        """The complete document; raises ValueError if nothing parseable arrived"""
+        return loads_lenient(self.buffer)
+
+    def _child_key(self) -> str:
+        return "*" if self._stack[-1].kind == "[" else (self._keys[-1] or "?")
+
+    def _open(self, ch: str, index: int, path: Path) -> None:
+        self._stack.append(_Frame(ch, index, path))
+        self._keys.append(None)
+
+
+def is_day_path(path: Path) -> bool:
+    """Day objects: ``{"days": [...]}`` items, or items of a top-level array"""
+    return path in (("*",), ("days", "*")) or path[-2:] == ("days", "*")
+
+
+def is_activity_path(path: Path) -> bool:
+    return path[-2:] == ("activities", "*")
+
+
+__all__ = [
+    'JSONStreamParser', 'repair_json', 'loads_lenient', 'extract_json', 'normalize_time',
+    'coerce_activity', 'coerce_day', 'is_day_path', 'is_activity_path', 'DEFAULT_SLOTS',
+]
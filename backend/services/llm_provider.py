@@ -0,0 +1,362 @@
+"""
+Pluggable LLM providers behind the Gemini chat wrappers.
+- GeminiProvider: the real Google Generative AI backend
+- StubProvider: in-process fake with canned/template responses, configurable latency and errors
+- HttpStubProvider: client for the stub LLM server (backend.stub_llm_server)
+The active provider is chosen by the LLM_PROVIDER setting.
+"""
+
+from typing import Dict, Any, List, Optional, AsyncIterator
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timedelta
+import asyncio
+import json
+import logging
+import math
+import random
+import re
+import time
+
+import httpx
+
+try:
+    import google.generativeai as genai
+    GOOGLE_GENAI_AVAILABLE = True
+except Exception:
+    genai = None
+    GOOGLE_GENAI_AVAILABLE = False
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Gemini-style conversation: [{"role": "user" | "model", "parts": [str, ...]}, ...]
+Contents = List[Dict[str, Any]]
+
+
+class LLMProvider(ABC):
+    """Text-generation backend used by GeminiChat and the advanced AI service"""
+
+    name = "base"
+
+    @abstractmethod
+    async def generate(self, contents: Contents) -> str:
+        """Return the full reply to ``contents``"""
+
+    @abstractmethod
+    def stream(self, contents: Contents) -> AsyncIterator[str]:
+        """Yield the reply to ``contents`` chunk by chunk"""
+
+    @abstractmethod
+    def generate_sync(self, contents: Contents) -> str:
+        """Blocking counterpart of ``generate``"""
+
+
+def init_gemini():
+    """Initialize the Gemini API with the API key from settings."""
+    if not GOOGLE_GENAI_AVAILABLE:
+        raise ValueError("google-generativeai is not installed")
+    api_key = settings.GEMINI_API_KEY
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY environment variable not set")
+    genai.configure(api_key=api_key)
+    return genai
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini via google-generativeai"""
+
+    name = "gemini"
+
+    def __init__(self, model_name: str = "gemini-1.5-flash"):
+        self.model_name = model_name
+        self.model = init_gemini().GenerativeModel(model_name)
+
+    async def generate(self, contents: Contents) -> str:
+        response = await self.model.generate_content_async(contents)
+        return response.text
+
+    async def stream(self, contents: Contents) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(contents, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    def generate_sync(self, contents: Contents) -> str:
+        return self.model.generate_content(contents).text
+
+
+class StubLLMError(Exception):
+    """Failure injected by the stub provider"""
+
+
+def _last_user_text(contents: Contents) -> str:
+    for turn in reversed(contents):
+        if turn.get("role") == "user":
+            return "\n".join(str(part) for part in turn.get("parts", []))
+    return ""
+
+
+STUB_ACTIVITIES = [
+    ("Old Town walking tour", "cultural", 15.0, 120),
+    ("Local food market tasting", "food", 20.0, 90),
+    ("City museum visit", "cultural", 12.0, 120),
+    ("Riverside park stroll", "nature", 0.0, 60),
+    ("Street food dinner", "food", 18.0, 90),
+    ("Viewpoint at sunset", "nature", 5.0, 60),
+    ("Artisan quarter shopping", "shopping", 30.0, 120),
+    ("Cooking class", "food", 45.0, 150),
+]
+STUB_TIMES = ["09:00", "12:30", "15:00", "19:00"]
+
+
+class StubProvider(LLMProvider):
+    """Offline stand-in for Gemini for load and latency testing.
+
+    Replies are recognized from the prompt: itinerary prompts get a schema-valid
+    itinerary generated from a template, extraction prompts get trip-detail JSON,
+    tips prompts get a JSON tip list, anything else a canned conversational reply.
+    Latency follows ``latency_distribution`` ("fixed", "uniform" or "lognormal")
+    around ``latency_ms``; ``error_rate`` of calls fail with StubLLMError.
+    """
+
+    name = "stub"
+
+    def __init__(
+        self,
+        latency_distribution: Optional[str] = None,
+        latency_ms: Optional[float] = None,
+        latency_sigma: Optional[float] = None,
+        error_rate: Optional[float] = None,
+        stream_chunk_delay_ms: Optional[float] = None,
+        seed: Optional[int] = None,
+    ):
+        self.latency_distribution = latency_distribution or settings.LLM_STUB_LATENCY_DISTRIBUTION
+        self.latency_ms = latency_ms if latency_ms is not None else settings.LLM_STUB_LATENCY_MS
+        self.latency_sigma = latency_sigma if latency_sigma is not None else settings.LLM_STUB_LATENCY_SIGMA
+        self.error_rate = error_rate if error_rate is not None else settings.LLM_STUB_ERROR_RATE
+        self.stream_chunk_delay_ms = (
+            stream_chunk_delay_ms if stream_chunk_delay_ms is not None
+            else settings.LLM_STUB_STREAM_CHUNK_DELAY_MS
+        )
+        self._random = random.Random(seed if seed is not None else settings.LLM_STUB_SEED)
+
+    def sample_latency(self) -> float:
+        """Seconds the next reply should take"""
+        median = max(0.0, self.latency_ms) / 1000
+        if self.latency_distribution == "fixed" or median == 0:
+            return median
+        if self.latency_distribution == "uniform":
+            spread = median * min(1.0, self.latency_sigma)
+            return self._random.uniform(median - spread, median + spread)
+        return self._random.lognormvariate(math.log(median), self.latency_sigma)
+
+    def _maybe_fail(self) -> None:
+        if self._random.random() < self.error_rate:
+            raise StubLLMError("Stub LLM injected failure")
+
+    async def generate(self, contents: Contents) -> str:
+        await asyncio.sleep(self.sample_latency())
+        self._maybe_fail()
+        return self.render(contents)
+
+    async def stream(self, contents: Contents) -> AsyncIterator[str]:
+        await asyncio.sleep(self.sample_latency())
+        self._maybe_fail()
+        for i, chunk in enumerate(self._chunks(self.render(contents))):
+            if i:
+                await asyncio.sleep(self.stream_chunk_delay_ms / 1000)
+            yield chunk
+
+    def generate_sync(self, contents: Contents) -> str:
+        time.sleep(self.sample_latency())
+        self._maybe_fail()
+        return self.render(contents)
+
+    @staticmethod
+    def _chunks(text: str, size: int = 48) -> List[str]:
+        return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+    def render(self, contents: Contents) -> str:
+        """Reply text for ``contents`` (no latency or failures)"""
+        prompt = _last_user_text(contents)
+        lowered = prompt.lower()
+        if "extract key details in json" in lowered:
+            return self._render_extraction(prompt)
+        if "json array of tip objects" in lowered:
+            return self._render_tips(prompt)
+        if "day-by-day outline" in lowered:
+            return self._render_skeleton(prompt)
+        if '{"activities": [' in prompt:
+            match = re.search(r"Plan day (\d+)", prompt)
+            day = int(match.group(1)) - 1 if match else 0
+            return json.dumps({"activities": self._render_activities(self._find_destination(prompt), day)})
+        if "create a detailed travel itinerary" in lowered or '"days": [' in prompt:
+            return json.dumps(self._render_itinerary(prompt))
+        return (
+            "That sounds like a wonderful trip! Tell me where you'd like to go, how many days "
+            "you have and your rough budget, and I can put together a detailed itinerary for you."
+        )
+
+    def _render_extraction(self, prompt: str) -> str:
+        from .trip_extractor import trip_detail_extractor
+
+        match = re.search(r'User message:\s*"(.*?)"', prompt, re.DOTALL)
+        details = trip_detail_extractor.extract(match.group(1) if match else prompt).details
+        fields = [
+            "origin", "destination", "budget_type", "duration_days", "travelers",
+            "interests", "transport_preference", "accommodation_type",
+        ]
+        return json.dumps({field: details.get(field) for field in fields})
+
+    def _render_tips(self, prompt: str) -> str:
+        destination = self._find_destination(prompt)
+        return json.dumps([
+            {"category": "Money-saving", "tip": f"Buy a transit day pass in {destination}.", "priority": "high"},
+            {"category": "Food", "tip": f"Eat where locals queue in {destination}.", "priority": "medium"},
+            {"category": "Safety", "tip": "Keep a copy of your documents offline.", "priority": "high"},
+            {"category": "Timing", "tip": "Visit major sights right at opening time.", "priority": "medium"},
+        ])
+
+    def _render_skeleton(self, prompt: str) -> str:
+        destination = self._find_destination(prompt)
+        match = re.search(r"exactly (\d+) objects", prompt)
+        days = int(match.group(1)) if match else 3
+        themes = ["highlights", "culture", "food", "nature", "shopping"]
+        return json.dumps([
+            {"day_number": i + 1, "city": destination, "country": "Unknown", "theme": themes[i % len(themes)]}
+            for i in range(days)
+        ])
+
+    @staticmethod
+    def _render_activities(destination: str, day: int) -> List[Dict[str, Any]]:
+        activities = []
+        for slot, time_of_day in enumerate(STUB_TIMES):
+            name, kind, cost, minutes = STUB_ACTIVITIES[(day * 2 + slot) % len(STUB_ACTIVITIES)]
+            activities.append({
+                "time": time_of_day,
+                "name": f"{name} in {destination}",
+                "description": f"A {kind} highlight of {destination}.",
+                "location": destination,
+                "estimated_cost": cost,
+                "duration_minutes": minutes,
+                "notes": "",
+            })
+        return activities
+
+    def _render_itinerary(self, prompt: str) -> Dict[str, Any]:
+        destination = self._find_destination(prompt)
+        start, days = self._find_dates(prompt)
+        plan_days = [
+            {
+                "day_number": day + 1,
+                "date": (start + timedelta(days=day)).isoformat(),
+                "activities": self._render_activities(destination, day),
+            }
+            for day in range(days)
+        ]
+        total = sum(a["estimated_cost"] for d in plan_days for a in d["activities"])
+        return {
+            "days": plan_days,
+            "total_estimated_cost": round(total, 2),
+            "currency": "USD",
+            "recommendations": [f"Book popular {destination} attractions a few days ahead."],
+        }
+
+    @staticmethod
+    def _find_destination(prompt: str) -> str:
+        for pattern in (
+            r"Destination:\s*([^\n]+)", r"trip in ([A-Z][^,\n]+),",
+            r"'destination':\s*'([^']+)'", r"\bto ([A-Z][\w ]+?)[\s,.]",
+        ):
+            match = re.search(pattern, prompt)
+            if match and match.group(1).strip() not in ("Not specified", "None"):
+                return match.group(1).strip()
+        return "Tokyo"
+
+    @staticmethod
+    def _find_dates(prompt: str) -> "tuple[date, int]":
+        dates = re.findall(r"\d{4}-\d{2}-\d{2}", prompt)
+        start = date.today() + timedelta(days=30)
+        if dates:
+            try:
+                start = datetime.strptime(dates[0], "%Y-%m-%d").date()
+                if len(dates) > 1:
+                    end = datetime.strptime(dates[1], "%Y-%m-%d").date()
+                    return start, max(1, min(14, (end - start).days + 1))
+            except ValueError:
+                pass
+        match = re.search(r"'duration_days':\s*(\d+)|(\d+)[\s-]*days?\b", prompt)
+        days = int(match.group(1) or match.group(2)) if match else 3
+        return start, max(1, min(14, days))
+
+
+class HttpStubProvider(LLMProvider):
+    """Talks to the stub LLM server so the fake backend runs in its own process"""
+
+    name = "stub_http"
+
+    def __init__(self, base_url: Optional[str] = None, timeout: float = 60.0):
+        self.base_url = (base_url or settings.LLM_STUB_URL).rstrip("/")
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout)
+        return self._client
+
+    async def generate(self, contents: Contents) -> str:
+        response = await self._get_client().post("/generate", json={"contents": contents})
+        response.raise_for_status()
+        return response.json()["text"]
+
+    async def stream(self, contents: Contents) -> AsyncIterator[str]:
+        async with self._get_client().stream(
+            "POST", "/generate", json={"contents": contents, "stream": True}
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    yield json.loads(line)["text"]
+
+    def generate_sync(self, contents: Contents) -> str:
+        response = httpx.post(f"{self.base_url}/generate", json={"contents": contents}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["text"]
+
+
+def get_llm_provider(model_name: str = "gemini-1.5-flash") -> LLMProvider:
+    """Create the provider selected by LLM_PROVIDER"""
+    provider = settings.LLM_PROVIDER.lower()
+    if provider == "stub":
+        return StubProvider()
+    if provider == "stub_http":
+        return HttpStubProvider()
+    if provider != "gemini":
+        raise ValueError(f"Unknown LLM_PROVIDER '{settings.LLM_PROVIDER}'")
+    return GeminiProvider(model_name)
+
+
+def as_langchain_llm(provider: LLMProvider):
+    """Adapt a provider to a LangChain runnable so ``prompt | llm`` chains can use it"""
+    from langchain_core.messages import AIMessage
+    from langchain_core.runnables import RunnableLambda
+
+    async def ainvoke(prompt_value) -> AIMessage:
+        messages = prompt_value.to_messages() if hasattr(prompt_value, "to_messages") else []
+        text = "\n\n".join(str(m.content) for m in messages) or str(prompt_value)
+        return AIMessage(content=await provider.generate([{"role": "user", "parts": [text]}]))
+
+    def invoke(prompt_value) -> AIMessage:
+        messages = prompt_value.to_messages() if hasattr(prompt_value, "to_messages") else []
+        text = "\n\n".join(str(m.content) for m in messages) or str(prompt_value)
+        return AIMessage(content=provider.generate_sync([{"role": "user", "parts": [text]}]))
+
+    return RunnableLambda(invoke, afunc=ainvoke)
+
+# Export for easy import
+__all__ = [
+    'LLMProvider', 'GeminiProvider', 'StubProvider', 'HttpStubProvider', 'StubLLMError',
+    'init_gemini', 'get_llm_provider', 'as_langchain_llm',
+]
@@ -0,0 +1,242 @@
+"""
+Pairwise distance/duration/cost matrices between trip cities, per transport mode.
+
+The baseline is computed for all N x N pairs at once: a vectorized haversine over city
+coordinates, scaled by per-mode detour, speed, fixed overhead and cost factors. Where the
+Google Distance Matrix API is configured it replaces the baseline for the modes it
+covers. Entries are cached per unordered city pair and mode in a ``TwoTierCache``, so a
+later trip through any of the same pairs only asks the provider for the new ones.
+"""
+
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from dataclasses import dataclass
+import asyncio
+import logging
+
+import numpy as np
+
+from ..config import settings
+from ..repositories.city_repository import city_repository
+from .cache_service import TwoTierCache
+from .geo import Location, coords_of, geohash, haversine_km, normalize_location
+from .http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+# Distance Matrix API caps a request at 100 origin x destination elements
+_PROVIDER_BLOCK = 10
+
+
+@dataclass(frozen=True)
+class ModeProfile:
+    detour: float  # Travelled distance / great-circle distance
+    speed_kmh: float
+    overhead_minutes: float  # Stations, check-in, boarding
+    base_cost: float
+    cost_per_km: float
+    provider_params: Optional[Dict[str, str]] = None  # Distance Matrix parameters, if it covers the mode
+
+
+MODE_PROFILES: Dict[str, ModeProfile] = {
+    "driving": ModeProfile(1.3, 70.0, 0.0, 0.0, 0.2, {"mode": "driving"}),
+    "train": ModeProfile(1.2, 90.0, 30.0, 10.0, 0.12, {"mode": "transit", "transit_mode": "train|rail"}),
+    "bus": ModeProfile(1.3, 55.0, 15.0, 5.0, 0.06, {"mode": "transit", "transit_mode": "bus"}),
+    "flying": ModeProfile(1.05, 750.0, 150.0, 60.0, 0.1),
+}
+
+
+def _place(location: Location) -> str:
+    coords = coords_of(location)
+    return f"gh:{geohash(*coords, precision=6)}" if coords is not None else normalize_location(str(location))
+
+
+def pair_key(mode: str, a: Location, b: Location) -> str:
+    """Cache key for a city pair; the pair is unordered, so A->B and B->A share it"""
+    first, second = sorted((_place(a), _place(b)))
+    return f"{mode}:{first}|{second}"
+
+
+def _label(location: Location) -> str:
+    coords = coords_of(location)
+    return f"{coords[0]:.4f},{coords[1]:.4f}" if coords is not None else str(location)
+
+
+class RouteMatrixService:
+    """N x N route matrices with a per-pair cache in front of the provider"""
+
+    def __init__(self):
+        self.cache = TwoTierCache(
+            "route",
+            max_entries=settings.ROUTE_MATRIX_CACHE_MAX_ENTRIES,
+            local_ttl=settings.ROUTE_MATRIX_LOCAL_TTL_SECONDS,
+            redis_ttl=settings.ROUTE_MATRIX_PROVIDER_TTL_SECONDS,
+        )
+        self._coords: Dict[str, Tuple[float, float]] = {}
+        self.provider_calls = 0
+        self.provider_pairs = 0
+
+    @property
+    def _api_key(self) -> Optional[str]:
+        return settings.GOOGLE_MAPS_API_KEY
+
+    async def load_from_db(self) -> int:
+        """Index city coordinates by name (and "name, country") for the baseline"""
+        coords: Dict[str, Tuple[float, float]] = {}
+        async for city in city_repository.collection.find({}, {"name": 1, "country": 1, "latitude": 1, "longitude": 1}):
+            if not city.get("name") or city.get("latitude") is None or city.get("longitude") is None:
+                continue
+            point = (float(city["latitude"]), float(city["longitude"]))
+            coords.setdefault(normalize_location(city["name"]), point)
+            if city.get("country"):
+                coords.setdefault(normalize_location(f"{city['name']}, {city['country']}"), point)
+        self._coords = coords
+        logger.info(f"Route matrix loaded coordinates for {len(coords)} city names")
+        return len(coords)
+
+    def resolve(self, location: Location) -> Optional[Tuple[float, float]]:
+        coords = coords_of(location)
+        if coords is not None:
+            return coords
+        normalized = normalize_location(str(location))
+        return self._coords.get(normalized) or self._coords.get(normalized.split(",")[0].strip())
+
+    def baseline(self, points: np.ndarray, mode: str) -> Dict[str, np.ndarray]:
+        """Estimated distance, duration and cost for every pair of ``points`` (N x 2, NaN if unknown)"""
+        profile = MODE_PROFILES[mode]
+        lat, lng = points[:, 0], points[:, 1]
+        great_circle = haversine_km(lat[:, None], lng[:, None], lat[None, :], lng[None, :])
+        distance = great_circle * profile.detour
+        duration = distance / profile.speed_kmh * 60 + profile.overhead_minutes
+        cost = profile.base_cost + distance * profile.cost_per_km
+        for matrix in (distance, duration, cost):
+            np.fill_diagonal(matrix, 0.0)
+        return {"distance_km": distance, "duration_minutes": duration, "cost": cost}
+
+    async def _provider_entries(
+        self, cities: Sequence[Location], points: np.ndarray, pairs: List[Tuple[int, int]], mode: str
+    ) -> Dict[Tuple[int, int], Dict[str, Any]]:
+        """Distance Matrix results for ``pairs`` (i < j), one request per block of cities"""
+        profile = MODE_PROFILES[mode]
+        involved = sorted({index for pair in pairs for index in pair})
+        wanted = set(pairs)
+
+        def place(index: int) -> str:
+            point = points[index]
+            return str(cities[index]) if np.isnan(point).any() else f"{point[0]},{point[1]}"
+
+        async def fetch(origins: List[int], destinations: List[int]) -> Dict[Tuple[int, int], Dict[str, Any]]:
+            self.provider_calls += 1
+            data = await http_client.get_json(DISTANCE_MATRIX_URL, params={
+                "origins": "|".join(place(i) for i in origins),
+                "destinations": "|".join(place(j) for j in destinations),
+                "key": self._api_key,
+                **profile.provider_params
+            })
+            found = {}
+            for i, row in zip(origins, data.get("rows", [])):
+                for j, element in zip(destinations, row.get("elements", [])):
+                    pair = (min(i, j), max(i, j))
+                    if pair not in wanted or element.get("status") != "OK":
+                        continue
+                    distance = element["distance"]["value"] / 1000
+                    found[pair] = {
+                        "distance_km": round(distance, 1),
+                        "duration_minutes": round(element["duration"]["value"] / 60),
+                        "cost": round(profile.base_cost + distance * profile.cost_per_km, 2),
+                        "source": "provider",
+                    }
+            return found
+
+        blocks = [involved[k:k + _PROVIDER_BLOCK] for k in range(0, len(involved), _PROVIDER_BLOCK)]
+        results = await asyncio.gather(
+            *(fetch(origins, destinations) for n, origins in enumerate(blocks) for destinations in blocks[n:]),
+            return_exceptions=True
+        )
+        entries: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.warning(f"Distance Matrix request failed for {mode}: {result}")
+                continue
+            entries.update(result)
+        self.provider_pairs += len(entries)
+        return entries
+
+    async def get_matrix(self, cities: Sequence[Location], modes: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """Route matrices between ``cities`` for each mode.
+
+        Returns ``{"cities": [...], "modes": {mode: {"distance_km", "duration_minutes",
+        "cost", "source"}}}`` where each value is an N x N nested list indexed like
+        ``cities``. Pairs with neither coordinates nor provider data are None.
+        """
+        modes = [mode for mode in (modes or MODE_PROFILES) if mode in MODE_PROFILES]
+        cities = list(cities)
+        n = len(cities)
+        resolved = [self.resolve(city) for city in cities]
+        points = np.array([point or (np.nan, np.nan) for point in resolved], dtype=float).reshape(-1, 2)
+        pairs = [(i, j) for i in range(n) for j in range(i + 1, n)]
+
+        keys = {(mode, i, j): pair_key(mode, cities[i], cities[j]) for mode in modes for i, j in pairs}
+        cached = await self.cache.get_many(list(keys.values()))
+
+        result: Dict[str, Any] = {"cities": [_label(city) for city in cities], "modes": {}}
+        to_cache: Dict[str, Tuple[Any, Optional[int]]] = {}
+        for mode in modes:
+            profile = MODE_PROFILES[mode]
+            use_provider = bool(self._api_key and profile.provider_params)
+            entries: Dict[Tuple[int, int], Dict[str, Any]] = {}
+            missing: List[Tuple[int, int]] = []
+            for pair in pairs:
+                entry = cached.get(keys[(mode, *pair)])
+                # Cached estimates don't stand in for provider data once a provider is configured
+                if entry is not None and not (use_provider and entry.get("source") != "provider"):
+                    entries[pair] = entry
+                else:
+                    missing.append(pair)
+
+            if missing and use_provider:
+                fetched = await self._provider_entries(cities, points, missing, mode)
+                entries.update(fetched)
+                for pair, entry in fetched.items():
+                    to_cache[keys[(mode, *pair)]] = (entry, settings.ROUTE_MATRIX_PROVIDER_TTL_SECONDS)
+                missing = [pair for pair in missing if pair not in fetched]
+
+            if missing:
+                baseline = self.baseline(points, mode)
+                for i, j in missing:
+                    if np.isnan(baseline["distance_km"][i, j]):
+                        continue
+                    entries[(i, j)] = {
+                        "distance_km": round(float(baseline["distance_km"][i, j]), 1),
+                        "duration_minutes": round(float(baseline["duration_minutes"][i, j])),
+                        "cost": round(float(baseline["cost"][i, j]), 2),
+                        "source": "estimate",
+                    }
+                    to_cache[keys[(mode, i, j)]] = (entries[(i, j)], settings.ROUTE_MATRIX_ESTIMATE_TTL_SECONDS)
+
+            tables: Dict[str, List[List[Any]]] = {
+                field: [[0 if i == j else None for j in range(n)] for i in range(n)]
+                for field in ("distance_km", "duration_minutes", "cost")
+            }
+            tables["source"] = [[None] * n for _ in range(n)]
+            for (i, j), entry in entries.items():
+                for field in tables:
+                    tables[field][i][j] = tables[field][j][i] = entry[field]
+            result["modes"][mode] = tables
+
+        await self.cache.set_many(to_cache)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.cache.stats(),
+            "provider_calls": self.provider_calls,
+            "provider_pairs": self.provider_pairs,
+            "indexed_cities": len(self._coords),
+        }
+
+
+# Create a singleton instance
+route_matrix = RouteMatrixService()
+
+__all__ = ['RouteMatrixService', 'route_matrix', 'ModeProfile', 'MODE_PROFILES', 'pair_key']
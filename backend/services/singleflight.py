@@ -0,0 +1,159 @@
+"""
+Request coalescing ("singleflight") for expensive, idempotent calls such as LLM prompts.
+Concurrent callers with the same key share one in-flight call. The Redis variant extends
+this across workers with a lock plus a short-lived result key.
+"""
+
+from typing import Dict, Any, Callable, Awaitable, Optional, TypeVar
+import asyncio
+import hashlib
+import json
+import logging
+import uuid
+
+from ..config import settings
+from ..db import get_redis
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Deletes the lock only if we still own it
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def prompt_key(namespace: str, *parts: Any) -> str:
+    """Stable key for a prompt: case- and whitespace-insensitive hash of its parts"""
+    normalized = "\x1f".join(" ".join(str(part).split()).lower() for part in parts)
+    return f"{namespace}:{hashlib.sha256(normalized.encode('utf-8')).hexdigest()}"
+
+
+class SingleFlight:
+    """In-process coalescing: one shared task per key while it is in flight"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+        else:
+            self.shared += 1
+        # Shielded so one caller giving up doesn't cancel the call for everyone else
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every waiter went away
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._inflight)}
+
+
+class RedisSingleFlight(SingleFlight):
+    """Cross-worker coalescing on top of the in-process one.
+
+    The first worker to take ``sf:lock:<key>`` runs the call and publishes the result
+    under ``sf:result:<key>`` for ``result_ttl`` seconds; other workers poll for it.
+    Results must be JSON-serializable. If Redis is unavailable, or the lock holder
+    disappears without a result, callers fall back to running the call themselves.
+    """
+
+    def __init__(
+        self,
+        lock_ttl: Optional[int] = None,
+        result_ttl: Optional[int] = None,
+        poll_interval: float = 0.1,
+        prefix: str = "sf",
+    ):
+        super().__init__()
+        self.lock_ttl = lock_ttl or settings.LLM_SINGLEFLIGHT_LOCK_TTL_SECONDS
+        self.result_ttl = result_ttl or settings.LLM_SINGLEFLIGHT_RESULT_TTL_SECONDS
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self.remote_shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        return await super().do(key, lambda: self._do_distributed(key, fn))
+
+    async def _do_distributed(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        result_key = f"{self.prefix}:result:{key}"
+        lock_key = f"{self.prefix}:lock:{key}"
+        token = uuid.uuid4().hex
+        try:
+            redis = await get_redis()
+            cached = await redis.get(result_key)
+            if cached is not None:
+                self.remote_shared += 1
+                return json.loads(cached)
+            acquired = await redis.set(lock_key, token, nx=True, ex=self.lock_ttl)
+        except Exception as e:
+            logger.warning(f"Singleflight Redis unavailable, running call locally: {e}")
+            return await fn()
+
+        if acquired:
+            try:
+                result = await fn()
+                try:
+                    await redis.set(result_key, json.dumps(result), ex=self.result_ttl)
+                except Exception as e:
+                    logger.warning(f"Failed to publish singleflight result: {e}")
+                return result
+            finally:
+                try:
+                    await redis.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+                except Exception:
+                    pass
+
+        # Another worker is running the call: wait for its result
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_ttl
+        try:
+            while loop.time() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                cached = await redis.get(result_key)
+                if cached is not None:
+                    self.remote_shared += 1
+                    return json.loads(cached)
+                if not await redis.exists(lock_key):
+                    # The holder may have published and released since the read above
+                    cached = await redis.get(result_key)
+                    if cached is not None:
+                        self.remote_shared += 1
+                        return json.loads(cached)
+                    # Lock holder failed or gave up without a result
+                    break
+        except Exception as e:
+            logger.warning(f"Singleflight wait failed, running call locally: {e}")
+        return await fn()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["remote_shared"] = self.remote_shared
+        return stats
+
+
+def _create_llm_singleflight() -> SingleFlight:
+    if settings.LLM_SINGLEFLIGHT_REDIS:
+        return RedisSingleFlight()
+    return SingleFlight()
+
+# Shared coalescer for LLM prompts
+llm_singleflight = _create_llm_singleflight()
+
+# Export for easy import
+__all__ = ['SingleFlight', 'RedisSingleFlight', 'prompt_key', 'llm_singleflight']
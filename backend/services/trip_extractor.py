@@ -0,0 +1,302 @@
+"""
+Deterministic trip-detail extractor used as a fast path in front of the LLM.
+Combines compiled rules (duration, party size, currency amounts, budget keywords)
+with a destination gazetteer loaded from the cities collection.
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+import logging
+import re
+from pydantic import BaseModel
+
+from ..config import settings
+from ..repositories.city_repository import city_repository
+
+logger = logging.getLogger(__name__)
+
+# Seed gazetteer so the extractor is useful before (or without) the cities collection
+BUILTIN_DESTINATIONS: Dict[str, Optional[str]] = {
+    "Tokyo": "Japan", "Kyoto": "Japan", "Osaka": "Japan", "Paris": "France",
+    "London": "United Kingdom", "Rome": "Italy", "Barcelona": "Spain",
+    "New York": "United States", "Singapore": "Singapore", "Bali": "Indonesia",
+    "Bangkok": "Thailand", "Dubai": "United Arab Emirates", "Lisbon": "Portugal",
+    "Goa": "India", "Ahmedabad": "India", "Surat": "India", "Mumbai": "India",
+    "Delhi": "India", "Jaipur": "India", "Udaipur": "India", "Manali": "India",
+}
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11,
+    "twelve": 12, "fourteen": 14, "fifteen": 15, "twenty": 20,
+}
+_NUM = r"(\d{1,3}|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True)) + r")"
+
+DURATION_RE = re.compile(r"\b" + _NUM + r"[\s-]*(day|night|week|month)s?\b", re.IGNORECASE)
+WEEKEND_RE = re.compile(r"\b(long\s+)?weekend\b", re.IGNORECASE)
+FORTNIGHT_RE = re.compile(r"\bfortnight\b", re.IGNORECASE)
+DURATION_UNIT_DAYS = {"day": 1, "night": 1, "week": 7, "month": 30}
+
+TRAVELERS_RE = re.compile(
+    r"\b(?:group|family|party|team)\s+of\s+" + _NUM + r"\b|\b" + _NUM
+    + r"\s+(?:people|persons?|travell?ers|adults|pax|friends|guests|of us)\b",
+    re.IGNORECASE,
+)
+SOLO_RE = re.compile(r"\b(solo|alone|by myself|just me)\b", re.IGNORECASE)
+COUPLE_RE = re.compile(
+    r"\b(couple|honeymoon|my (?:wife|husband|partner|girlfriend|boyfriend|fianc[eé]e?))\b",
+    re.IGNORECASE,
+)
+
+CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP", "₹": "INR"}
+CURRENCY_WORDS = {
+    "usd": "USD", "dollar": "USD", "dollars": "USD", "eur": "EUR", "euro": "EUR",
+    "euros": "EUR", "gbp": "GBP", "pound": "GBP", "pounds": "GBP", "inr": "INR",
+    "rs": "INR", "rs.": "INR", "rupee": "INR", "rupees": "INR",
+}
+_AMOUNT = r"(\d[\d,]*(?:\.\d+)?)\s*(k)?"
+AMOUNT_SYMBOL_RE = re.compile(r"([$€£₹])\s?" + _AMOUNT, re.IGNORECASE)
+AMOUNT_WORD_RE = re.compile(
+    _AMOUNT + r"\s?(usd|dollars?|eur|euros?|gbp|pounds?|inr|rs\.?|rupees?)\b", re.IGNORECASE
+)
+# Rough conversion used only to bucket an amount into a budget type
+USD_PER_UNIT = {"USD": 1.0, "EUR": 1.08, "GBP": 1.27, "INR": 0.012}
+
+BUDGET_KEYWORDS: List[Tuple[str, re.Pattern]] = [
+    ("luxury", re.compile(r"\b(luxury|luxurious|premium|lavish|upscale|5[- ]star|five[- ]star)\b", re.IGNORECASE)),
+    ("economical", re.compile(
+        r"\b(cheap|cheapest|economical|affordable|low[- ]cost|shoestring|backpack\w*|on a budget|budget[- ](?:trip|travel|friendly|hotel|stay))\b",
+        re.IGNORECASE)),
+    ("moderate", re.compile(r"\b(moderate|mid[- ]range|comfortable|standard)\b", re.IGNORECASE)),
+]
+
+INTEREST_KEYWORDS: Dict[str, re.Pattern] = {
+    "cultural": re.compile(r"\b(culture|cultural|museums?|temples?|history|historic|heritage|art)\b", re.IGNORECASE),
+    "food": re.compile(r"\b(food|foodie|cuisine|restaurants?|street food|eat(?:ing)?)\b", re.IGNORECASE),
+    "adventure": re.compile(r"\b(adventure|trek(?:king)?|hik(?:e|ing)|rafting|diving|surf(?:ing)?)\b", re.IGNORECASE),
+    "shopping": re.compile(r"\b(shopping|markets?|malls?)\b", re.IGNORECASE),
+    "nature": re.compile(r"\b(nature|beach(?:es)?|mountains?|parks?|wildlife|lakes?)\b", re.IGNORECASE),
+    "nightlife": re.compile(r"\b(nightlife|clubs?|bars?|party)\b", re.IGNORECASE),
+}
+
+TRANSPORT_KEYWORDS: List[Tuple[str, re.Pattern]] = [
+    ("flight", re.compile(r"\b(fly|flying|flights?|plane)\b", re.IGNORECASE)),
+    ("train", re.compile(r"\b(trains?|rail)\b", re.IGNORECASE)),
+    ("bus", re.compile(r"\b(bus|buses|coach)\b", re.IGNORECASE)),
+    ("car", re.compile(r"\b(car|drive|driving|road trip)\b", re.IGNORECASE)),
+]
+
+ORIGIN_CUE_RE = re.compile(r"\b(from|leaving|departing)\s+(?:the\s+)?$", re.IGNORECASE)
+# "in Lyon", "to Porto", "visit Hoi An": a place name the gazetteer may not know
+PLACE_CUE_RE = re.compile(
+    r"\b(?:[Ii]n|[Tt]o|[Vv]isit(?:ing)?|[Aa]round|[Ee]xplore|[Ee]xploring)\s+"
+    r"([A-Z][\w'-]*(?:\s+[A-Z][\w'-]*)*)"
+)
+# Capitalised words that follow those cues without naming a place
+NON_PLACE_WORDS = {
+    "i", "the", "a", "my", "our", "it", "this", "that", "there", "here",
+    "january", "february", "march", "april", "may", "june", "july", "august",
+    "september", "october", "november", "december", "monday", "tuesday",
+    "wednesday", "thursday", "friday", "saturday", "sunday",
+}
+
+# Contribution of each field to the confidence score
+FIELD_WEIGHTS = {
+    "destination": 0.45,
+    "duration_days": 0.2,
+    "budget_type": 0.15,
+    "travelers": 0.1,
+    "origin": 0.1,
+}
+
+
+class ExtractionResult(BaseModel):
+    """Trip details found by the rules plus how much of the request they cover"""
+    details: Dict[str, Any] = {}
+    confidence: float = 0.0
+    confident: bool = False
+
+
+def _to_number(token: str) -> Optional[int]:
+    token = token.lower()
+    if token.isdigit():
+        return int(token)
+    return NUMBER_WORDS.get(token)
+
+
+def _parse_amount(raw: str, thousands: Optional[str]) -> Optional[float]:
+    try:
+        value = float(raw.replace(",", ""))
+    except ValueError:
+        return None
+    return value * 1000 if thousands else value
+
+
+class TripDetailExtractor:
+    """Rule-and-gazetteer extractor with a confidence score and hit-rate counters"""
+
+    def __init__(self, confidence_threshold: Optional[float] = None):
+        self.confidence_threshold = (
+            confidence_threshold if confidence_threshold is not None
+            else settings.TRIP_EXTRACTOR_CONFIDENCE_THRESHOLD
+        )
+        # lowercase name -> (display name, country)
+        self._gazetteer: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._gazetteer_re: Optional[re.Pattern] = None
+        self.calls = 0
+        self.hits = 0
+        self.add_destinations(BUILTIN_DESTINATIONS.items())
+
+    def add_destinations(self, destinations) -> None:
+        """Add (name, country) pairs to the gazetteer and recompile the matcher"""
+        for name, country in destinations:
+            if name and name.strip():
+                self._gazetteer[name.strip().lower()] = (name.strip(), country)
+        # Longest names first so "new york city" wins over "york"
+        names = sorted(self._gazetteer, key=len, reverse=True)
+        self._gazetteer_re = re.compile(
+            r"\b(" + "|".join(re.escape(n) for n in names) + r")\b", re.IGNORECASE
+        ) if names else None
+
+    async def load_gazetteer(self) -> int:
+        """Load destination names from the cities collection; returns the gazetteer size"""
+        cursor = city_repository.collection.find({}, {"name": 1, "country": 1})
+        destinations = []
+        async for city in cursor:
+            destinations.append((city.get("name"), city.get("country")))
+        self.add_destinations(destinations)
+        logger.info(f"Trip extractor gazetteer loaded with {len(self._gazetteer)} destinations")
+        return len(self._gazetteer)
+
+    def extract(self, message: str) -> ExtractionResult:
+        """Extract trip details from free text without calling the LLM"""
+        details: Dict[str, Any] = {}
+
+        self._extract_places(message, details)
+
+        duration = self._extract_duration(message)
+        if duration:
+            details["duration_days"] = duration
+
+        travelers = self._extract_travelers(message)
+        if travelers:
+            details["travelers"] = travelers
+
+        amount = self._extract_amount(message)
+        if amount:
+            details["budget"], details["currency"] = amount
+
+        budget_type = self._extract_budget_type(message, amount, duration, travelers)
+        if budget_type:
+            details["budget_type"] = budget_type
+
+        interests = [name for name, pattern in INTEREST_KEYWORDS.items() if pattern.search(message)]
+        if interests:
+            details["interests"] = interests
+
+        for mode, pattern in TRANSPORT_KEYWORDS:
+            if pattern.search(message):
+                details["transport_preference"] = mode
+                break
+
+        confidence = min(1.0, sum(w for field, w in FIELD_WEIGHTS.items() if field in details))
+        confident = confidence >= self.confidence_threshold
+
+        self.calls += 1
+        if confident:
+            self.hits += 1
+
+        return ExtractionResult(details=details, confidence=round(confidence, 2), confident=confident)
+
+    def mentions_other_place(self, message: str, current: Optional[str] = None) -> bool:
+        """Whether the message names a place (known or not) other than ``current``"""
+        current = (current or "").strip().lower()
+        for match in PLACE_CUE_RE.finditer(message):
+            name = match.group(1).strip()
+            if name.split()[0].lower() in NON_PLACE_WORDS or name.lower() == current:
+                continue
+            return True
+        return False
+
+    def _extract_places(self, message: str, details: Dict[str, Any]) -> None:
+        if self._gazetteer_re is None:
+            return
+        for match in self._gazetteer_re.finditer(message):
+            name, country = self._gazetteer[match.group(1).lower()]
+            preceding = message[max(0, match.start() - 16):match.start()]
+            if "origin" not in details and ORIGIN_CUE_RE.search(preceding):
+                details["origin"] = name
+            elif "destination" not in details and name != details.get("origin"):
+                details["destination"] = name
+                if country:
+                    details["country"] = country
+
+    def _extract_duration(self, message: str) -> Optional[int]:
+        match = DURATION_RE.search(message)
+        if match:
+            count = _to_number(match.group(1))
+            if count:
+                return count * DURATION_UNIT_DAYS[match.group(2).lower()]
+        if FORTNIGHT_RE.search(message):
+            return 14
+        weekend = WEEKEND_RE.search(message)
+        if weekend:
+            return 3 if weekend.group(1) else 2
+        return None
+
+    def _extract_travelers(self, message: str) -> Optional[int]:
+        match = TRAVELERS_RE.search(message)
+        if match:
+            count = _to_number(match.group(1) or match.group(2))
+            if count:
+                return count
+        if COUPLE_RE.search(message):
+            return 2
+        if SOLO_RE.search(message):
+            return 1
+        return None
+
+    def _extract_amount(self, message: str) -> Optional[Tuple[float, str]]:
+        match = AMOUNT_SYMBOL_RE.search(message)
+        if match:
+            value = _parse_amount(match.group(2), match.group(3))
+            if value:
+                return value, CURRENCY_SYMBOLS[match.group(1)]
+        match = AMOUNT_WORD_RE.search(message)
+        if match:
+            value = _parse_amount(match.group(1), match.group(2))
+            if value:
+                return value, CURRENCY_WORDS[match.group(3).lower()]
+        return None
+
+    def _extract_budget_type(
+        self,
+        message: str,
+        amount: Optional[Tuple[float, str]],
+        duration: Optional[int],
+        travelers: Optional[int]
+    ) -> Optional[str]:
+        for budget_type, pattern in BUDGET_KEYWORDS:
+            if pattern.search(message):
+                return budget_type
+        if amount and duration:
+            value, currency = amount
+            per_person_day = value * USD_PER_UNIT.get(currency, 1.0) / duration / (travelers or 1)
+            if per_person_day < 100:
+                return "economical"
+            return "moderate" if per_person_day < 300 else "luxury"
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.calls, 4) if self.calls else 0.0,
+            "confidence_threshold": self.confidence_threshold,
+            "gazetteer_size": len(self._gazetteer),
+        }
+
+# Create a singleton instance
+trip_detail_extractor = TripDetailExtractor()
+
+# Export for easy import
+__all__ = ['TripDetailExtractor', 'ExtractionResult', 'trip_detail_extractor']
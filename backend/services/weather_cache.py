@@ -0,0 +1,230 @@
+"""
+Daily weather forecasts cached per location cell and date.
+
+Locations are keyed by a geohash cell when coordinates are known and by their normalized
+name otherwise, so every trip to the same city on the same day shares one entry. TTLs
+follow the forecast horizon: today's forecast changes hourly, next week's barely at all.
+Entries sit in a ``TwoTierCache`` (in-process LRU over Redis), and ``get_forecasts``
+calls the provider only for the (location, date) pairs that missed, one request per
+location however many of its dates missed. Dates the provider can't forecast are
+answered from climate normals, which are computed in process and not cached.
+"""
+
+from typing import Dict, Any, List, Optional, Set, Tuple, Iterable
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+import asyncio
+import logging
+
+from ..config import settings
+from .cache_service import TwoTierCache
+from .climate_normals import climate_normals
+from .geo import Location, coords_of, geohash, normalize_location
+from .http_client import http_client
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+OPENWEATHER_URL = "http://api.openweathermap.org/data/2.5"
+
+
+def location_key(location: Location) -> str:
+    coords = coords_of(location)
+    if coords is not None:
+        return f"gh:{geohash(*coords, precision=settings.WEATHER_GEOHASH_PRECISION)}"
+    return f"loc:{normalize_location(str(location))}"
+
+
+def location_label(location: Location) -> str:
+    """Key under which ``get_forecasts`` returns a location's results"""
+    coords = coords_of(location)
+    return f"{coords[0]:.4f},{coords[1]:.4f}" if coords is not None else str(location)
+
+
+def forecast_ttl(day: date, today: Optional[date] = None) -> int:
+    """Cache lifetime for a forecast ``day``, shortest for the days closest to now"""
+    ahead = (day - (today or date.today())).days
+    if ahead <= 0:
+        return settings.WEATHER_CACHE_TODAY_TTL_SECONDS
+    if ahead <= 2:
+        return settings.WEATHER_CACHE_NEAR_TTL_SECONDS
+    if ahead <= settings.WEATHER_FORECAST_HORIZON_DAYS:
+        return settings.WEATHER_CACHE_MID_TTL_SECONDS
+    # Past the provider's range (only reached if it returns more days than expected)
+    return settings.WEATHER_CACHE_FAR_TTL_SECONDS
+
+
+def estimate_days(location: Location, days: List[date]) -> List[Dict[str, Any]]:
+    """Expected conditions from climate normals, used without an API key or beyond the forecast range"""
+    expected = climate_normals.expected_many(location, days) if days else []
+    if expected is not None:
+        return expected
+    return [
+        {
+            "date": day.isoformat(),
+            "temperature": None,
+            "temp_min": None,
+            "temp_max": None,
+            "description": "no climate data",
+            "humidity": None,
+            "precipitation_probability": None,
+            "source": "unavailable",
+        }
+        for day in days
+    ]
+
+
+def _daily_summaries(forecast_data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Collapse OpenWeather's 3-hourly forecast list into one summary per date"""
+    by_date: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for item in forecast_data.get("list", []):
+        by_date[item["dt_txt"][:10]].append(item)
+    summaries = {}
+    for iso, items in by_date.items():
+        temps = [item["main"]["temp"] for item in items]
+        descriptions = Counter(item["weather"][0]["description"] for item in items)
+        summaries[iso] = {
+            "date": iso,
+            "temperature": round(sum(temps) / len(temps), 1),
+            "temp_min": min(item["main"].get("temp_min", item["main"]["temp"]) for item in items),
+            "temp_max": max(item["main"].get("temp_max", item["main"]["temp"]) for item in items),
+            "description": descriptions.most_common(1)[0][0],
+            "humidity": round(sum(item["main"]["humidity"] for item in items) / len(items)),
+            "precipitation_probability": max((item.get("pop", 0.0) for item in items), default=0.0),
+            "source": "forecast",
+        }
+    return summaries
+
+
+class WeatherForecastCache:
+    """Per-cell, per-date forecast cache in front of the OpenWeather API"""
+
+    def __init__(self):
+        self.cache = TwoTierCache(
+            "weather",
+            max_entries=settings.WEATHER_CACHE_MAX_ENTRIES,
+            local_ttl=settings.WEATHER_CACHE_LOCAL_TTL_SECONDS,
+            redis_ttl=settings.WEATHER_CACHE_FAR_TTL_SECONDS,
+        )
+        # Concurrent misses for one location share a single provider call
+        self._flights = SingleFlight()
+        self.provider_calls = 0
+
+    @property
+    def _api_key(self) -> Optional[str]:
+        return settings.OPENWEATHER_API_KEY
+
+    def _provider_params(self, location: Location) -> Dict[str, Any]:
+        coords = coords_of(location)
+        params: Dict[str, Any] = {"appid": self._api_key, "units": "metric"}
+        if coords is not None:
+            params.update(lat=coords[0], lon=coords[1])
+        else:
+            params["q"] = str(location)
+        return params
+
+    async def _fetch_daily(self, location: Location) -> Dict[str, Dict[str, Any]]:
+        """All dates the provider forecasts for ``location`` (one request)"""
+        async def fetch() -> Dict[str, Dict[str, Any]]:
+            self.provider_calls += 1
+            data = await http_client.get_json(f"{OPENWEATHER_URL}/forecast", params={
+                **self._provider_params(location), "cnt": 40  # 5 days of 3-hourly entries
+            })
+            return _daily_summaries(data)
+
+        return await self._flights.do(f"weather:{location_key(location)}", fetch)
+
+    async def _load(self, location: Location, days: List[date]) -> Dict[date, Dict[str, Any]]:
+        """Provider forecasts for the missed ``days``, climate-normal estimates for the rest"""
+        horizon = date.today() + timedelta(days=settings.WEATHER_FORECAST_HORIZON_DAYS)
+        in_range = [day for day in days if date.today() <= day <= horizon]
+        daily: Dict[str, Dict[str, Any]] = {}
+        if self._api_key and in_range:
+            try:
+                daily = await self._fetch_daily(location)
+            except Exception as e:
+                logger.warning(f"Weather forecast unavailable for {location_label(location)}: {e}")
+        missing = [day for day in days if day.isoformat() not in daily]
+        forecasts = {day: daily[day.isoformat()] for day in days if day.isoformat() in daily}
+        forecasts.update(zip(missing, estimate_days(location, missing)))
+        return forecasts
+
+    async def get_forecasts(
+        self, locations: Iterable[Location], dates: Iterable[date]
+    ) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """``{location label: {iso date: daily forecast}}`` for every location and date"""
+        locations = list(locations)
+        dates = sorted(set(dates))
+        keys = {
+            (location_label(location), day): f"{location_key(location)}:{day.isoformat()}"
+            for location in locations for day in dates
+        }
+        cached = await self.cache.get_many(list(keys.values()))
+
+        result: Dict[str, Dict[str, Dict[str, Any]]] = {location_label(location): {} for location in locations}
+        # Misses grouped by cell; labels sharing a cell share its cache keys, hence its misses
+        missed: Dict[str, Tuple[Location, Set[date], Set[str]]] = {}
+        for location in locations:
+            label = location_label(location)
+            for day in dates:
+                value = cached.get(keys[(label, day)])
+                if value is not None:
+                    result[label][day.isoformat()] = value
+                else:
+                    entry = missed.setdefault(location_key(location), (location, set(), set()))
+                    entry[1].add(day)
+                    entry[2].add(label)
+
+        if missed:
+            loaded = await asyncio.gather(*(self._load(location, sorted(days)) for location, days, _ in missed.values()))
+            to_cache: Dict[str, Tuple[Any, Optional[int]]] = {}
+            for (cell, (_, _, labels)), forecasts in zip(missed.items(), loaded):
+                for day, forecast in forecasts.items():
+                    for label in labels:
+                        result[label][day.isoformat()] = forecast
+                    # Estimates are computed locally and would only crowd out real forecasts
+                    if forecast.get("source") == "forecast":
+                        to_cache[f"{cell}:{day.isoformat()}"] = (forecast, forecast_ttl(day))
+            await self.cache.set_many(to_cache)
+        return result
+
+    async def get_forecast(self, location: Location, day: date) -> Dict[str, Any]:
+        forecasts = await self.get_forecasts([location], [day])
+        return forecasts[location_label(location)][day.isoformat()]
+
+    async def get_current(self, location: Location) -> Optional[Dict[str, Any]]:
+        """Current conditions (short-lived cache entry), or None without an API key or on error"""
+        if not self._api_key:
+            return None
+
+        async def load() -> Optional[Dict[str, Any]]:
+            self.provider_calls += 1
+            try:
+                data = await http_client.get_json(f"{OPENWEATHER_URL}/weather", params=self._provider_params(location))
+                return {
+                    "temperature": data["main"]["temp"],
+                    "description": data["weather"][0]["description"],
+                    "humidity": data["main"]["humidity"],
+                    "wind_speed": data["wind"]["speed"],
+                    "observed_at": datetime.utcnow().isoformat(timespec="seconds"),
+                }
+            except Exception as e:
+                logger.warning(f"Current weather unavailable for {location_label(location)}: {e}")
+                return None
+
+        return await self.cache.get_or_set(
+            f"{location_key(location)}:current", load,
+            should_cache=lambda value: value is not None, ttl=settings.WEATHER_CACHE_CURRENT_TTL_SECONDS
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.cache.stats(), "provider_calls": self.provider_calls}
+
+
+# Create a singleton instance
+weather_cache = WeatherForecastCache()
+
+__all__ = [
+    'WeatherForecastCache', 'weather_cache', 'geohash', 'normalize_location',
+    'location_key', 'location_label', 'forecast_ttl', 'estimate_days',
+]
@@ -0,0 +1,290 @@
+"""
+Write-behind persistence for chat turns.
+
+A turn's writes (messages appended to the conversation, state fields such as the trip
+plan, and the user's conversation-history entry) are made durable with one Redis
+pipeline: an XADD to this process's stream plus the conversation cache update, so
+reads see them at once (cached reads combine the cached fields and message window with
+the older messages already in Mongo; a message pushed out of the window before its
+write is flushed reappears once it is). The request is then acknowledged, and a background task drains
+the writes from an in-process queue into Mongo, in ``bulk_write`` batches of up to
+``WRITE_BEHIND_BATCH_SIZE`` writes or every ``WRITE_BEHIND_FLUSH_INTERVAL_SECONDS``,
+deleting them from the stream once stored.
+
+Layout:
+- ``wb:{owner}:writes``   stream of one process's unflushed writes
+- ``wb:{owner}:reserved`` message indexes reserved in Mongo for each unflushed stream entry
+- ``wb:{owner}:alive``    heartbeat of that process (expires after ``WRITE_BEHIND_LEASE_SECONDS``)
+- ``wb:owners``           set of processes that have a stream
+
+A process that finds another's stream without a heartbeat replays it. Replayed writes
+may already be in Mongo, so messages and history entries carry ids and are skipped when
+already stored, and messages whose indexes were reserved are written into those same
+slots rather than reserved again.
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+
+from ..config import settings
+from ..db import get_redis
+
+logger = logging.getLogger(__name__)
+
+OWNERS_KEY = "wb:owners"
+
+
+class WriteBehind:
+    """Buffers conversation writes in Redis and flushes them to Mongo in batches"""
+
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.conversations = None  # ConversationRepository, set by start()
+        self.contexts = None  # ContextService, set by start()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_recovery = 0.0
+        self.submitted = 0
+        self.flushed = 0
+        self.batches = 0
+        self.flush_failures = 0
+        self.replayed = 0
+        self.direct_writes = 0  # Written straight to Mongo (not running or Redis unavailable)
+
+    @staticmethod
+    def stream_key(owner: str) -> str:
+        return f"wb:{owner}:writes"
+
+    @staticmethod
+    def reserved_key(owner: str) -> str:
+        return f"wb:{owner}:reserved"
+
+    @staticmethod
+    def heartbeat_key(owner: str) -> str:
+        return f"wb:{owner}:alive"
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, conversations, contexts) -> None:
+        """Start the flusher; ``conversations`` / ``contexts`` apply the writes to Mongo"""
+        self.conversations, self.contexts = conversations, contexts
+        if not settings.WRITE_BEHIND_ENABLED or self.running:
+            return
+        redis = await get_redis()
+        await self._heartbeat()
+        await redis.sadd(OWNERS_KEY, self.owner)
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything still queued, then stop"""
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        pending = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        try:
+            if pending:
+                # The flusher may have been stopped halfway through a batch
+                await self._flush(pending, replay=True)
+            redis = await get_redis()
+            await redis.delete(self.heartbeat_key(self.owner))
+            if not await redis.xlen(self.stream_key(self.owner)):
+                await redis.delete(self.stream_key(self.owner), self.reserved_key(self.owner))
+                await redis.srem(OWNERS_KEY, self.owner)
+        except Exception as e:
+            # Left in the stream; another process replays it once the heartbeat expires
+            logger.warning(f"Write-behind flush on shutdown failed: {e}")
+
+    async def submit(
+        self,
+        conversation_id: str,
+        messages: Optional[List[Dict[str, Any]]] = None,
+        fields: Optional[Dict[str, Any]] = None,
+        history: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Record one turn's writes. Returns once they are durable in Redis.
+
+        ``messages`` are appended to the conversation, ``fields`` set on its state and
+        ``history`` (``ContextService._history_update`` arguments) appended to the user's
+        conversation history.
+        """
+        write_id = uuid.uuid4().hex
+        messages = [{"id": f"{write_id}:{n}", **message} for n, message in enumerate(messages or [])]
+        write: Dict[str, Any] = {"conversation_id": conversation_id, "messages": messages, "fields": fields or {}}
+        if history:
+            write["history"] = {"turn_id": write_id, "timestamp": datetime.utcnow().isoformat(), **history}
+        self.submitted += 1
+
+        if self.running:
+            try:
+                redis = await get_redis()
+                async with redis.pipeline(transaction=True) as pipe:
+                    pipe.xadd(self.stream_key(self.owner), {"write": json.dumps(write, default=str)})
+                    self.conversations.queue_cache_writes(pipe, conversation_id, messages, fields)
+                    results = await pipe.execute()
+                # -1 / 0: the cache was cold, so it must be reloaded once Mongo has the write
+                write["cached"] = all(result not in (-1, 0) for result in results[1:])
+                self._queue.put_nowait((results[0], write))
+                return
+            except Exception as e:
+                logger.warning(f"Write-behind unavailable, writing through: {e}")
+        await self._write_through(write)
+
+    async def _write_through(self, write: Dict[str, Any]) -> None:
+        self.direct_writes += 1
+        for message in write["messages"]:
+            await self.conversations.append_message(write["conversation_id"], message)
+        if write["fields"]:
+            await self.conversations.set_fields(write["conversation_id"], write["fields"])
+        if write.get("history"):
+            try:
+                await self.contexts.apply_history([write["history"]])
+            except Exception as e:
+                logger.error(f"Error updating conversation history: {e}")
+
+    async def _heartbeat(self) -> None:
+        redis = await get_redis()
+        await redis.set(self.heartbeat_key(self.owner), "1", ex=settings.WRITE_BEHIND_LEASE_SECONDS)
+
+    async def _fill(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Wait for a write, then collect more until the batch is full or the interval ends"""
+        try:
+            batch.append(await asyncio.wait_for(self._queue.get(), timeout=settings.WRITE_BEHIND_LEASE_SECONDS / 3))
+        except asyncio.TimeoutError:
+            return
+        deadline = time.monotonic() + settings.WRITE_BEHIND_FLUSH_INTERVAL_SECONDS
+        while len(batch) < settings.WRITE_BEHIND_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+    async def _run(self) -> None:
+        batch: List[Tuple[str, Dict[str, Any]]] = []
+        backoff = settings.WRITE_BEHIND_RETRY_BACKOFF_SECONDS
+        retrying = False
+        while True:
+            try:
+                if retrying:
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, settings.WRITE_BEHIND_RETRY_MAX_BACKOFF_SECONDS)
+                await self._heartbeat()
+                if time.monotonic() - self._last_recovery >= settings.WRITE_BEHIND_RECOVERY_INTERVAL_SECONDS:
+                    self._last_recovery = time.monotonic()
+                    await self.recover_abandoned()
+                if not batch:
+                    await self._fill(batch)
+                if batch:
+                    # A batch that failed before may have been partly applied
+                    await self._flush(batch, replay=retrying)
+                    batch = []
+                retrying = False
+                backoff = settings.WRITE_BEHIND_RETRY_BACKOFF_SECONDS
+            except asyncio.CancelledError:
+                # Hand the unflushed (possibly half-applied) batch back to stop()
+                for item in batch:
+                    self._queue.put_nowait(item)
+                raise
+            except Exception as e:
+                # Keep the batch (still safe in the stream) and retry it
+                self.flush_failures += 1
+                logger.warning(f"Write-behind flush failed, retrying in {backoff:.1f}s: {e}")
+                retrying = True
+
+    async def _flush(self, batch: List[Tuple[str, Dict[str, Any]]], owner: Optional[str] = None, replay: bool = False) -> None:
+        """Apply a batch to Mongo, then drop it from the stream"""
+        owner = owner or self.owner
+        redis = await get_redis()
+        writes = [write for _, write in batch]
+        entry_of = {id(write): entry_id for entry_id, write in batch}
+
+        async def keep_positions(reserved: List[Dict[str, Any]]) -> None:
+            # Survives this process, so a replay elsewhere reuses the indexes instead of reserving more
+            await redis.hset(self.reserved_key(owner), mapping={
+                entry_of[id(write)]: json.dumps(write["positions"]) for write in reserved
+            })
+
+        await self.conversations.apply_writes(writes, replay=replay, on_reserved=keep_positions)
+        history = [write["history"] for write in writes if write.get("history")]
+        if history:
+            await self.contexts.apply_history(history, replay=replay)
+        for conversation_id in {write["conversation_id"] for write in writes if not write.get("cached", False)}:
+            await self.conversations.invalidate(conversation_id)
+        entry_ids = [entry_id for entry_id, _ in batch]
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.xdel(self.stream_key(owner), *entry_ids)
+            pipe.hdel(self.reserved_key(owner), *entry_ids)
+            await pipe.execute()
+        self.batches += 1
+        self.flushed += len(batch)
+
+    async def recover_abandoned(self) -> int:
+        """Replay the streams of processes whose heartbeat expired; returns the writes replayed"""
+        redis = await get_redis()
+        replayed = 0
+        for owner in await redis.smembers(OWNERS_KEY):
+            if owner == self.owner or await redis.exists(self.heartbeat_key(owner)):
+                continue
+            # One process replays a stream; the lock outlives a replay of any sane size
+            lock = f"wb:{owner}:recovering"
+            if not await redis.set(lock, self.owner, nx=True, ex=settings.WRITE_BEHIND_LEASE_SECONDS * 10):
+                continue
+            try:
+                stream = self.stream_key(owner)
+                while True:
+                    entries = await redis.xrange(stream, count=settings.WRITE_BEHIND_BATCH_SIZE)
+                    if not entries:
+                        break
+                    # Replayed writes don't record whether the cache took them, so their
+                    # conversations are reloaded from Mongo afterwards
+                    batch = [(entry_id, json.loads(fields["write"])) for entry_id, fields in entries]
+                    positions = await redis.hmget(self.reserved_key(owner), [entry_id for entry_id, _ in batch])
+                    for (_, write), reserved in zip(batch, positions):
+                        if reserved:
+                            write["positions"] = json.loads(reserved)
+                    await self._flush(batch, owner=owner, replay=True)
+                    replayed += len(batch)
+                await redis.delete(stream, self.reserved_key(owner))
+                await redis.srem(OWNERS_KEY, owner)
+            finally:
+                await redis.delete(lock)
+        if replayed:
+            self.replayed += replayed
+            logger.warning(f"Replayed {replayed} write-behind write(s) of stopped processes")
+        return replayed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "submitted": self.submitted,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "flush_failures": self.flush_failures,
+            "replayed": self.replayed,
+            "direct_writes": self.direct_writes,
+        }
+
+
+# Create a singleton instance
+write_behind = WriteBehind()
+
+__all__ = ['WriteBehind', 'write_behind']
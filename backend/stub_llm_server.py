@@ -0,0 +1,100 @@
+"""
+Stub LLM server for load and latency testing without Gemini quota.
+
+Serves StubProvider replies over HTTP so the fake backend runs in its own process:
+
+    python -m backend.stub_llm_server --port 8900 --latency-ms 800 --error-rate 0.02
+
+then start the API with LLM_PROVIDER=stub_http (and LLM_STUB_URL if not the default).
+"""
+
+from typing import Dict, Any, List, Optional
+import argparse
+import json
+import logging
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from backend.services.llm_provider import StubProvider, StubLLMError
+
+logger = logging.getLogger(__name__)
+
+
+class GenerateRequest(BaseModel):
+    contents: List[Dict[str, Any]]
+    stream: bool = False
+
+
+def create_app(provider: Optional[StubProvider] = None) -> FastAPI:
+    """Build the stub server around ``provider`` (defaults to settings-driven StubProvider)"""
+    stub = provider or StubProvider()
+    app = FastAPI(title="GlobeTrotter stub LLM")
+    stats = {"requests": 0, "errors": 0}
+
+    @app.get("/health")
+    async def health():
+        return {
+            "status": "healthy",
+            "latency_distribution": stub.latency_distribution,
+            "latency_ms": stub.latency_ms,
+            "error_rate": stub.error_rate,
+            **stats,
+        }
+
+    @app.post("/generate")
+    async def generate(request: GenerateRequest):
+        stats["requests"] += 1
+        if not request.stream:
+            try:
+                return {"text": await stub.generate(request.contents)}
+            except StubLLMError as e:
+                stats["errors"] += 1
+                raise HTTPException(status_code=503, detail=str(e))
+
+        # Newline-delimited JSON chunks; an injected failure happens before the first byte
+        chunks = stub.stream(request.contents)
+        try:
+            first = await anext(chunks)
+        except StubLLMError as e:
+            stats["errors"] += 1
+            raise HTTPException(status_code=503, detail=str(e))
+
+        async def body():
+            yield json.dumps({"text": first}) + "\n"
+            async for chunk in chunks:
+                yield json.dumps({"text": chunk}) + "\n"
+
+        return StreamingResponse(body(), media_type="application/x-ndjson")
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the stub LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-distribution", choices=["fixed", "uniform", "lognormal"])
+    parser.add_argument("--latency-ms", type=float)
+    parser.add_argument("--latency-sigma", type=float)
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--stream-chunk-delay-ms", type=float)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    provider = StubProvider(
+        latency_distribution=args.latency_distribution,
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        stream_chunk_delay_ms=args.stream_chunk_delay_ms,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(provider), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
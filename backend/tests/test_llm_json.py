@@ -0,0 +1,113 @@
+from datetime import date
+
+import pytest
+
+from backend.services.llm_json import (
+    JSONStreamParser,
+    coerce_activity,
+    coerce_day,
+    extract_json,
+    is_activity_path,
+    is_day_path,
+    loads_lenient,
+    normalize_time,
+)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('```json\n{"a": 1, "b": [1, 2,],}\n```', {"a": 1, "b": [1, 2]}),
+    ("{'name': 'Tokyo', ok: True, x: None}", {"name": "Tokyo", "ok": True, "x": None}),
+    ('Sure! Here it is: {"a": "line1\nline2"} hope it helps', {"a": "line1\nline2"}),
+    ('{"a": 1 "b": 2}', {"a": 1, "b": 2}),
+    ('{"a": "x" // comment\n, "b": 2}', {"a": "x", "b": 2}),
+    ('{"n": -3.5e2}', {"n": -350.0}),
+    ('{"a": 1.}', {"a": 1}),
+    ('{"a": 1., "b": 2}', {"a": 1, "b": 2}),
+    ('[1, 2.', [1, 2]),
+    ('[1.e3, 1e+]', [1000.0, 1]),
+    ('{"a": -', {"a": 0}),
+    ('{"a": [1, 2', {"a": [1, 2]}),
+    ('{"a":', {"a": None}),
+    ('{"a": "abc', {"a": "abc"}),
+    ('{"days": [{"day_number": 1, "activities": [{"name": "A"}, {"name": "B"',
+     {"days": [{"day_number": 1, "activities": [{"name": "A"}, {"name": "B"}]}]}),
+])
+def test_loads_lenient_repairs_llm_output(text, expected):
+    assert loads_lenient(text) == expected
+
+
+def test_extract_json_rejects_error_replies():
+    with pytest.raises(ValueError):
+        extract_json("Error generating response: timeout")
+    with pytest.raises(ValueError):
+        extract_json("no json here")
+
+
+def test_normalize_time_defaults_by_position():
+    assert normalize_time("9:05 am", 0) == "09:05"
+    assert normalize_time("25:00", 0) == normalize_time(None, 0)
+
+
+@pytest.mark.parametrize("coords", [
+    {"lat": 35.6, "lng": 139.7},
+    {"latitude": 35.6, "longitude": 139.7},
+    [35.6, 139.7],
+    "35.6, 139.7",
+])
+def test_coerce_activity_accepts_coordinate_shapes(coords):
+    activity = coerce_activity({"name": "Senso-ji", "coordinates": coords}, "a1", 0)
+    assert activity.place_coords == {"lat": 35.6, "lng": 139.7}
+
+
+@pytest.mark.parametrize("coords", [[1, 2, 3], "somewhere", 42, None])
+def test_coerce_activity_ignores_unusable_coordinates(coords):
+    activity = coerce_activity({"name": "Senso-ji", "place_coords": coords, "cost": "$1,200"}, "a1", 0)
+    assert activity.place_coords == {"lat": 0.0, "lng": 0.0}
+    assert activity.estimated_cost == 1200.0
+
+
+@pytest.mark.parametrize("item", ["text", {"description": "no name"}, {"name": "A", "cost": [1]}])
+def test_coerce_activity_raises_value_error_when_unusable(item):
+    with pytest.raises(ValueError):
+        coerce_activity(item, "a1", 0)
+
+
+def test_coerce_day_skips_malformed_activities():
+    day = coerce_day(
+        {
+            "day": 2,
+            "date": "2026-05-02",
+            "activities": [
+                {"name": "Late", "time": "18:00", "cost": 10},
+                {"name": "Odd", "coordinates": [35.6, 139.7], "time": "09:00"},
+                {"description": "no name"},
+            ],
+        },
+        1,
+        date(2026, 5, 1),
+    )
+    assert day.day_number == 2
+    assert day.date == date(2026, 5, 2)
+    assert [a.name for a in day.activities] == ["Odd", "Late"]
+    assert day.daily_budget_total == 10
+
+
+def test_stream_parser_reports_closed_objects():
+    doc = ('{"days": [{"day_number": 1, "activities": [{"name": "A"}, {"name": "B"}]}, '
+           '{"day_number": 2, "activities": [{"name": "C"}]}]}')
+    parser = JSONStreamParser()
+    completed = []
+    for i in range(0, len(doc), 7):
+        completed.extend(parser.feed(doc[i:i + 7]))
+
+    activities = [value["name"] for path, value in completed if is_activity_path(path)]
+    days = [value["day_number"] for path, value in completed if is_day_path(path)]
+    assert activities == ["A", "B", "C"]
+    assert days == [1, 2]
+    assert parser.finish()["days"][1]["activities"] == [{"name": "C"}]
+
+
+def test_stream_parser_finish_repairs_truncated_document():
+    parser = JSONStreamParser()
+    parser.feed('{"days": [{"day_number": 1, "activities": [{"name": "A", "cost": 1.')
+    assert parser.finish() == {"days": [{"day_number": 1, "activities": [{"name": "A", "cost": 1}]}]}
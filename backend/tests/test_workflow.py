@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+from backend.config import settings
+from backend.services.circuit_breaker import gemini_breaker
+
+
+@pytest.fixture
+def workflow(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_PROVIDER", "stub")
+    monkeypatch.setattr(settings, "LLM_STUB_LATENCY_MS", 1.0)
+    monkeypatch.setattr(settings, "LLM_STUB_STREAM_CHUNK_DELAY_MS", 0.0)
+    monkeypatch.setattr(settings, "LLM_STUB_ERROR_RATE", 0.0)
+    gemini_breaker._close()
+    from backend.agent.workflow import TravelPlanningWorkflow
+    return TravelPlanningWorkflow()
+
+
+def test_process_message_uses_llm_with_empty_chat_pool(workflow):
+    assert workflow.llm_available
+    assert len(workflow.chat_pool) == 0
+
+    response = asyncio.run(workflow.process_message("hello", "user-1", "session-1", {}, plan_trip=False))
+
+    assert "demo mode" not in response.message
+    assert len(workflow.chat_pool) == 1
+
+
+
+def test_stream_message_streams_llm_tokens(workflow):
+    async def collect():
+        return [event async for event in workflow.stream_message("hello", "user-1", "session-2", {}, plan_trip=False)]
+
+    events = asyncio.run(collect())
+
+    tokens = [payload for kind, payload in events if kind == "token"]
+    assert events[-1][0] == "done"
+    assert tokens and "demo mode" not in "".join(tokens)
@@ -0,0 +1,160 @@
+"""
+Background worker for the Redis job queue.
+
+    python -m backend.worker
+
+Claims jobs from ``jobs:pending``, runs the handler for the job's kind, reports partial
+results and retries failures with backoff. Several jobs run concurrently per process
+(JOB_WORKER_CONCURRENCY); run more processes to scale out.
+"""
+
+from typing import Dict, Any, Callable, Awaitable
+import asyncio
+import logging
+import signal
+
+from fastapi.encoders import jsonable_encoder
+
+from backend.config import settings
+from backend.repositories import repository_registry
+from backend.services.job_queue import job_queue
+from backend.services.http_client import http_client
+from backend.services.climate_normals import climate_normals
+from backend.services.route_matrix import route_matrix
+
+logger = logging.getLogger(__name__)
+
+# Reports a partial result for the running job
+Reporter = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+async def run_itinerary_job(payload: Dict[str, Any], report: Reporter, job_id: str) -> Dict[str, Any]:
+    """Same work as POST /generate-itinerary"""
+    from backend.services.gemini_service import ItineraryGenerator
+
+    result = await ItineraryGenerator().generate_itinerary(payload)
+    if result.get("status") != "success":
+        raise RuntimeError(result.get("message", "Itinerary generation failed"))
+    return result
+
+
+async def run_trip_plan_job(payload: Dict[str, Any], report: Reporter, job_id: str) -> Dict[str, Any]:
+    """Itinerary branch of /api/chat; attaches the plan to the conversation when given.
+
+    The job id is the graph engine's thread id, so a retried job resumes its graph run.
+    """
+    from backend.agent.workflow import travel_agent
+
+    conversation_id = payload.get("conversation_id")
+    repo = repository_registry.conversations if conversation_id else None
+    previous_state = (await repo.get_fields(conversation_id) or {}) if repo else {}
+
+    trip_plan, itinerary_state = await travel_agent._plan_trip(
+        payload["message"], payload.get("preferences") or {},
+        on_progress=report, previous_state=previous_state, user_id=payload.get("user_id"),
+        thread_id=f"job:{job_id}"
+    )
+    plan = jsonable_encoder(trip_plan)
+
+    if repo is not None:
+        await repo.set_fields(conversation_id, {
+            "trip_plan": plan,
+            "itinerary_state": jsonable_encoder(itinerary_state),
+        })
+    return {"trip_plan": plan}
+
+
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any], Reporter, str], Awaitable[Any]]] = {
+    "itinerary": run_itinerary_job,
+    "trip_plan": run_trip_plan_job,
+}
+
+
+async def _keep_lease(job_id: str) -> None:
+    while True:
+        await asyncio.sleep(settings.JOB_LEASE_SECONDS / 3)
+        await job_queue.heartbeat(job_id)
+
+
+async def process_job(job: Dict[str, Any]) -> None:
+    job_id = job["id"]
+    handler = JOB_HANDLERS.get(job["kind"])
+    if handler is None:
+        await job_queue.fail(job_id, f"Unknown job kind '{job['kind']}'")
+        return
+
+    async def report(partial: Dict[str, Any]) -> None:
+        await job_queue.report_partial(job_id, jsonable_encoder(partial))
+
+    lease = asyncio.create_task(_keep_lease(job_id))
+    try:
+        result = await asyncio.wait_for(handler(job["payload"] or {}, report, job_id), timeout=settings.JOB_TIMEOUT_SECONDS)
+        await job_queue.complete(job_id, jsonable_encoder(result))
+        logger.info(f"Job {job_id} ({job['kind']}) succeeded")
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+        retrying = await job_queue.fail(job_id, error)
+        logger.warning(f"Job {job_id} ({job['kind']}) failed on attempt {job['attempts']}: {error}"
+                       f"{' - retrying' if retrying else ''}")
+    finally:
+        lease.cancel()
+
+
+async def worker_loop(stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        try:
+            job = await job_queue.claim(timeout=2)
+        except Exception as e:
+            logger.error(f"Failed to claim job: {e}")
+            await asyncio.sleep(1)
+            continue
+        if job is not None:
+            await process_job(job)
+
+
+async def recovery_loop(stop: asyncio.Event) -> None:
+    """Requeue jobs left behind by workers that died mid-run"""
+    while not stop.is_set():
+        try:
+            await job_queue.recover_abandoned()
+        except Exception as e:
+            logger.error(f"Failed to recover abandoned jobs: {e}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.JOB_LEASE_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def main() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    await repository_registry.startup()
+    try:
+        await climate_normals.load_from_db()
+    except Exception as e:
+        logger.warning(f"Failed to load climate normals: {e}")
+    try:
+        await route_matrix.load_from_db()
+    except Exception as e:
+        logger.warning(f"Failed to load route matrix coordinates: {e}")
+
+    concurrency = max(1, settings.JOB_WORKER_CONCURRENCY)
+    logger.info(f"Job worker started with concurrency {concurrency}")
+    try:
+        # In-flight jobs finish before the loops exit
+        await asyncio.gather(recovery_loop(stop), *(worker_loop(stop) for _ in range(concurrency)))
+    finally:
+        await http_client.close()
+        await repository_registry.shutdown()
+        logger.info("Job worker stopped")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())